@@ -1,12 +1,85 @@
 """
 Image attack functions for watermark robustness testing.
 Each function applies a specific transformation and returns the modified image.
+AttackEngine applies lists of attacks to stacks of images, running the
+element-wise ones (noise, brightness) over the whole stack in one call, and
+runs chains of attacks ("resize:0.25>jpeg:0.5") computing every shared
+prefix only once.
 """
 
+import threading
+
 import cv2
 import numpy as np
-from PIL import Image
-import io
+
+
+# Attack types understood by ImageAttacks.apply_attack
+ATTACK_TYPES = ('jpeg', 'resize', 'crop', 'blur', 'noise', 'rotate', 'brightness', 'format')
+
+# Attacks that treat every pixel independently, so a whole stack of
+# same-size images goes through in a single call
+_ELEMENTWISE_ATTACKS = ('noise', 'brightness')
+
+# Separates the steps of an attack chain spec, e.g. "resize:0.25>jpeg:0.5"
+CHAIN_SEPARATOR = '>'
+
+# Unseeded generator for callers that don't pass their own
+_rng = np.random.default_rng()
+
+
+def _jpeg_roundtrip(image_array, quality):
+    """Encode to JPEG and decode again with OpenCV (BGR in, BGR out)."""
+    ok, buffer = cv2.imencode('.jpg', image_array, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+    if not ok:
+        raise ValueError("JPEG encoding failed")
+    return cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+
+
+def parse_chain(spec):
+    """
+    Parse an attack chain spec into its steps.
+    
+    Args:
+        spec: "type:severity" steps joined by '>', applied left to right,
+            e.g. "crop:0.3>blur:0.33>jpeg:0.3"
+    
+    Returns:
+        Tuple of (type, severity) pairs
+    
+    Raises:
+        ValueError: On an unknown type or a severity outside 0.0-1.0
+    """
+    steps = []
+    for step in spec.split(CHAIN_SEPARATOR):
+        attack_type, _, severity = step.strip().partition(':')
+        attack_type = attack_type.strip().lower()
+        if attack_type not in ATTACK_TYPES:
+            raise ValueError(f"Unknown attack type: {attack_type}")
+        try:
+            severity = float(severity)
+        except ValueError:
+            raise ValueError(f"Invalid severity in attack spec: {step.strip()}")
+        if not 0.0 <= severity <= 1.0:
+            raise ValueError(f"Severity must be between 0.0 and 1.0: {step.strip()}")
+        steps.append((attack_type, severity))
+    return tuple(steps)
+
+
+def format_chain(steps):
+    """Canonical spec for chain steps (inverse of parse_chain)."""
+    return CHAIN_SEPARATOR.join(f"{attack_type}:{severity:g}" for attack_type, severity in steps)
+
+
+def attack_steps(attack):
+    """The (type, severity) steps of an attack config: its 'chain', or the single attack."""
+    if attack.get('chain'):
+        return parse_chain(attack['chain'])
+    return ((attack['type'], attack['severity']),)
+
+
+def count_chain_nodes(chains):
+    """Attack steps needed to run chains with shared prefixes (unique non-empty prefixes)."""
+    return len({tuple(steps[:depth]) for steps in chains for depth in range(1, len(steps) + 1)})
 
 
 class ImageAttacks:
@@ -24,18 +97,7 @@ class ImageAttacks:
         Returns:
             Compressed image as numpy array
         """
-        # Convert BGR to RGB for PIL
-        pil_img = Image.fromarray(cv2.cvtColor(image_array, cv2.COLOR_BGR2RGB))
-        
-        # Save and reload as JPEG with specified quality
-        buffer = io.BytesIO()
-        pil_img.save(buffer, format='JPEG', quality=quality)
-        buffer.seek(0)
-        
-        result = Image.open(buffer).convert('RGB')
-        result_array = cv2.cvtColor(np.array(result), cv2.COLOR_RGB2BGR)
-        
-        return result_array
+        return _jpeg_roundtrip(image_array, quality)
     
     @staticmethod
     def resize(image_array, scale):
@@ -103,21 +165,25 @@ class ImageAttacks:
         return cv2.GaussianBlur(image_array, (kernel_size, kernel_size), sigma)
     
     @staticmethod
-    def gaussian_noise(image_array, std_dev):
+    def gaussian_noise(image_array, std_dev, rng=None):
         """
         Add Gaussian noise.
         
         Args:
-            image_array: numpy array (0-255, uint8)
+            image_array: numpy array (0-255, uint8), or a stack of them
             std_dev: noise standard deviation (0-50, typically 5-20)
+            rng: np.random.Generator to draw from (default: module generator)
         
         Returns:
             Noisy image
         """
-        noise = np.random.normal(0, std_dev, image_array.shape)
-        noisy = np.clip(image_array.astype(np.float32) + noise, 0, 255).astype(np.uint8)
+        # float32 noise, then shifted and clipped in place: one buffer
+        noisy = (rng or _rng).standard_normal(image_array.shape, dtype=np.float32)
+        noisy *= np.float32(std_dev)
+        noisy += image_array
+        np.clip(noisy, 0, 255, out=noisy)
         
-        return noisy
+        return noisy.astype(np.uint8)
     
     @staticmethod
     def rotate(image_array, angle):
@@ -145,18 +211,19 @@ class ImageAttacks:
         Adjust brightness and contrast.
         
         Args:
-            image_array: numpy array (0-255)
+            image_array: numpy array (0-255, uint8), or a stack of them
             brightness_delta: brightness shift (-50 to 50)
             contrast_factor: contrast multiplier (0.5 to 1.5)
         
         Returns:
             Adjusted image
         """
-        adjusted = cv2.convertScaleAbs(image_array.astype(np.float32), 
-                                       alpha=contrast_factor, 
-                                       beta=brightness_delta)
+        # Works on uint8 directly and saturates to 0-255; OpenCV takes at
+        # most 3 dimensions, so a stack is viewed as one tall image
+        rows = image_array.reshape((-1,) + image_array.shape[-2:])
+        adjusted = cv2.convertScaleAbs(rows, alpha=contrast_factor, beta=brightness_delta)
         
-        return np.clip(adjusted, 0, 255).astype(np.uint8)
+        return adjusted.reshape(image_array.shape)
     
     @staticmethod
     def png_to_jpeg_to_png(image_array, quality=90):
@@ -171,26 +238,19 @@ class ImageAttacks:
             Result after format conversion roundtrip
         """
         # Convert to JPEG and back (simulates what would happen if saved as JPEG)
-        pil_img = Image.fromarray(cv2.cvtColor(image_array, cv2.COLOR_BGR2RGB))
-        
-        buffer = io.BytesIO()
-        pil_img.save(buffer, format='JPEG', quality=quality)
-        buffer.seek(0)
-        
-        result = Image.open(buffer).convert('RGB')
-        result_array = cv2.cvtColor(np.array(result), cv2.COLOR_RGB2BGR)
-        
-        return result_array
+        return _jpeg_roundtrip(image_array, quality)
     
     @staticmethod
-    def apply_attack(image_array, attack_type, severity):
+    def apply_attack(image_array, attack_type, severity, rng=None):
         """
         Apply a specific attack based on type and severity.
         
         Args:
-            image_array: numpy array (0-255, uint8)
+            image_array: numpy array (0-255, uint8); 'noise' and 'brightness'
+                also take a stack of same-size images
             attack_type: str - one of: 'jpeg', 'resize', 'crop', 'blur', 'noise', 'rotate', 'brightness', 'format'
             severity: float - 0.0 to 1.0, where 0.0 is minimal and 1.0 is maximum
+            rng: np.random.Generator for 'noise' (default: module generator)
         
         Returns:
             Attacked image as numpy array
@@ -223,7 +283,7 @@ class ImageAttacks:
             # severity 0.0 = std 0, severity 1.0 = std 30
             std_dev = severity * 30.0
             std_dev = max(0.0, min(50.0, std_dev))
-            return ImageAttacks.gaussian_noise(image_array, std_dev)
+            return ImageAttacks.gaussian_noise(image_array, std_dev, rng)
         
         elif attack_type == 'rotate':
             # severity 0.0 = 0°, severity 1.0 = ±15°
@@ -246,14 +306,135 @@ class ImageAttacks:
             raise ValueError(f"Unknown attack type: {attack_type}")
 
 
-def get_predefined_attacks():
+class AttackEngine:
+    """
+    Apply (type, severity) attacks to stacks of images.
+    
+    Element-wise attacks run once over the whole (N, H, W, 3) stack; the
+    others run image by image into a preallocated output stack. Noise is
+    drawn from the engine's own seeded generator, so with a seed the same
+    sequence of calls gives the same results. apply_chains gives every
+    group of chains its own child generator, so that holds with an executor
+    too. Calls from several threads at once (e.g. a shared engine serving
+    concurrent requests) draw in scheduling order and are not reproducible.
+    """
+    
+    def __init__(self, seed=None):
+        self._seed_seq = np.random.SeedSequence(seed)
+        self._spawn_lock = threading.Lock()
+        self.rng = np.random.default_rng(self._seed_seq)
+    
+    def attack(self, images, attack_type, severity):
+        """
+        Apply one attack to every image.
+        
+        Args:
+            images: (N, H, W, 3) uint8 stack, or a list of images of any sizes
+            attack_type: One of ATTACK_TYPES
+            severity: 0.0 to 1.0 (see ImageAttacks.apply_attack)
+        
+        Returns:
+            Attacked images in the same layout (stack in, stack out)
+        """
+        return self._attack(images, attack_type, severity, self.rng)
+    
+    @staticmethod
+    def _attack(images, attack_type, severity, rng):
+        if attack_type not in ATTACK_TYPES:
+            raise ValueError(f"Unknown attack type: {attack_type}")
+        if not isinstance(images, np.ndarray):
+            return [ImageAttacks.apply_attack(image, attack_type, severity, rng) for image in images]
+        if attack_type in _ELEMENTWISE_ATTACKS:
+            return ImageAttacks.apply_attack(images, attack_type, severity, rng)
+        
+        # Every attack keeps the image size
+        attacked = np.empty_like(images)
+        for i, image in enumerate(images):
+            attacked[i] = ImageAttacks.apply_attack(image, attack_type, severity, rng)
+        return attacked
+    
+    def apply(self, images, attacks):
+        """
+        Apply several attacks, each to every image.
+        
+        Args:
+            images: (N, H, W, 3) uint8 stack, or a list of images
+            attacks: Iterable of (type, severity) pairs
+        
+        Returns:
+            List with the attacked images for each attack (see attack)
+        """
+        return [self.attack(images, attack_type, severity) for attack_type, severity in attacks]
+    
+    def apply_chains(self, images, chains, executor=None):
+        """
+        Apply attack chains, computing each shared prefix once.
+        
+        Chains are walked in sorted order, keeping only the results along
+        the current path: the output of "resize:0.5" is computed once and
+        reused by every chain that starts with it, and memory stays at one
+        set of images per chain step. So a combinatorial matrix of chains
+        costs count_chain_nodes(chains) attack steps, not chains x depth.
+        
+        Args:
+            images: (N, H, W, 3) uint8 stack, or a list of images
+            chains: List of step tuples (see parse_chain)
+            executor: Optional executor; chains with different first steps
+                then run in parallel
+        
+        Returns:
+            List with the attacked images for each chain (see attack), in
+            the order of chains; an empty chain returns the images as is
+        """
+        chains = [tuple(steps) for steps in chains]
+        groups = {}
+        for index, steps in enumerate(chains):
+            groups.setdefault(steps[:1], []).append(index)
+        
+        # One child generator per group, assigned in chain order, so noise
+        # doesn't depend on which thread runs which group first
+        with self._spawn_lock:
+            children = self._seed_seq.spawn(len(groups))
+        
+        def run_group(indices, seed_seq):
+            rng = np.random.default_rng(seed_seq)
+            results = {}
+            path = []  # (step, images after it) along the current prefix
+            for index in sorted(indices, key=lambda i: chains[i]):
+                steps = chains[index]
+                shared = 0
+                while shared < min(len(path), len(steps)) and path[shared][0] == steps[shared]:
+                    shared += 1
+                del path[shared:]
+                for step in steps[shared:]:
+                    source = path[-1][1] if path else images
+                    path.append((step, self._attack(source, *step, rng)))
+                results[index] = path[-1][1] if steps else images
+            return results
+        
+        if executor is None:
+            group_results = map(run_group, groups.values(), children)
+        else:
+            group_results = executor.map(run_group, groups.values(), children)
+        
+        results = {}
+        for group in group_results:
+            results.update(group)
+        return [results[index] for index in range(len(chains))]
+
+
+def get_predefined_attacks(include_chains=False):
     """
     Return a list of predefined attack configurations for the pipeline.
     
+    Args:
+        include_chains: Also return the predefined attack chains
+    
     Returns:
-        List of dicts with 'name', 'type', 'severity' keys
+        List of dicts with 'name', 'type', 'severity' keys; chains have
+        type 'chain', the highest step severity and a 'chain' spec
     """
-    return [
+    attacks = [
         # JPEG Compression
         {'name': 'JPEG 90', 'type': 'jpeg', 'severity': 0.1},
         {'name': 'JPEG 70', 'type': 'jpeg', 'severity': 0.3},
@@ -290,3 +471,35 @@ def get_predefined_attacks():
         # Format Conversion
         {'name': 'JPEG Roundtrip', 'type': 'format', 'severity': 0.5},
     ]
+    if include_chains:
+        attacks.extend(get_predefined_chains())
+    return attacks
+
+
+def get_predefined_chains():
+    """
+    Return predefined attack chains: common laundering sequences.
+    
+    Their first steps match single predefined attacks, so run together
+    those intermediate images are computed once.
+    
+    Returns:
+        List of dicts with 'name', 'type' ('chain'), 'severity' and 'chain' keys
+    """
+    chains = [
+        ('Resize 50% > JPEG 70', 'resize:0.5>jpeg:0.3'),
+        ('Resize 50% > JPEG 50', 'resize:0.5>jpeg:0.5'),
+        ('Resize 75% > JPEG 50', 'resize:0.25>jpeg:0.5'),
+        ('Crop 85% > Blur (σ=1.0) > JPEG 70', 'crop:0.3>blur:0.33>jpeg:0.3'),
+        ('Crop 85% > JPEG 70', 'crop:0.3>jpeg:0.3'),
+        ('Rotate ±5° > Crop 95% > JPEG 90', 'rotate:0.33>crop:0.1>jpeg:0.1'),
+    ]
+    return [
+        {
+            'name': name,
+            'type': 'chain',
+            'severity': max(severity for _, severity in parse_chain(spec)),
+            'chain': spec
+        }
+        for name, spec in chains
+    ]
@@ -0,0 +1,194 @@
+"""
+Micro-batching scheduler for StegaStamp inference.
+Concurrent requests are collected for a short window and run as a single
+batched session call; each caller receives its own slice of the output.
+With several inference functions (one per session), each gets its own worker
+pulling batches from the shared queue. Each worker copies its batch into a
+preallocated buffer that is reused for every batch it runs.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from .metrics import BATCH_SIZE
+
+
+class QueueFullError(RuntimeError):
+    """Raised when the batching queue is at capacity and cannot accept more work."""
+
+
+class MicroBatcher:
+    """Collect single-image requests into batches for one inference function."""
+
+    def __init__(self, run_batch, max_batch_size=8, window_ms=10.0, max_queue_depth=64, name="batcher"):
+        """
+        Start a background worker that batches submitted items.
+
+        Args:
+            run_batch: Callable taking a stacked (N, ...) array and returning an (N, ...) array,
+                or a list of such callables to run one worker per callable
+            max_batch_size: Maximum number of items per batch
+            window_ms: How long to wait for more items after the first one arrives
+            max_queue_depth: Maximum number of pending items before submit() rejects
+            name: Name used for the worker threads and in stats
+        """
+        self.run_batches = list(run_batch) if isinstance(run_batch, (list, tuple)) else [run_batch]
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.window = max(0.0, float(window_ms)) / 1000.0
+        self.name = name
+        self._queue = queue.Queue(maxsize=max(1, int(max_queue_depth)))
+        self._lock = threading.Lock()
+        self._stats = {
+            'batches': 0,
+            'items': 0,
+            'rejected': 0,
+            'errors': 0,
+            'queue_wait_total_ms': 0.0,
+            'queue_wait_max_ms': 0.0,
+            'batch_sizes': {},
+            'worker_batches': [0] * len(self.run_batches),
+        }
+        # Per-worker batch buffers, allocated on the first batch
+        self._buffers = [None] * len(self.run_batches)
+        self._closed = False
+        self._threads = [
+            threading.Thread(target=self._worker, args=(index,), name=f"{name}-{index}", daemon=True)
+            for index in range(len(self.run_batches))
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, item):
+        """
+        Queue one item for batched inference.
+
+        Returns:
+            concurrent.futures.Future resolving to this item's slice of the batch output
+        """
+        if self._closed:
+            raise RuntimeError(f"{self.name} is closed")
+        future = Future()
+        try:
+            self._queue.put_nowait((item, future, time.perf_counter()))
+        except queue.Full:
+            with self._lock:
+                self._stats['rejected'] += 1
+            raise QueueFullError(f"{self.name} queue is full ({self._queue.maxsize} pending)")
+        return future
+
+    def __call__(self, item):
+        """Submit an item and block until its result is ready."""
+        return self.submit(item).result()
+
+    def _collect(self):
+        """Block for the first item, then gather more until the window closes or the batch is full."""
+        first = self._queue.get()
+        if first is None:
+            return [], True
+        pending = [first]
+        deadline = time.perf_counter() + self.window
+        while len(pending) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                entry = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is None:
+                return pending, True
+            pending.append(entry)
+        return pending, False
+
+    def _worker(self, index):
+        while True:
+            pending, stop = self._collect()
+            if pending:
+                self._run(index, pending)
+            if stop:
+                return
+
+    def _run(self, index, pending):
+        """Run one batch and resolve each caller's future with its slice."""
+        started = time.perf_counter()
+        waits = [(started - enqueued) * 1000.0 for _, _, enqueued in pending]
+        with self._lock:
+            size = len(pending)
+            self._stats['batches'] += 1
+            self._stats['worker_batches'][index] += 1
+            self._stats['items'] += size
+            self._stats['batch_sizes'][size] = self._stats['batch_sizes'].get(size, 0) + 1
+            self._stats['queue_wait_total_ms'] += sum(waits)
+            self._stats['queue_wait_max_ms'] = max(self._stats['queue_wait_max_ms'], max(waits))
+        BATCH_SIZE.observe(size, batcher=self.name)
+
+        try:
+            outputs = self.run_batches[index](self._stack(index, [item for item, _, _ in pending]))
+        except Exception as e:
+            with self._lock:
+                self._stats['errors'] += 1
+            for _, future, _ in pending:
+                future.set_exception(e)
+            return
+
+        for i, (_, future, _) in enumerate(pending):
+            future.set_result(outputs[i])
+
+    def _stack(self, index, items):
+        """
+        Copy items into the worker's reusable (max_batch_size, ...) buffer.
+
+        The returned view is only valid until the worker's next batch; the
+        run_batch callables consume it before returning. Items that are not
+        same-shaped arrays fall back to np.stack.
+        """
+        first = items[0]
+        if not isinstance(first, np.ndarray) or any(
+            not isinstance(item, np.ndarray) or item.shape != first.shape or item.dtype != first.dtype
+            for item in items
+        ):
+            return np.stack(items)
+
+        buffer = self._buffers[index]
+        if buffer is None or buffer.shape[1:] != first.shape or buffer.dtype != first.dtype:
+            buffer = np.empty((self.max_batch_size,) + first.shape, dtype=first.dtype)
+            self._buffers[index] = buffer
+        for i, item in enumerate(items):
+            buffer[i] = item
+        return buffer[:len(items)]
+
+    def stats(self):
+        """Return a snapshot of batch fill and queue wait metrics."""
+        with self._lock:
+            batches = self._stats['batches']
+            items = self._stats['items']
+            return {
+                'name': self.name,
+                'workers': len(self.run_batches),
+                'max_batch_size': self.max_batch_size,
+                'window_ms': self.window * 1000.0,
+                'queue_depth': self._queue.qsize(),
+                'max_queue_depth': self._queue.maxsize,
+                'batches': batches,
+                'items': items,
+                'rejected': self._stats['rejected'],
+                'errors': self._stats['errors'],
+                'avg_batch_size': items / batches if batches else 0.0,
+                'avg_batch_fill': items / (batches * self.max_batch_size) if batches else 0.0,
+                'avg_queue_wait_ms': self._stats['queue_wait_total_ms'] / items if items else 0.0,
+                'max_queue_wait_ms': self._stats['queue_wait_max_ms'],
+                'batch_sizes': dict(sorted(self._stats['batch_sizes'].items())),
+                'worker_batches': list(self._stats['worker_batches']),
+            }
+
+    def close(self):
+        """Stop the workers after already-queued items are processed."""
+        if not self._closed:
+            self._closed = True
+            # One sentinel per worker; each stops at the first it sees
+            for _ in self._threads:
+                self._queue.put(None)
+            for thread in self._threads:
+                thread.join(timeout=5)
@@ -0,0 +1,677 @@
+"""
+Offline bulk stamping and scanning over directories and tar/zip archives.
+Files are read and decoded in a process pool and fed to the encoder or
+decoder in large batches in this process. Stamping writes its outputs back
+through the pool and records every finished file in a JSON lines manifest;
+scanning appends one row per file to a CSV or Parquet report. Either way
+an interrupted run picks up where it stopped.
+
+TensorFlow is only imported inside stamp_tree and scan_tree, so the pool's
+worker processes can import this module cheaply to run the jobs below.
+"""
+
+import csv
+import io
+import json
+import multiprocessing
+import os
+import tarfile
+import time
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from . import config
+from .images import OUTPUT_FORMATS, decode_image_bytes, encode_output
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.bmp', '.tif', '.tiff')
+
+# Input extension -> output format for --format keep
+_KEEP_FORMATS = {'.png': 'png', '.jpg': 'jpeg', '.jpeg': 'jpeg', '.webp': 'webp'}
+
+# EXIF orientation tag; cv2.imdecode already applies it to the pixels
+_EXIF_ORIENTATION = 0x0112
+
+# Decoder input side, as in StegaStampWrapper._preprocess
+DECODER_SIZE = 400
+
+# Scan report columns and their types; bits_* to pattern_accuracy are the
+# raw decoder statistics (see StegaStampWrapper._bit_stats), empty when
+# no decoder bits were produced (simulation mode)
+REPORT_COLUMNS = (
+    ('name', 'string'),
+    ('width', 'int'),
+    ('height', 'int'),
+    ('detected', 'bool'),
+    ('confidence', 'float'),
+    ('detection_method', 'string'),
+    ('bits_min', 'float'),
+    ('bits_max', 'float'),
+    ('bits_mean', 'float'),
+    ('bits_std', 'float'),
+    ('is_rounded', 'bool'),
+    ('near_zero', 'int'),
+    ('near_one', 'int'),
+    ('cluster_ratio', 'float'),
+    ('pattern_accuracy', 'float'),
+    ('error', 'string'),
+)
+REPORT_FORMATS = ('csv', 'parquet')
+
+
+class StageTimer:
+    """Accumulates seconds and call counts per stage for the end-of-run report."""
+
+    def __init__(self):
+        self.seconds = {}
+        self.counts = {}
+
+    def add(self, stage, seconds, count=1):
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+        self.counts[stage] = self.counts.get(stage, 0) + count
+
+    def report(self):
+        return {
+            stage: {'seconds': self.seconds[stage], 'count': self.counts[stage]}
+            for stage in self.seconds
+        }
+
+
+def is_image_name(name):
+    return os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+
+
+def iter_sources(path, select=None):
+    """
+    Yield (name, source) for every image under a directory or in a tar/zip archive.
+
+    source is a file path for directories (read by the worker) and the
+    member bytes for archives (read here, sequentially). Names are relative
+    paths with forward slashes. Names for which select(name) is false are
+    skipped before anything is read.
+    """
+    def wanted(name):
+        return is_image_name(name) and (select is None or select(name))
+
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for filename in sorted(files):
+                full = os.path.join(root, filename)
+                name = os.path.relpath(full, path).replace(os.sep, '/')
+                if wanted(name):
+                    yield name, full
+    elif zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and wanted(info.filename):
+                    yield info.filename, archive.read(info)
+    elif tarfile.is_tarfile(path):
+        # Stream mode: members are read in order without seeking
+        with tarfile.open(path, 'r|*') as archive:
+            for member in archive:
+                if member.isfile() and wanted(member.name):
+                    yield member.name, archive.extractfile(member).read()
+    else:
+        raise ValueError(f"{path} is not a directory, tar or zip archive")
+
+
+def safe_output_path(output_dir, name, extension=None):
+    """Output path for a source name, refusing names that escape output_dir."""
+    parts = [part for part in name.replace('\\', '/').split('/') if part not in ('', '.')]
+    if not parts or '..' in parts:
+        raise ValueError(f"Unsafe member name: {name}")
+    relative = os.path.join(*parts)
+    if extension:
+        relative = os.path.splitext(relative)[0] + extension
+    return os.path.join(output_dir, relative)
+
+
+def read_manifest(path):
+    """Names already recorded as done in a manifest (missing file: none)."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # a line cut short by an interrupted run
+            if entry.get('status') == 'ok':
+                done.add(entry['name'])
+    return done
+
+
+def _extract_metadata(contents):
+    """EXIF (with orientation reset, as decoding applies it) and ICC profile of an image."""
+    from PIL import Image
+
+    try:
+        with Image.open(io.BytesIO(contents)) as image:
+            exif = image.getexif()
+            if _EXIF_ORIENTATION in exif:
+                exif[_EXIF_ORIENTATION] = 1
+            return {
+                'exif': exif.tobytes() if len(exif) else None,
+                'icc_profile': image.info.get('icc_profile'),
+            }
+    except Exception:
+        return None
+
+
+def decode_job(name, source, keep_metadata=False):
+    """
+    Pool job: read and decode one image.
+
+    Returns:
+        Dict with name, image (BGR array or None), metadata, error and the
+        seconds spent reading and decoding
+    """
+    result = {'name': name, 'image': None, 'metadata': None, 'error': None}
+    start = time.perf_counter()
+    try:
+        if isinstance(source, str):
+            with open(source, 'rb') as f:
+                source = f.read()
+        result['read_seconds'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        result['image'] = decode_image_bytes(source)
+        if result['image'] is None:
+            result['error'] = "Failed to decode image"
+        elif keep_metadata:
+            result['metadata'] = _extract_metadata(source)
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+    result['decode_seconds'] = time.perf_counter() - start
+    return result
+
+
+def _encode_with_metadata(image, output_format, level, metadata):
+    """Encode with Pillow so EXIF and the ICC profile can be carried over."""
+    from PIL import Image
+
+    options = {key: value for key, value in metadata.items() if value}
+    if output_format == 'jpeg':
+        options['quality'] = config.JPEG_QUALITY if level is None else level
+    elif output_format == 'webp':
+        if level is None:
+            options['lossless'] = True
+        else:
+            options['quality'] = level
+    else:
+        options['compress_level'] = config.PNG_COMPRESSION if level is None else level
+
+    buffer = io.BytesIO()
+    Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB)).save(buffer, format=output_format.upper(), **options)
+    return buffer.getvalue()
+
+
+def write_job(path, image, output_format, level=None, metadata=None):
+    """
+    Pool job: encode one stamped image and write it atomically.
+
+    Returns:
+        Dict with the written size, error and seconds spent encoding and writing
+    """
+    start = time.perf_counter()
+    try:
+        if metadata:
+            data = _encode_with_metadata(image, output_format, level, metadata)
+        else:
+            data = encode_output(image, output_format, level)
+        encode_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        partial = f"{path}.partial"
+        with open(partial, 'wb') as f:
+            f.write(data)
+        os.replace(partial, path)
+        return {'bytes': len(data), 'error': None,
+                'encode_seconds': encode_seconds, 'write_seconds': time.perf_counter() - start}
+    except Exception as e:
+        return {'bytes': 0, 'error': f"{type(e).__name__}: {e}",
+                'encode_seconds': time.perf_counter() - start, 'write_seconds': 0.0}
+
+
+def _bounded_map(pool, fn, jobs, window):
+    """Submit jobs to the pool keeping at most `window` in flight; yield results in order."""
+    pending = deque()
+    for job in jobs:
+        pending.append(pool.submit(fn, *job))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def _batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def output_format_for(name, output_format):
+    """Resolve --format (png, webp, jpeg or keep) for one source name."""
+    if output_format == 'keep':
+        return _KEEP_FORMATS.get(os.path.splitext(name)[1].lower(), 'png')
+    return output_format
+
+
+def stamp_tree(source, output_dir, manifest_path=None, workers=None, batch_size=16,
+               strength=0.7, adaptive=False, embed_mode=None, output_format='keep', level=None,
+               keep_metadata=False, log=print):
+    """
+    Stamp every image in a directory or archive into output_dir.
+
+    Args:
+        source: Directory, tar or zip archive
+        output_dir: Where stamped files go (same relative paths)
+        manifest_path: JSON lines manifest (default: output_dir/manifest.jsonl)
+        workers: Decode/encode processes (default: CPU count)
+        batch_size: Images per encoder call
+        strength, adaptive, embed_mode: See StegaStampWrapper.stamp_array
+        output_format: 'png', 'webp', 'jpeg' or 'keep' (same as the input)
+        level: Compression level/quality, see images.encode_output
+        keep_metadata: Carry EXIF and ICC profiles over to the outputs
+        log: Progress callback taking a string
+
+    Returns:
+        Summary dict: counts, wall time, images/sec and per-stage timings
+    """
+    from .stegastamp import get_wrapper
+
+    if output_format != 'keep' and output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format: {output_format}")
+
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = manifest_path or os.path.join(output_dir, 'manifest.jsonl')
+    done = read_manifest(manifest_path)
+    if done:
+        log(f"Resuming: {len(done)} files already done according to {manifest_path}")
+
+    wrapper = get_wrapper()
+    workers = workers or os.cpu_count() or 1
+    timer = StageTimer()
+    counts = {'stamped': 0, 'skipped': 0, 'failed': 0}
+    started = time.perf_counter()
+
+    def not_done(name):
+        if name in done:
+            counts['skipped'] += 1
+            return False
+        return True
+
+    def pending_sources():
+        for name, src in iter_sources(source, select=not_done):
+            yield name, src, keep_metadata
+
+    # Spawned workers: no TensorFlow state is inherited from this process
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool, \
+            open(manifest_path, 'a') as manifest:
+        writes = deque()
+
+        def record(entry):
+            manifest.write(json.dumps(entry) + '\n')
+            manifest.flush()
+            if entry['status'] == 'ok':
+                counts['stamped'] += 1
+            else:
+                counts['failed'] += 1
+
+        def finish_write(name, path, future):
+            result = future.result()
+            timer.add('encode', result['encode_seconds'])
+            timer.add('write', result['write_seconds'])
+            entry = {'name': name, 'output': path, 'bytes': result['bytes'],
+                     'status': 'error' if result['error'] else 'ok'}
+            if result['error']:
+                entry['error'] = result['error']
+            record(entry)
+
+        decoded = _bounded_map(pool, decode_job, pending_sources(), window=max(batch_size, workers) * 2)
+        for batch_number, batch in enumerate(_batches(decoded, batch_size), 1):
+            images = []
+            for item in batch:
+                timer.add('read', item.get('read_seconds', 0.0))
+                timer.add('decode', item['decode_seconds'])
+                if item['error']:
+                    record({'name': item['name'], 'status': 'error', 'error': item['error']})
+                else:
+                    images.append(item)
+            if not images:
+                continue
+
+            start = time.perf_counter()
+            stamped = wrapper.stamp_arrays(
+                [item['image'] for item in images], strength=strength, adaptive=adaptive, embed_mode=embed_mode
+            )
+            timer.add('stamp', time.perf_counter() - start, len(images))
+
+            for item, image in zip(images, stamped):
+                fmt = output_format_for(item['name'], output_format)
+                try:
+                    path = safe_output_path(output_dir, item['name'], OUTPUT_FORMATS[fmt][0])
+                except ValueError as e:
+                    record({'name': item['name'], 'status': 'error', 'error': str(e)})
+                    continue
+                writes.append((item['name'], path, pool.submit(write_job, path, image, fmt, level, item['metadata'])))
+
+            # Keep memory bounded: wait for the oldest writes once too many are queued
+            while len(writes) > max(batch_size, workers) * 2:
+                finish_write(*writes.popleft())
+
+            if batch_number % 10 == 0:
+                processed = counts['stamped'] + counts['failed']
+                log(f"{processed} files, {processed / (time.perf_counter() - started):.1f} images/s")
+
+        while writes:
+            finish_write(*writes.popleft())
+
+    wall = time.perf_counter() - started
+    return {
+        **counts,
+        'seconds': wall,
+        'images_per_second': counts['stamped'] / wall if wall else 0.0,
+        'model_loaded': wrapper.model_loaded,
+        'manifest': manifest_path,
+        'stages': timer.report(),
+    }
+
+
+def parse_shard(text):
+    """Parse a shard spec 'i/N' (0 <= i < N) into (i, N)."""
+    try:
+        index, count = (int(part) for part in text.split('/'))
+    except ValueError:
+        raise ValueError(f"Shard must look like i/N, got {text!r}")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Shard index must be in [0, {count}), got {text!r}")
+    return index, count
+
+
+def in_shard(name, shard):
+    """Whether a file belongs to shard (i, N); stable across machines and listing orders."""
+    index, count = shard
+    return count == 1 or zlib.crc32(name.encode('utf-8')) % count == index
+
+
+def preprocess_job(name, source):
+    """
+    Pool job: read and decode one image and shrink it to the decoder input.
+
+    The resize and RGB conversion match StegaStampWrapper._preprocess. The
+    uint8 result goes back to the parent, which normalizes it into the
+    float32 batch: a quarter of the bytes through the pipe.
+
+    Returns:
+        Dict with name, pixels ((400, 400, 3) uint8 RGB or None), width,
+        height, error and the seconds spent reading, decoding and resizing
+    """
+    result = decode_job(name, source)
+    image = result.pop('image')
+    result.update(pixels=None, width=None, height=None, preprocess_seconds=0.0)
+    if image is not None:
+        start = time.perf_counter()
+        result['height'], result['width'] = image.shape[:2]
+        result['pixels'] = decoder_pixels(image)
+        result['preprocess_seconds'] = time.perf_counter() - start
+    return result
+
+
+def decoder_pixels(image):
+    """BGR image -> (400, 400, 3) uint8 RGB decoder input, before normalization."""
+    resized = cv2.resize(image, (DECODER_SIZE, DECODER_SIZE))
+    return cv2.cvtColor(resized, cv2.COLOR_BGR2RGB)
+
+
+def attack_job(key, image, chains, seed=None):
+    """
+    Pool job: apply attack chains to one image and shrink every result to the decoder input.
+
+    Chains sharing a prefix share its intermediate images (see
+    AttackEngine.apply_chains); an empty chain is the image itself.
+
+    Returns:
+        Dict with key, pixels ((len(chains), 400, 400, 3) uint8 RGB) and the
+        seconds spent attacking and resizing
+    """
+    from .attacks import AttackEngine
+
+    start = time.perf_counter()
+    attacked = AttackEngine(seed).apply_chains([image], chains)
+    attack_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    pixels = np.empty((len(chains), DECODER_SIZE, DECODER_SIZE, 3), dtype=np.uint8)
+    for i, images in enumerate(attacked):
+        pixels[i] = decoder_pixels(images[0])
+    return {'key': key, 'pixels': pixels, 'attack_seconds': attack_seconds,
+            'preprocess_seconds': time.perf_counter() - start}
+
+
+def _truncate_partial_line(path):
+    """Drop a last line cut short by an interrupted run, so appended rows start on their own line."""
+    with open(path, 'rb+') as f:
+        end = f.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            step = min(4096, position)
+            position -= step
+            f.seek(position)
+            newline = f.read(step).rfind(b'\n')
+            if newline != -1:
+                f.truncate(position + newline + 1)
+                return
+        f.truncate(0)
+
+
+class CsvReport:
+    """
+    Scan report as CSV, flushed after every batch.
+
+    An existing report is appended to: files with a result row are listed
+    in `done` so the scan skips them. Files that failed are tried again,
+    so their error rows are dropped first and each file keeps one row.
+    """
+
+    def __init__(self, path):
+        self.done = set()
+        fieldnames = [name for name, _ in REPORT_COLUMNS]
+        resume = os.path.exists(path) and os.path.getsize(path) > 0
+        if resume:
+            _truncate_partial_line(path)
+            failed = False
+            with open(path, newline='') as f:
+                for row in csv.DictReader(f):
+                    if row.get('error') == '':
+                        self.done.add(row['name'])
+                    else:
+                        failed = True
+            if failed:
+                self._drop_error_rows(path, fieldnames)
+            resume = os.path.getsize(path) > 0
+        self._file = open(path, 'a' if resume else 'w', newline='')
+        self._writer = csv.DictWriter(self._file, fieldnames=fieldnames)
+        if not resume:
+            self._writer.writeheader()
+
+    @staticmethod
+    def _drop_error_rows(path, fieldnames):
+        """Rewrite the report without its error rows (via a .partial file)."""
+        partial = f"{path}.partial"
+        with open(path, newline='') as source, open(partial, 'w', newline='') as target:
+            writer = csv.DictWriter(target, fieldnames=fieldnames, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(row for row in csv.DictReader(source) if row.get('error') == '')
+        os.replace(partial, path)
+
+    def write(self, rows):
+        self._writer.writerows(rows)
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetReport:
+    """
+    Scan report as Parquet (needs pyarrow), written in row groups.
+
+    The file is written under a .partial name and moved into place on
+    close, so it can't be resumed: an interrupted run starts over.
+    """
+
+    ROW_GROUP_SIZE = 65536
+
+    def __init__(self, path):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet reports need pyarrow (pip install pyarrow); use a .csv report instead")
+
+        types = {'string': pa.string(), 'int': pa.int64(), 'float': pa.float64(), 'bool': pa.bool_()}
+        self._pa = pa
+        self._schema = pa.schema([(name, types[kind]) for name, kind in REPORT_COLUMNS])
+        self._path = path
+        self._partial = f"{path}.partial"
+        self._writer = pq.ParquetWriter(self._partial, self._schema)
+        self._rows = []
+        self.done = set()
+
+    def _flush(self):
+        if self._rows:
+            self._writer.write_table(self._pa.Table.from_pylist(self._rows, schema=self._schema))
+            self._rows = []
+
+    def write(self, rows):
+        self._rows.extend(rows)
+        if len(self._rows) >= self.ROW_GROUP_SIZE:
+            self._flush()
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+        os.replace(self._partial, self._path)
+
+
+def open_report(path, report_format=None):
+    """CsvReport or ParquetReport for path; the format defaults to the file extension."""
+    if report_format is None:
+        report_format = 'parquet' if path.lower().endswith('.parquet') else 'csv'
+    if report_format not in REPORT_FORMATS:
+        raise ValueError(f"Unknown report format: {report_format}")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    return ParquetReport(path) if report_format == 'parquet' else CsvReport(path)
+
+
+def scan_tree(source, report_path, report_format=None, shard=(0, 1), workers=None, batch_size=64, log=print):
+    """
+    Detect watermarks in every image in a directory or archive and write a report.
+
+    Args:
+        source: Directory, tar or zip archive
+        report_path: CSV or Parquet report (one row per file, see REPORT_COLUMNS)
+        report_format: 'csv' or 'parquet' (default: from the extension)
+        shard: (i, N) to scan only the i-th of N disjoint slices of the corpus
+        workers: Read/decode/resize processes (default: CPU count)
+        batch_size: Images per decoder call
+        log: Progress callback taking a string
+
+    Returns:
+        Summary dict: counts, wall time, images/sec and per-stage timings
+    """
+    from .stegastamp import get_wrapper
+
+    report = open_report(report_path, report_format)
+    if report.done:
+        log(f"Resuming: {len(report.done)} files already in {report_path}")
+
+    wrapper = get_wrapper()
+    workers = workers or os.cpu_count() or 1
+    timer = StageTimer()
+    counts = {'scanned': 0, 'detected': 0, 'skipped': 0, 'failed': 0}
+    batch_buffer = np.empty((batch_size, DECODER_SIZE, DECODER_SIZE, 3), dtype=np.float32)
+    started = time.perf_counter()
+
+    def selected(name):
+        if not in_shard(name, shard):
+            return False
+        if name in report.done:
+            counts['skipped'] += 1
+            return False
+        return True
+
+    # Spawned workers: no TensorFlow state is inherited from this process
+    context = multiprocessing.get_context('spawn')
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            jobs = iter_sources(source, select=selected)
+            prepared = _bounded_map(pool, preprocess_job, jobs, window=max(batch_size, workers) * 2)
+            for batch_number, batch in enumerate(_batches(prepared, batch_size), 1):
+                rows, images = [], []
+                for item in batch:
+                    timer.add('read', item.get('read_seconds', 0.0))
+                    timer.add('decode', item['decode_seconds'])
+                    if item['error']:
+                        rows.append({'name': item['name'], 'error': item['error']})
+                        counts['failed'] += 1
+                    else:
+                        timer.add('preprocess', item['preprocess_seconds'])
+                        images.append(item)
+
+                if images:
+                    start = time.perf_counter()
+                    normalized = batch_buffer[:len(images)]
+                    for i, item in enumerate(images):
+                        np.multiply(item['pixels'], np.float32(1.0 / 255.0), out=normalized[i])
+                    detections = wrapper.decode_normalized(normalized, bit_stats=True)
+                    timer.add('detect', time.perf_counter() - start, len(images))
+
+                    for item, detection in zip(images, detections):
+                        rows.append({
+                            'name': item['name'],
+                            'width': item['width'],
+                            'height': item['height'],
+                            'detected': detection['detected'],
+                            'confidence': detection['confidence'],
+                            'detection_method': detection['detection_method'],
+                            **(detection['bit_stats'] or {}),
+                            'error': None,
+                        })
+                        counts['scanned'] += 1
+                        counts['detected'] += detection['detected']
+
+                start = time.perf_counter()
+                report.write(rows)
+                timer.add('report', time.perf_counter() - start, len(rows))
+
+                if batch_number % 10 == 0:
+                    processed = counts['scanned'] + counts['failed']
+                    log(f"{processed} files, {processed / (time.perf_counter() - started):.1f} images/s")
+    finally:
+        report.close()
+
+    wall = time.perf_counter() - started
+    return {
+        **counts,
+        'seconds': wall,
+        'images_per_second': counts['scanned'] / wall if wall else 0.0,
+        'model_loaded': wrapper.model_loaded,
+        'report': report_path,
+        'shard': f"{shard[0]}/{shard[1]}",
+        'stages': timer.report(),
+    }
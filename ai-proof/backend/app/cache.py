@@ -0,0 +1,260 @@
+"""
+Content-hash result cache for detection and stamping.
+Entries are keyed on a hash of the upload bytes plus every parameter that
+affects the output (including the model version), kept in a size-bounded
+in-memory LRU, and optionally spilled to disk when evicted from memory.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from . import config
+from .metrics import CACHE_REQUESTS
+
+
+def upload_digest(contents):
+    """Hash the raw upload bytes (hex digest)."""
+    return hashlib.blake2b(contents, digest_size=20).hexdigest()
+
+
+def content_key(upload_hash, kind, model_version, **params):
+    """
+    Build a cache key for one request.
+
+    Args:
+        upload_hash: upload_digest() of the raw upload bytes
+        kind: Operation name ('detect', 'stamp', ...)
+        model_version: Version of the model that produced the result
+        **params: Every other parameter that changes the output
+
+    Returns:
+        Hex digest usable as a cache key and file name
+    """
+    digest = hashlib.blake2b(upload_hash.encode('utf-8'), digest_size=20)
+    digest.update(kind.encode('utf-8'))
+    digest.update(str(model_version).encode('utf-8'))
+    for name in sorted(params):
+        digest.update(f"|{name}={params[name]!r}".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _sizeof(value):
+    """Approximate memory footprint of a cached value (strings dominate)."""
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    if isinstance(value, dict):
+        return 64 + sum(64 + _sizeof(v) for v in value.values())
+    return 64
+
+
+class ResultCache:
+    """Thread-safe LRU cache bounded by bytes, with an optional on-disk spill tier."""
+
+    def __init__(self, max_bytes, spill_dir=None, spill_max_bytes=0):
+        """
+        Args:
+            max_bytes: In-memory budget; least recently used entries are evicted past it
+            spill_dir: Directory for entries evicted from memory (None disables spilling)
+            spill_max_bytes: On-disk budget for spilled entries
+        """
+        self.max_bytes = int(max_bytes)
+        self.spill_dir = spill_dir or None
+        self.spill_max_bytes = int(spill_max_bytes)
+        self.model_version = None
+        self._memory = OrderedDict()  # key -> (value, size)
+        self._disk = OrderedDict()  # key -> (size, binary)
+        self._bytes = 0
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0, 'spills': 0, 'invalidations': 0}
+
+        if self.spill_dir:
+            os.makedirs(self.spill_dir, exist_ok=True)
+
+    def _path(self, key, binary):
+        # Raw bytes (e.g. PNGs) are spilled as-is, everything else as JSON
+        return os.path.join(self.spill_dir, f"{key}.bin" if binary else f"{key}.json")
+
+    def get(self, key):
+        """Return the cached value for key, or None on a miss."""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self._counters['hits'] += 1
+                return entry[0]
+            on_disk = self._disk.get(key)
+
+        if on_disk is not None:
+            binary = on_disk[1]
+            try:
+                if binary:
+                    with open(self._path(key, binary), 'rb') as f:
+                        value = f.read()
+                else:
+                    with open(self._path(key, binary), 'r', encoding='utf-8') as f:
+                        value = json.load(f)
+            except (OSError, ValueError):
+                value = None
+            self._drop_from_disk(key)
+            if value is not None:
+                with self._lock:
+                    self._counters['disk_hits'] += 1
+                # Promote back into memory
+                self.put(key, value)
+                return value
+
+        with self._lock:
+            self._counters['misses'] += 1
+        return None
+
+    def put(self, key, value):
+        """Store a JSON-serializable value or bytes, evicting (and possibly spilling) old entries."""
+        size = _sizeof(value)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._memory.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._memory[key] = (value, size)
+            self._bytes += size
+
+            evicted = []
+            while self._bytes > self.max_bytes:
+                old_key, (old_value, old_size) = self._memory.popitem(last=False)
+                self._bytes -= old_size
+                self._counters['evictions'] += 1
+                evicted.append((old_key, old_value, old_size))
+
+        if self.spill_dir:
+            for old_key, old_value, old_size in evicted:
+                self._spill(old_key, old_value, old_size)
+
+    def _spill(self, key, value, size):
+        """Write an evicted entry to disk, trimming the oldest spilled entries past the budget."""
+        if size > self.spill_max_bytes:
+            return
+        binary = isinstance(value, bytes)
+        try:
+            if binary:
+                with open(self._path(key, True), 'wb') as f:
+                    f.write(value)
+            else:
+                with open(self._path(key, False), 'w', encoding='utf-8') as f:
+                    json.dump(value, f)
+        except (OSError, TypeError, ValueError):
+            return
+
+        with self._lock:
+            self._disk[key] = (size, binary)
+            self._disk_bytes += size
+            self._counters['spills'] += 1
+            trimmed = []
+            while self._disk_bytes > self.spill_max_bytes:
+                old_key, (old_size, old_binary) = self._disk.popitem(last=False)
+                self._disk_bytes -= old_size
+                trimmed.append((old_key, old_binary))
+
+        for old_key, old_binary in trimmed:
+            self._remove_file(old_key, old_binary)
+
+    def _drop_from_disk(self, key):
+        with self._lock:
+            entry = self._disk.pop(key, None)
+            if entry is not None:
+                self._disk_bytes -= entry[0]
+        if entry is not None:
+            self._remove_file(key, entry[1])
+
+    def _remove_file(self, key, binary):
+        try:
+            os.remove(self._path(key, binary))
+        except OSError:
+            pass
+
+    def set_model_version(self, model_version):
+        """Record the active model version, clearing everything if it changed."""
+        if model_version != self.model_version:
+            if self.model_version is not None:
+                self.invalidate()
+            self.model_version = model_version
+
+    def invalidate(self):
+        """Drop every entry from memory and disk."""
+        with self._lock:
+            self._memory.clear()
+            self._bytes = 0
+            disk_keys = [(key, binary) for key, (_, binary) in self._disk.items()]
+            self._disk.clear()
+            self._disk_bytes = 0
+            self._counters['invalidations'] += 1
+
+        for key, binary in disk_keys:
+            self._remove_file(key, binary)
+
+    def stats(self):
+        """Return hit/miss counters and current memory/disk usage."""
+        with self._lock:
+            lookups = self._counters['hits'] + self._counters['disk_hits'] + self._counters['misses']
+            return {
+                **self._counters,
+                'hit_rate': (self._counters['hits'] + self._counters['disk_hits']) / lookups if lookups else 0.0,
+                'entries': len(self._memory),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'disk_entries': len(self._disk),
+                'disk_bytes': self._disk_bytes,
+                'model_version': self.model_version,
+            }
+
+
+def cached(cache, upload_hash, kind, model_version, compute, **params):
+    """
+    Return the cached result for a request, computing and storing it on a miss.
+
+    Args:
+        cache: ResultCache, or None to always compute
+        upload_hash: upload_digest() of the raw upload bytes
+        kind: Operation name
+        model_version: Active model version; a change clears the cache
+        compute: Zero-argument callable producing the result
+        **params: Every other parameter that changes the output
+    """
+    if cache is None:
+        return compute()
+
+    cache.set_model_version(model_version)
+    key = content_key(upload_hash, kind, model_version, **params)
+    value = cache.get(key)
+    if value is None:
+        CACHE_REQUESTS.inc(kind=kind, result='miss')
+        value = compute()
+        cache.put(key, value)
+    else:
+        CACHE_REQUESTS.inc(kind=kind, result='hit')
+    return value
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Get or create the process-wide result cache (None when caching is disabled)."""
+    global _cache
+    if not config.CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResultCache(
+                    max_bytes=config.CACHE_MAX_BYTES,
+                    spill_dir=config.CACHE_DISK_DIR,
+                    spill_max_bytes=config.CACHE_DISK_MAX_BYTES
+                )
+    return _cache
@@ -0,0 +1,195 @@
+"""
+Command-line tools for offline jobs that don't go through the API.
+
+Usage:
+    python -m backend.app.cli stamp INPUT OUTPUT [options]
+    python -m backend.app.cli detect INPUT REPORT.csv [--shard i/N] [options]
+    python -m backend.app.cli sweep IMAGE [--stamp] [--attacks jpeg,resize] [options]
+"""
+
+import argparse
+import json
+import sys
+
+from . import config
+from .images import OUTPUT_FORMATS
+
+
+def _print_report(headline, summary, out=sys.stdout):
+    """Human-readable end-of-run summary with per-stage timing."""
+    print(f"\n{headline} in {summary['seconds']:.1f}s "
+          f"({summary['images_per_second']:.2f} images/s); "
+          f"{summary['skipped']} skipped (already done), {summary['failed']} failed"
+          f"{'' if summary['model_loaded'] else ' [simulation mode]'}", file=out)
+    print(f"{'stage':<10} {'total s':>10} {'count':>8} {'ms/item':>10}", file=out)
+    for stage, timing in summary['stages'].items():
+        per_item = timing['seconds'] / timing['count'] * 1000.0 if timing['count'] else 0.0
+        print(f"{stage:<10} {timing['seconds']:>10.2f} {timing['count']:>8} {per_item:>10.2f}", file=out)
+    print("(read, decode, preprocess, encode and write run in parallel worker processes; "
+          "their totals are summed over workers)", file=out)
+
+
+def _write_summary(summary, path):
+    if path:
+        with open(path, 'w') as f:
+            json.dump(summary, f, indent=2)
+
+
+def cmd_stamp(args):
+    from .bulk import stamp_tree
+
+    summary = stamp_tree(
+        args.input, args.output,
+        manifest_path=args.manifest,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        strength=args.strength,
+        adaptive=args.adaptive,
+        embed_mode=args.embed,
+        output_format=args.format,
+        level=args.level,
+        keep_metadata=args.keep_metadata,
+        log=lambda message: print(message, file=sys.stderr),
+    )
+    _print_report(f"Stamped {summary['stamped']} images", summary)
+    _write_summary(summary, args.report)
+    return 1 if summary['failed'] else 0
+
+
+def cmd_detect(args):
+    from .bulk import scan_tree
+
+    summary = scan_tree(
+        args.input, args.output,
+        report_format=args.format,
+        shard=args.shard,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        log=lambda message: print(message, file=sys.stderr),
+    )
+    _print_report(f"Scanned {summary['scanned']} images (shard {summary['shard']}), "
+                  f"{summary['detected']} watermarked,", summary)
+    _write_summary(summary, args.report)
+    return 1 if summary['failed'] else 0
+
+
+def cmd_sweep(args):
+    from .images import decode_image_bytes
+    from .pipeline import sweep_attacks
+
+    with open(args.image, 'rb') as f:
+        image = decode_image_bytes(f.read())
+    if image is None:
+        raise ValueError(f"{args.image} is not a decodable image")
+
+    attack_types = [t.strip().lower() for t in args.attacks.split(',') if t.strip()] if args.attacks else None
+    report = sweep_attacks(
+        image, attack_types, stamp=args.stamp, strength=args.strength, adaptive=args.adaptive,
+        probes=args.probes, tolerance=args.tolerance, max_rounds=args.max_rounds
+    )
+
+    baseline = report['baseline']
+    if baseline is None:
+        raise RuntimeError("The sweep made no decoder calls, so there is no baseline to report")
+    print(f"Baseline: {'detected' if baseline['detected'] else 'not detected'} "
+          f"(confidence {baseline['confidence']:.3f}); {report['probes']} probes in "
+          f"{report['rounds']} decoder calls")
+    print(f"{'attack':<12} {'breaks at':>10} {'bracket':>16}  curve (severity:confidence, * = detected)")
+    for result in report['results']:
+        if result['survives']:
+            breaks, bracket = 'survives', ''
+        else:
+            breaks = f"{result['breaking_severity']:.3f}{'' if result['converged'] else '?'}"
+            bracket = "[{:.3f}, {:.3f}]".format(*result['bracket'])
+        curve = ' '.join(
+            f"{point['severity']:.2f}:{point['confidence']:.2f}{'*' if point['detected'] else ''}"
+            for point in result['curve']
+        )
+        print(f"{result['type']:<12} {breaks:>10} {bracket:>16}  {curve}")
+    _write_summary(report, args.report)
+    return 0
+
+
+def _shard(text):
+    from .bulk import parse_shard
+
+    try:
+        return parse_shard(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def _int_between(low, high):
+    """argparse type for an int in [low, high], matching the API's Query bounds."""
+    def parse(text):
+        try:
+            value = int(text)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"expected an integer, got {text!r}")
+        if not low <= value <= high:
+            raise argparse.ArgumentTypeError(f"must be between {low} and {high}, got {value}")
+        return value
+    return parse
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m backend.app.cli", description="AI-PROOF offline tools")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    stamp = commands.add_parser('stamp', help="Watermark every image in a directory or tar/zip archive")
+    stamp.add_argument('input', help="directory, .tar(.gz/.bz2/.xz) or .zip")
+    stamp.add_argument('output', help="output directory (relative paths are kept)")
+    stamp.add_argument('--manifest', help="resumable manifest (default: OUTPUT/manifest.jsonl)")
+    stamp.add_argument('--workers', type=int, help="decode/encode processes (default: CPU count)")
+    stamp.add_argument('--batch-size', type=int, default=16, help="images per encoder call (default: 16)")
+    stamp.add_argument('--strength', type=float, default=0.7)
+    stamp.add_argument('--adaptive', action='store_true', help="variance-based adaptive masking")
+    stamp.add_argument('--embed', choices=('resize', 'residual', 'tiled'),
+                       help=f"embedding mode (default: {config.EMBED_MODE})")
+    stamp.add_argument('--format', default='keep', choices=('keep',) + tuple(OUTPUT_FORMATS),
+                       help="output format; 'keep' uses the input's format where possible (default)")
+    stamp.add_argument('--level', type=int, help="PNG compression 0-9 or JPEG/WebP quality 1-100")
+    stamp.add_argument('--keep-metadata', action='store_true', help="copy EXIF and ICC profiles to the outputs")
+    stamp.add_argument('--report', help="also write the summary as JSON to this file")
+    stamp.set_defaults(func=cmd_stamp)
+
+    detect = commands.add_parser('detect', help="Scan every image in a directory or tar/zip archive into a report")
+    detect.add_argument('input', help="directory, .tar(.gz/.bz2/.xz) or .zip")
+    detect.add_argument('output', help="report file, .csv (appended to on rerun) or .parquet")
+    detect.add_argument('--format', choices=('csv', 'parquet'), help="report format (default: from the extension)")
+    detect.add_argument('--shard', type=_shard, default=(0, 1),
+                        help="scan only slice i of N (0-based), e.g. 2/8 on the third of eight machines")
+    detect.add_argument('--workers', type=int, help="read/decode/resize processes (default: CPU count)")
+    detect.add_argument('--batch-size', type=int, default=64, help="images per decoder call (default: 64)")
+    detect.add_argument('--report', help="also write the run summary as JSON to this file")
+    detect.set_defaults(func=cmd_detect)
+
+    sweep = commands.add_parser('sweep', help="Find the severity at which each attack breaks detection")
+    sweep.add_argument('image', help="image file")
+    sweep.add_argument('--attacks', help="comma-separated attack types (default: all)")
+    sweep.add_argument('--stamp', action='store_true', help="watermark the image first")
+    sweep.add_argument('--strength', type=float, default=0.7)
+    sweep.add_argument('--adaptive', action='store_true', help="variance-based adaptive masking")
+    sweep.add_argument('--probes', type=_int_between(2, 16), default=4,
+                       help="severities probed per attack per round, 2-16 (default: 4)")
+    sweep.add_argument('--tolerance', type=float, default=0.02, help="final bracket width (default: 0.02)")
+    sweep.add_argument('--max-rounds', type=_int_between(1, 20), default=8,
+                       help="maximum decoder calls, 1-20 (default: 8)")
+    sweep.add_argument('--report', help="also write the full result as JSON to this file")
+    sweep.set_defaults(func=cmd_sweep)
+
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    try:
+        return args.func(args)
+    except (OSError, ValueError, RuntimeError) as e:
+        # Bad inputs (missing files, unreadable source, missing pyarrow...): no traceback
+        parser.exit(2, f"{parser.prog}: error: {e}\n")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -23,5 +23,89 @@ API_PORT = int(os.getenv("API_PORT", 8000))
 MAX_IMAGE_SIZE = 50 * 1024 * 1024  # 50MB
 ALLOWED_EXTENSIONS = {"jpg", "jpeg", "png", "gif", "webp"}
 
+# Inference batching configuration
+# Concurrent encode/decode requests are collected for up to BATCH_WINDOW_MS
+# (or until BATCH_MAX_SIZE images are queued) and run as one session call.
+BATCHING_ENABLED = os.getenv("BATCHING_ENABLED", "true").lower() in ("1", "true", "yes")
+BATCH_WINDOW_MS = float(os.getenv("BATCH_WINDOW_MS", 10))
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", 8))
+BATCH_QUEUE_DEPTH = int(os.getenv("BATCH_QUEUE_DEPTH", 64))
+
+# Inference sessions
+# INFERENCE_SESSIONS independent sessions (each with its own copy of the
+# weights) serve batches in parallel. One session using every core suits
+# large batches; several smaller ones suit many concurrent requests. Thread
+# counts of 0 let TensorFlow decide; with several sessions the intra-op
+# default is the cores split evenly between them.
+INFERENCE_SESSIONS = max(1, int(os.getenv("INFERENCE_SESSIONS", 1)))
+INTRA_OP_THREADS = int(os.getenv("INTRA_OP_THREADS", 0)) or (
+    max(1, (os.cpu_count() or 1) // INFERENCE_SESSIONS) if INFERENCE_SESSIONS > 1 else 0
+)
+INTER_OP_THREADS = int(os.getenv("INTER_OP_THREADS", 0))
+
+# Shared model server (multi-process mode)
+# When MODEL_SERVER_ADDRESS (a Unix socket path) is set, this process doesn't
+# load the model; it sends preprocessed images to the model server there.
+# backend/gunicorn.conf.py sets both for multi-worker deployments.
+MODEL_SERVER_ADDRESS = os.getenv("MODEL_SERVER_ADDRESS", "")
+MODEL_SERVER_AUTHKEY = os.getenv("MODEL_SERVER_AUTHKEY", "")
+MODEL_SERVER_CONNECT_TIMEOUT = float(os.getenv("MODEL_SERVER_CONNECT_TIMEOUT", 120))
+
+# Startup warmup
+# The model is loaded at startup and dummy batches are run at each of
+# WARMUP_BATCH_SIZES (default: every size the batcher can produce) before
+# /api/health reports ready.
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() in ("1", "true", "yes")
+WARMUP_BATCH_SIZES = sorted({
+    int(size) for size in os.getenv("WARMUP_BATCH_SIZES", "").split(",") if size.strip()
+}) or list(range(1, (BATCH_MAX_SIZE if BATCHING_ENABLED else 1) + 1))
+
+# Request execution configuration
+# Blocking inference/image work runs on a bounded thread pool; requests beyond
+# MAX_INFLIGHT_REQUESTS are rejected with 503 instead of queueing.
+EXECUTOR_WORKERS = int(os.getenv("EXECUTOR_WORKERS", 16))
+MAX_INFLIGHT_REQUESTS = int(os.getenv("MAX_INFLIGHT_REQUESTS", 64))
+
+# Attack pipeline configuration
+# Threads used to apply attacks in parallel within one /api/pipeline request
+ATTACK_WORKERS = int(os.getenv("ATTACK_WORKERS", min(8, os.cpu_count() or 1)))
+
+# Frequency heatmap configuration
+# Heatmaps are opt-in on /api/detect and computed on a grayscale copy capped
+# at HEATMAP_MAX_SIZE pixels per side. With ?defer_heatmap=true the upload is
+# kept instead, for HEATMAP_STORE_SIZE results (and at most
+# HEATMAP_STORE_MAX_BYTES per worker), so the heatmap can be fetched later
+# by result ID.
+HEATMAP_MAX_SIZE = int(os.getenv("HEATMAP_MAX_SIZE", 512))
+HEATMAP_STORE_SIZE = int(os.getenv("HEATMAP_STORE_SIZE", 256))
+HEATMAP_STORE_MAX_BYTES = int(os.getenv("HEATMAP_STORE_MAX_BYTES", 256 * 1024 * 1024))  # 256MB
+
+# Watermark embedding
+# EMBED_MODE: 'resize' (watermark at 400x400 and resize the result back),
+# 'residual' (add the upsampled residual to the untouched original) or
+# 'tiled' (encode native-resolution 400x400 tiles, TILE_BATCH_SIZE per
+# session call).
+EMBED_MODE = os.getenv("EMBED_MODE", "resize")
+TILE_BATCH_SIZE = max(1, int(os.getenv("TILE_BATCH_SIZE", 16)))
+
+# Output encoding
+# Stamped images default to PNG at PNG_COMPRESSION (zlib level 0-9; lower is
+# faster and larger). JPEG output defaults to JPEG_QUALITY.
+PNG_COMPRESSION = int(os.getenv("PNG_COMPRESSION", 3))
+JPEG_QUALITY = int(os.getenv("JPEG_QUALITY", 95))
+
+# Result cache configuration
+# Detect results and stamped images are cached by upload content hash plus
+# parameters and model version. Entries evicted from memory are spilled to
+# CACHE_DISK_DIR when it is set.
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", 256 * 1024 * 1024))  # 256MB
+CACHE_DISK_DIR = os.getenv("CACHE_DISK_DIR", "")
+CACHE_DISK_MAX_BYTES = int(os.getenv("CACHE_DISK_MAX_BYTES", 2 * 1024 * 1024 * 1024))  # 2GB
+
 # Logging configuration
+# LOG_FORMAT: 'json' (one object per line) or 'text'. Per-request decoder
+# bit dumps are DEBUG records, emitted for DEBUG_SAMPLE_RATE of requests.
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+DEBUG_SAMPLE_RATE = float(os.getenv("DEBUG_SAMPLE_RATE", 0.01))
@@ -0,0 +1,145 @@
+"""
+Bounded executor for blocking TensorFlow and OpenCV work.
+Keeps inference and image processing off the asyncio event loop, and sheds
+load once too many requests are in flight instead of queueing without limit.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from . import config
+
+
+class ServerBusyError(RuntimeError):
+    """Raised when the maximum number of in-flight requests has been reached."""
+
+
+class BoundedExecutor:
+    """Thread pool with a hard cap on submitted-but-unfinished work."""
+
+    def __init__(self, max_workers=8, max_inflight=32, name="ai-proof-worker"):
+        """
+        Args:
+            max_workers: Number of worker threads (TF session.run releases the GIL)
+            max_inflight: Maximum running + queued calls before run() rejects
+            name: Thread name prefix
+        """
+        self.max_workers = max(1, int(max_workers))
+        self.max_inflight = max(1, int(max_inflight))
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._inflight = 0
+        self._completed = 0
+        self._rejected = 0
+
+    async def run(self, fn, *args, **kwargs):
+        """
+        Run a blocking callable in the pool and await its result.
+
+        Raises:
+            ServerBusyError: If max_inflight calls are already running or queued
+        """
+        slot = self.reserve()
+        try:
+            future = slot.submit(fn, *args, **kwargs)
+        except Exception:
+            slot.release()
+            raise
+        # Released when the call finishes, not when the caller stops waiting:
+        # a cancelled request still occupies a worker until fn returns
+        future.add_done_callback(lambda _: slot.release())
+        return await asyncio.wrap_future(future)
+
+    def reserve(self):
+        """
+        Take one in-flight slot for work that outlives a single call (e.g. a stream).
+
+        The slot counts against max_inflight until released; blocking calls
+        made through it run in this pool without taking further slots.
+
+        Returns:
+            Slot (also a context manager that releases it)
+
+        Raises:
+            ServerBusyError: If max_inflight slots are already taken
+        """
+        with self._lock:
+            if self._inflight >= self.max_inflight:
+                self._rejected += 1
+                raise ServerBusyError(f"{self._inflight} requests in flight (limit {self.max_inflight})")
+            self._inflight += 1
+        return Slot(self)
+
+    def _release(self):
+        with self._lock:
+            self._inflight -= 1
+            self._completed += 1
+
+    def stats(self):
+        """Return in-flight and rejection counters."""
+        with self._lock:
+            return {
+                'max_workers': self.max_workers,
+                'max_inflight': self.max_inflight,
+                'inflight': self._inflight,
+                'completed': self._completed,
+                'rejected': self._rejected,
+            }
+
+    def shutdown(self):
+        """Wait for running work and stop the worker threads."""
+        self._pool.shutdown(wait=True)
+
+
+class Slot:
+    """One reserved in-flight slot of a BoundedExecutor."""
+
+    def __init__(self, executor):
+        self._executor = executor
+        self._released = False
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        """Submit a blocking callable to the executor's pool; returns a concurrent.futures.Future."""
+        return self._executor._pool.submit(fn, *args, **kwargs)
+
+    async def run(self, fn, *args, **kwargs):
+        """Run a blocking callable in the executor's pool under this slot."""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def release(self):
+        """Give the slot back; safe to call more than once."""
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        self._executor._release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Get or create the process-wide bounded executor."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = BoundedExecutor(
+                    max_workers=config.EXECUTOR_WORKERS,
+                    max_inflight=config.MAX_INFLIGHT_REQUESTS
+                )
+    return _executor
+
+
+async def run_blocking(fn, *args, **kwargs):
+    """Run a blocking callable on the shared bounded executor."""
+    return await get_executor().run(fn, *args, **kwargs)
@@ -0,0 +1,170 @@
+"""
+Frequency-domain heatmaps for detection results.
+Heatmaps are computed on a capped-resolution grayscale copy with a real-input
+FFT. They can also be deferred: the raw upload (or the small grayscale
+source) is kept under a result ID, and decoding and rendering happen only if
+the client asks for it later.
+"""
+
+import base64
+import threading
+import uuid
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from . import config
+from .images import decode_upload
+from .metrics import stage_timer, timed
+
+
+def heatmap_source(image, max_size=None):
+    """
+    Reduce an image to the grayscale input used for its heatmap.
+
+    Args:
+        image: BGR or grayscale uint8 numpy array
+        max_size: Cap on the longer side (default: HEATMAP_MAX_SIZE)
+
+    Returns:
+        Grayscale uint8 array no larger than max_size on either side
+    """
+    max_size = max_size or config.HEATMAP_MAX_SIZE
+    h, w = image.shape[:2]
+    scale = max_size / max(h, w)
+    if scale < 1.0:
+        # Downscale before the color conversion so it only touches the small image
+        image = cv2.resize(image, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+    if len(image.shape) == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return image
+
+
+def _magnitude_spectrum(gray):
+    """Full centered FFT magnitude of a real image, computed from the half spectrum."""
+    h, w = gray.shape
+    half = np.abs(np.fft.rfft2(gray.astype(np.float32))).astype(np.float32)
+
+    # Real input => |F(u, v)| == |F(-u, -v)|, so the missing columns are a
+    # flipped copy of the half spectrum
+    magnitude = np.empty((h, w), dtype=np.float32)
+    magnitude[:, :half.shape[1]] = half
+    missing = w - half.shape[1]
+    if missing > 0:
+        rows = (-np.arange(h)) % h
+        cols = w - np.arange(half.shape[1], w)
+        magnitude[:, half.shape[1]:] = half[rows][:, cols]
+
+    return np.fft.fftshift(magnitude)
+
+
+def render_heatmap(gray):
+    """
+    Render a frequency-domain heatmap from a grayscale source.
+
+    Returns:
+        Base64 encoded PNG of the log-magnitude spectrum with a JET colormap
+    """
+    png = render_heatmap_png(gray)
+    with stage_timer('base64'):
+        return base64.b64encode(png).decode('utf-8')
+
+
+@timed('heatmap')
+def render_heatmap_png(gray):
+    """Render a frequency-domain heatmap from a grayscale source as PNG bytes."""
+    magnitude_log = np.log1p(_magnitude_spectrum(gray))
+
+    # Normalize to 0-255
+    spread = magnitude_log.max() - magnitude_log.min()
+    if spread > 0:
+        magnitude_normalized = ((magnitude_log - magnitude_log.min()) / spread * 255).astype(np.uint8)
+    else:
+        magnitude_normalized = np.zeros(magnitude_log.shape, dtype=np.uint8)
+
+    heatmap = cv2.applyColorMap(magnitude_normalized, cv2.COLORMAP_JET)
+
+    _, buffer = cv2.imencode('.png', heatmap)
+    return buffer.tobytes()
+
+
+class HeatmapStore:
+    """
+    Bounded LRU of heatmap sources keyed by result ID.
+
+    A source is either the small grayscale array or the raw upload it is
+    built from; raw uploads are turned into grayscale sources on first use.
+    Bounded by entry count and by total bytes held.
+    """
+
+    def __init__(self, max_entries=256, max_bytes=256 * 1024 * 1024):
+        self.max_entries = max(1, int(max_entries))
+        self.max_bytes = max(1, int(max_bytes))
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _size(source):
+        return len(source) if isinstance(source, bytes) else source.nbytes
+
+    def put(self, source, result_id=None):
+        """Keep a heatmap source (grayscale array or raw upload) and return its result ID (a new one unless given)."""
+        result_id = result_id or uuid.uuid4().hex
+        with self._lock:
+            previous = self._entries.pop(result_id, None)
+            if previous is not None:
+                self._bytes -= self._size(previous)
+            self._entries[result_id] = source
+            self._bytes += self._size(source)
+            while len(self._entries) > self.max_entries or (self._bytes > self.max_bytes and len(self._entries) > 1):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= self._size(evicted)
+        return result_id
+
+    def get(self, result_id):
+        """Return the heatmap source for a result ID, or None if unknown or evicted."""
+        with self._lock:
+            source = self._entries.get(result_id)
+            if source is not None:
+                self._entries.move_to_end(result_id)
+            return source
+
+    def replace(self, result_id, gray):
+        """Swap a stored raw upload for its grayscale source, if the entry is still there."""
+        with self._lock:
+            previous = self._entries.get(result_id)
+            if previous is None:
+                return
+            self._entries[result_id] = gray
+            self._bytes += self._size(gray) - self._size(previous)
+
+    def __contains__(self, result_id):
+        with self._lock:
+            return result_id in self._entries
+
+
+_store = HeatmapStore(config.HEATMAP_STORE_SIZE, config.HEATMAP_STORE_MAX_BYTES)
+
+
+def defer_upload(contents, result_id=None):
+    """Keep the raw upload for a later heatmap request, without decoding it now; returns its result ID."""
+    return _store.put(bytes(contents), result_id)
+
+
+def has_deferred(result_id):
+    """Whether a heatmap source is still stored for a result ID."""
+    return result_id in _store
+
+
+def render_deferred(result_id, as_png=False):
+    """Render the heatmap for a result ID (base64, or PNG bytes), or None if it is unknown or expired."""
+    source = _store.get(result_id)
+    if source is None:
+        return None
+    if isinstance(source, bytes):
+        # Deferred as the raw upload: decode once, keep only the small source
+        source = heatmap_source(decode_upload(source))
+        _store.replace(result_id, source)
+    return render_heatmap_png(source) if as_png else render_heatmap(source)
@@ -0,0 +1,136 @@
+"""
+In-memory image ingestion and output encoding for the API.
+Upload bytes are decoded straight into numpy arrays; nothing is written to disk.
+Results are encoded with cv2.imencode as PNG (tunable zlib level), lossless
+WebP or JPEG.
+"""
+
+import cv2
+import numpy as np
+from fastapi import HTTPException, UploadFile
+
+from . import config
+from .metrics import stage_timer
+
+
+# Output format -> (file extension, media type)
+OUTPUT_FORMATS = {
+    'png': ('.png', 'image/png'),
+    'webp': ('.webp', 'image/webp'),
+    'jpeg': ('.jpg', 'image/jpeg'),
+}
+
+
+def decode_image_bytes(contents):
+    """
+    Decode encoded image bytes (PNG, JPEG, WebP, ...) into a BGR array.
+
+    Args:
+        contents: Raw file bytes
+
+    Returns:
+        BGR uint8 numpy array, or None if the bytes are not a decodable image
+    """
+    if not contents:
+        return None
+    nparr = np.frombuffer(contents, np.uint8)
+    with stage_timer('decode'):
+        return cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+
+
+async def read_upload(file: UploadFile):
+    """
+    Read and validate an uploaded image without decoding it.
+
+    Decoding is left to decode_upload() so it can run off the event loop.
+
+    Args:
+        file: Uploaded file from a multipart request
+
+    Returns:
+        Raw upload bytes
+
+    Raises:
+        HTTPException: 400 if the upload is not an image or is empty,
+            413 if it exceeds MAX_IMAGE_SIZE
+    """
+    # Check if file is an image
+    if not file.content_type or "image" not in file.content_type:
+        raise HTTPException(status_code=400, detail="File must be an image")
+
+    with stage_timer('upload_read'):
+        contents = await file.read()
+
+    if not contents:
+        raise HTTPException(status_code=400, detail="File is empty")
+
+    if len(contents) > config.MAX_IMAGE_SIZE:
+        raise HTTPException(status_code=413, detail="File is too large")
+
+    return contents
+
+
+def decode_upload(contents):
+    """
+    Decode validated upload bytes into a BGR array.
+
+    Raises:
+        HTTPException: 400 if the bytes are not a decodable image
+    """
+    image = decode_image_bytes(contents)
+
+    if image is None:
+        raise HTTPException(status_code=400, detail="Failed to decode image")
+
+    return image
+
+
+def validate_output(output_format, level=None):
+    """
+    Check a requested output format and level before any work is done.
+
+    Raises:
+        HTTPException: 400 for an unknown format or an out-of-range level
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid format '{output_format}', expected one of {', '.join(OUTPUT_FORMATS)}"
+        )
+    if level is None:
+        return
+    if output_format == 'png' and not 0 <= level <= 9:
+        raise HTTPException(status_code=400, detail="PNG level (zlib compression) must be between 0 and 9")
+    if output_format in ('jpeg', 'webp') and not 1 <= level <= 100:
+        raise HTTPException(status_code=400, detail=f"{output_format.upper()} level (quality) must be between 1 and 100")
+
+
+def encode_output(image, output_format='png', level=None):
+    """
+    Encode a BGR array for a response.
+
+    Args:
+        image: BGR uint8 numpy array
+        output_format: 'png', 'webp' or 'jpeg'
+        level: PNG zlib compression 0-9 (default PNG_COMPRESSION), JPEG
+            quality 1-100 (default JPEG_QUALITY), or WebP quality 1-100
+            (default: lossless)
+
+    Returns:
+        Encoded image bytes
+    """
+    extension, _ = OUTPUT_FORMATS[output_format]
+
+    if output_format == 'png':
+        params = [cv2.IMWRITE_PNG_COMPRESSION, config.PNG_COMPRESSION if level is None else level]
+    elif output_format == 'jpeg':
+        params = [cv2.IMWRITE_JPEG_QUALITY, config.JPEG_QUALITY if level is None else level]
+    else:
+        # OpenCV encodes WebP losslessly for quality above 100
+        params = [cv2.IMWRITE_WEBP_QUALITY, 101 if level is None else level]
+
+    with stage_timer('encode'):
+        ok, buffer = cv2.imencode(extension, image, params)
+    if not ok:
+        raise ValueError(f"Failed to encode image as {output_format}")
+    return buffer.tobytes()
@@ -1,14 +1,30 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import JSONResponse, FileResponse
+import asyncio
+import time
+from typing import Optional
+from fastapi import FastAPI, File, UploadFile, HTTPException, Request, Query
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
-import io
+from starlette.background import BackgroundTask
 import base64
-import os
-import tempfile
 import cv2
-import numpy as np
-from .stegastamp import encode_image, decode_image
-from .attacks import ImageAttacks, get_predefined_attacks
+from . import config
+from .stegastamp import stamp_array, decode_array, decode_search, check_model_server, get_batching_stats, get_model_version, warmup, shutdown, EMBED_MODES
+from .cache import get_cache, cached, upload_digest
+from .images import read_upload, decode_upload, validate_output, encode_output, OUTPUT_FORMATS
+from .batching import QueueFullError
+from .executor import ServerBusyError, run_blocking, get_executor
+from .attacks import ATTACK_TYPES, ImageAttacks, get_predefined_attacks, parse_chain, format_chain
+from .heatmaps import defer_upload, has_deferred, render_deferred, heatmap_source, render_heatmap_png
+from .responses import negotiate, image_response
+from .pipeline import select_attacks, run_pipeline, stream_pipeline, sweep_attacks, format_event, STREAM_FORMATS
+from .logs import configure_logging, get_logger
+from . import metrics
+
+configure_logging()
+logger = get_logger('api')
+
+# Overload errors from the executor and batching queues map to 503
+BUSY_ERRORS = (QueueFullError, ServerBusyError)
 
 app = FastAPI(
     title="AI-PROOF API",
@@ -25,6 +41,177 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Startup state reported by /api/health; traffic should wait for 'ready'
+_readiness = {'ready': False, 'error': None, 'warmup': None}
+
+# Route function -> path template, so metrics are labelled per endpoint
+# rather than per concrete URL
+_route_paths = {}
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Count requests and time them per endpoint for /metrics."""
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        if not _route_paths:
+            _route_paths.update({route.endpoint: route.path for route in app.routes if hasattr(route, 'endpoint')})
+        endpoint = _route_paths.get(request.scope.get('endpoint'), 'unmatched')
+        metrics.REQUESTS.inc(endpoint=endpoint, method=request.method, status=status)
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint, method=request.method)
+
+def _queue_depths():
+    # Reading the stats before the model is ready would load it on the scrape
+    if not _readiness['ready']:
+        return {}
+    return {(name,): stats['queue_depth'] for name, stats in (get_batching_stats() or {}).items()}
+
+metrics.register_gauge(
+    'aiproof_batch_queue_depth', 'Images waiting in each inference batching queue', ('batcher',), _queue_depths
+)
+metrics.register_gauge(
+    'aiproof_executor_inflight', 'Requests running or queued in the blocking executor', (),
+    lambda: {(): get_executor().stats()['inflight']}
+)
+
+def _warmup_sync():
+    """Load the model and run the warmup batches, recording the outcome for /api/health."""
+    start = time.perf_counter()
+    try:
+        timings = warmup() if config.WARMUP_ENABLED else None
+        get_model_version()  # Loads the model even when warmup is disabled
+    except Exception as e:
+        logger.exception("Error during model warmup")
+        _readiness['error'] = str(e)
+        return
+    _readiness['warmup'] = {'seconds': time.perf_counter() - start, 'timings': timings}
+    logger.info("Model ready", extra={'warmup_seconds': _readiness['warmup']['seconds']})
+    _readiness['ready'] = True
+
+@app.on_event("startup")
+async def load_model():
+    """Load and warm up the model in the background so /api/health can report progress."""
+    loop = asyncio.get_running_loop()
+    app.state.warmup_task = loop.run_in_executor(None, _warmup_sync)
+
+@app.on_event("shutdown")
+def release_model():
+    """Stop the inference batchers and close the TensorFlow session."""
+    shutdown()
+
+def _for_mode(png, mode):
+    """Raw PNG bytes for binary/multipart responses, base64 text for JSON."""
+    if png is None or mode != 'json':
+        return png
+    with metrics.stage_timer('base64'):
+        return base64.b64encode(png).decode('utf-8')
+
+def _stamp_sync(contents, strength, adaptive, output_format, level, mode, embed_mode):
+    """
+    Blocking part of /api/stamp: decode upload, embed the watermark and encode the result (cached by content).
+    
+    Returns:
+        (encoded image for the response mode, encoded size in bytes,
+        encode time in ms or None when served from the cache)
+    """
+    cache = get_cache()
+    upload_hash = upload_digest(contents) if cache is not None else None
+    timing = {}
+    
+    def compute():
+        image = decode_upload(contents)
+        stamped = stamp_array(
+            image, secret="AI-PROOF-v1", strength=strength, adaptive=adaptive, embed_mode=embed_mode
+        )
+        start = time.perf_counter()
+        encoded = encode_output(stamped, output_format, level)
+        timing['encode_ms'] = (time.perf_counter() - start) * 1000.0
+        return encoded
+    
+    encoded = cached(
+        cache, upload_hash, 'stamp', get_model_version(), compute,
+        secret="AI-PROOF-v1", strength=strength, adaptive=adaptive,
+        output_format=output_format, level=level, embed_mode=embed_mode
+    )
+    return _for_mode(encoded, mode), len(encoded), timing.get('encode_ms')
+
+def _detect_sync(contents, heatmap, mode, search=False, defer_heatmap=False):
+    """
+    Blocking part of /api/detect: decode upload, run the decoder (or the view search) and handle the heatmap.
+    
+    With defer_heatmap only the raw upload is kept for GET /api/heatmap/{result_id},
+    so a cached result costs no image decoding at all.
+    """
+    cache = get_cache()
+    upload_hash = upload_digest(contents) if cache is not None else None
+    decoded = {}
+    
+    # Binary and multipart responses carry the heatmap as the image, rendered
+    # straight to PNG bytes below instead of as base64 by the wrapper
+    inline_heatmap = heatmap and mode == 'json'
+    
+    def compute():
+        decoded['image'] = decode_upload(contents)
+        detect = decode_search if search else decode_array
+        return detect(decoded['image'], heatmap=inline_heatmap)
+    
+    # Copy: the cached dict is shared between requests
+    result = dict(cached(
+        cache, upload_hash, 'detect', get_model_version(), compute, heatmap=inline_heatmap, search=search
+    ))
+    
+    if not heatmap:
+        if not defer_heatmap:
+            result['result_id'] = None
+        elif upload_hash is not None and has_deferred(upload_hash):
+            result['result_id'] = upload_hash
+        else:
+            result['result_id'] = defer_upload(contents, upload_hash)
+        return result
+    
+    result['result_id'] = None
+    if mode != 'json':
+        image = decoded.get('image')
+        if image is None:
+            image = decode_upload(contents)
+        result['heatmap'] = render_heatmap_png(heatmap_source(image))
+    return result
+
+def _attack_sync(contents, steps, mode):
+    """Blocking part of /api/attack: apply the attack steps, detect on the result and encode it."""
+    image = decode_upload(contents)
+    attacked = image
+    for attack_type, severity in steps:
+        attacked = ImageAttacks.apply_attack(attacked, attack_type, severity)
+    
+    # Run detection directly on the attacked array
+    result = decode_array(attacked)
+    
+    # Encode attacked image as PNG (base64 only for JSON responses)
+    _, buffer = cv2.imencode('.png', attacked)
+    
+    return result, _for_mode(buffer.tobytes(), mode)
+
+def _pipeline_sync(contents, attacks, stamp, strength, adaptive, include_stamped, include_attacked):
+    """Blocking part of /api/pipeline: decode upload once and run every attack."""
+    image = decode_upload(contents)
+    return run_pipeline(
+        image, attacks, stamp=stamp, strength=strength, adaptive=adaptive,
+        include_stamped=include_stamped, include_attacked=include_attacked
+    )
+
+def _sweep_sync(contents, attack_types, stamp, strength, adaptive, probes, tolerance, max_rounds):
+    """Blocking part of /api/sweep: decode upload once and search every attack type."""
+    image = decode_upload(contents)
+    return sweep_attacks(
+        image, attack_types, stamp=stamp, strength=strength, adaptive=adaptive,
+        probes=probes, tolerance=tolerance, max_rounds=max_rounds
+    )
+
 @app.get("/")
 def read_root():
     """Health check endpoint."""
@@ -33,12 +220,23 @@ def read_root():
         "message": "AI-PROOF API is running",
         "endpoints": {
             "stamp": "POST /api/stamp - Embed invisible watermark",
-            "detect": "POST /api/detect - Detect watermark and AI confidence"
+            "detect": "POST /api/detect - Detect watermark and AI confidence",
+            "pipeline": "POST /api/pipeline - Run the attack pipeline in one request",
+            "sweep": "POST /api/sweep - Find the breaking severity of each attack type"
         }
     }
 
 @app.post("/api/stamp")
-async def stamp_image(file: UploadFile = File(...), strength: float = 0.7, adaptive: bool = False):
+async def stamp_image(
+    request: Request,
+    file: UploadFile = File(...),
+    strength: float = 0.7,
+    adaptive: bool = False,
+    output_format: str = Query("png", alias="format"),
+    level: Optional[int] = None,
+    embed: Optional[str] = None,
+    response: Optional[str] = None
+):
     """
     Embed invisible watermark "AI-PROOF-v1" into an uploaded image.
     
@@ -46,129 +244,169 @@ async def stamp_image(file: UploadFile = File(...), strength: float = 0.7, adapt
         file: Image file to watermark
         strength: Watermark strength 0.0-1.0 (default 0.7, lower = less visible artifacts)
         adaptive: Apply variance-based masking to reduce artifacts in flat areas (default False)
+        format: Output format 'png' (default), 'webp' (lossless) or 'jpeg' (lossy)
+        level: PNG zlib compression 0-9, JPEG quality 1-100, or WebP quality
+            1-100 (lossy); defaults: PNG_COMPRESSION, JPEG_QUALITY, lossless
+        embed: 'resize', 'residual' or 'tiled' (default EMBED_MODE); see README
+        response: 'json' (default), 'binary' or 'multipart'; also negotiated
+            from the Accept header (image/png, multipart/mixed)
     
     Returns:
         JSON with:
-        - stamped_image: base64 encoded PNG
+        - stamped_image: base64 encoded image
         - watermark: "AI-PROOF-v1"
-        - format: "PNG"
+        - format: "PNG", "WEBP" or "JPEG"
         - strength: applied strength value
         - adaptive: whether adaptive masking was used
+        - embed: embedding mode used
+        - bytes: encoded image size
+        - encode_ms: time spent encoding (null when served from the cache)
+        In binary mode the image itself, with the other fields as X- headers;
+        in multipart mode a JSON part followed by the image.
     """
     try:
-        # Check if file is an image
-        if not file.content_type or "image" not in file.content_type:
-            raise HTTPException(status_code=400, detail="File must be an image")
-        
-        # Read file content
-        contents = await file.read()
-        
-        if not contents:
-            raise HTTPException(status_code=400, detail="File is empty")
-        
-        # Create temporary file with proper extension based on content type
-        # Determine file extension from content type
-        suffix = ".png"
-        if file.content_type:
-            if "jpeg" in file.content_type or "jpg" in file.content_type:
-                suffix = ".jpg"
-            elif "webp" in file.content_type:
-                suffix = ".webp"
-            elif "gif" in file.content_type:
-                suffix = ".gif"
+        mode = negotiate(request, response)
+        validate_output(output_format, level)
+        embed_mode = embed or config.EMBED_MODE
+        if embed_mode not in EMBED_MODES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Invalid embed mode '{embed_mode}', expected one of {', '.join(EMBED_MODES)}"
+            )
+        contents = await read_upload(file)
         
-        # Create and write temporary file, ensuring it's closed before reading
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-            tmp.write(contents)
-            tmp_path = tmp.name
+        # Decode and encode watermark off the event loop
+        stamped, size, encode_ms = await run_blocking(
+            _stamp_sync, contents, strength, adaptive, output_format, level, mode, embed_mode
+        )
         
-        try:
-            # Encode watermark into image
-            stamped_base64 = encode_image(tmp_path, secret="AI-PROOF-v1", strength=strength, adaptive=adaptive)
-            
-            return JSONResponse({
-                "stamped_image": stamped_base64,
+        extension, media_type = OUTPUT_FORMATS[output_format]
+        return image_response(
+            {
                 "watermark": "AI-PROOF-v1",
-                "format": "PNG",
+                "format": output_format.upper(),
                 "strength": strength,
                 "adaptive": adaptive,
+                "embed": embed_mode,
+                "bytes": size,
+                "encode_ms": encode_ms,
                 "status": "success"
-            })
-        finally:
-            # Clean up temporary file
-            if os.path.exists(tmp_path):
-                os.remove(tmp_path)
+            },
+            stamped, mode, filename=f"stamped{extension}", image_key="stamped_image", media_type=media_type
+        )
     
     except HTTPException:
         raise
+    except BUSY_ERRORS as e:
+        raise HTTPException(status_code=503, detail=f"Server busy: {str(e)}", headers={"Retry-After": "1"})
     except Exception as e:
-        print(f"Error in stamp endpoint: {str(e)}")
+        logger.exception("Error in stamp endpoint")
         raise HTTPException(status_code=500, detail=f"Error stamping image: {str(e)}")
 
 @app.post("/api/detect")
-async def detect_watermark(file: UploadFile = File(...)):
+async def detect_watermark(
+    request: Request,
+    file: UploadFile = File(...),
+    heatmap: bool = False,
+    defer_heatmap: bool = False,
+    search: bool = False,
+    response: Optional[str] = None
+):
     """
     Detect watermark and AI confidence in uploaded image.
     
+    Args:
+        file: Image file to check
+        heatmap: Include the frequency heatmap in the response (default False)
+        defer_heatmap: Without heatmap, keep the upload so the heatmap can be
+            fetched later from GET /api/heatmap/{result_id} (default False)
+        search: Also try crops, zoom-outs and rotations of the image (decoded
+            as one batch) and report the best-scoring view (default False)
+        response: 'json' (default), 'binary' or 'multipart'; binary and
+            multipart responses carry the heatmap PNG as the image, so
+            they need heatmap=true (without it the response is JSON)
+    
     Returns:
         JSON with:
         - detected: bool (watermark detected)
         - confidence: float (0.0-1.0, AI confidence)
         - payload: str or null (watermark data if detected)
-        - heatmap: base64 encoded frequency heatmap
+        - heatmap: base64 encoded frequency heatmap, or null unless requested
+        - result_id: str for GET /api/heatmap/{result_id} with defer_heatmap, else null
         - ai_generated: bool (true if high confidence watermark detected)
+        - view, views: with search, the best-scoring view and the score of every view
     """
     try:
-        # Check if file is an image
-        if not file.content_type or "image" not in file.content_type:
-            raise HTTPException(status_code=400, detail="File must be an image")
+        mode = negotiate(request, response)
+        if not heatmap:
+            # No heatmap, no image to send: don't render one just for the response mode
+            mode = 'json'
+        contents = await read_upload(file)
         
-        # Read file content
-        contents = await file.read()
+        # Decode watermark from image off the event loop
+        result = await run_blocking(_detect_sync, contents, heatmap, mode, search, defer_heatmap)
         
-        if not contents:
-            raise HTTPException(status_code=400, detail="File is empty")
-        
-        # Create temporary file with proper extension
-        suffix = ".png"
-        if file.content_type:
-            if "jpeg" in file.content_type or "jpg" in file.content_type:
-                suffix = ".jpg"
-            elif "webp" in file.content_type:
-                suffix = ".webp"
-            elif "gif" in file.content_type:
-                suffix = ".gif"
-        
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-            tmp.write(contents)
-            tmp_path = tmp.name
+        metadata = {
+            "detected": result['detected'],
+            "confidence": result['confidence'],
+            "payload": result['payload'],
+            "result_id": result['result_id'],
+            "ai_generated": result['detected'],  # True if watermark detected
+            "status": "success",
+            "message": "AI-generated image detected" if result['detected'] else "No watermark detected - likely human-created"
+        }
+        if search:
+            metadata['view'] = result['view']
+            metadata['views'] = result['views']
         
-        try:
-            # Decode watermark from image
-            result = decode_image(tmp_path)
-            
-            return JSONResponse({
-                "detected": result['detected'],
-                "confidence": result['confidence'],
-                "payload": result['payload'],
-                "heatmap": result['heatmap'],
-                "ai_generated": result['detected'],  # True if watermark detected
-                "status": "success",
-                "message": "AI-generated image detected" if result['detected'] else "No watermark detected - likely human-created"
-            })
-        finally:
-            # Clean up temporary file
-            if os.path.exists(tmp_path):
-                os.remove(tmp_path)
+        return image_response(
+            metadata,
+            result['heatmap'], mode, filename="heatmap.png", image_key="heatmap"
+        )
     
     except HTTPException:
         raise
+    except BUSY_ERRORS as e:
+        raise HTTPException(status_code=503, detail=f"Server busy: {str(e)}", headers={"Retry-After": "1"})
     except Exception as e:
-        print(f"Error in detect endpoint: {str(e)}")
+        logger.exception("Error in detect endpoint")
         raise HTTPException(status_code=500, detail=f"Error detecting watermark: {str(e)}")
 
+@app.get("/api/heatmap/{result_id}")
+async def get_heatmap(request: Request, result_id: str, response: Optional[str] = None):
+    """
+    Render the frequency heatmap for an earlier /api/detect result.
+    
+    Returns:
+        JSON with heatmap (base64 PNG), or the PNG itself in binary mode;
+        404 once the result has been evicted
+    """
+    mode = negotiate(request, response)
+    try:
+        heatmap = await run_blocking(render_deferred, result_id, mode != 'json')
+    except BUSY_ERRORS as e:
+        raise HTTPException(status_code=503, detail=f"Server busy: {str(e)}", headers={"Retry-After": "1"})
+    
+    if heatmap is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired result_id")
+    
+    return image_response(
+        {
+            "result_id": result_id,
+            "status": "success"
+        },
+        heatmap, mode, filename="heatmap.png", image_key="heatmap"
+    )
+
 @app.post("/api/attack")
-async def attack_image(file: UploadFile = File(...), attack_type: str = "jpeg", severity: float = 0.5):
+async def attack_image(
+    request: Request,
+    file: UploadFile = File(...),
+    attack_type: str = "jpeg",
+    severity: float = 0.5,
+    chain: Optional[str] = None,
+    response: Optional[str] = None
+):
     """
     Apply an attack transformation to an image and test watermark detection.
     
@@ -176,102 +414,269 @@ async def attack_image(file: UploadFile = File(...), attack_type: str = "jpeg",
         file: Image file to attack
         attack_type: Type of attack ('jpeg', 'resize', 'crop', 'blur', 'noise', 'rotate', 'brightness', 'format')
         severity: Attack intensity 0.0-1.0
+        chain: Attack chain applied left to right instead, e.g. "resize:0.25>jpeg:0.5"
+            (overrides attack_type and severity)
+        response: 'json' (default), 'binary' or 'multipart' (see /api/stamp)
     
     Returns:
         JSON with:
         - detected: bool (watermark detected after attack)
         - confidence: float (detection confidence)
         - attacked_image: base64 encoded attacked image
-        - attack_type: applied attack type
-        - severity: applied severity
+        - attack_type: applied attack type ('chain' for chains)
+        - severity: applied severity (the highest step severity for chains)
+        - chain: canonical chain spec (chains only)
         - description: human-readable attack description
     """
     try:
-        # Check if file is an image
-        if not file.content_type or "image" not in file.content_type:
-            raise HTTPException(status_code=400, detail="File must be an image")
-        
-        # Read file content
-        contents = await file.read()
-        
-        if not contents:
-            raise HTTPException(status_code=400, detail="File is empty")
+        mode = negotiate(request, response)
+        if chain:
+            try:
+                steps = parse_chain(chain)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            attack_type = 'chain'
+            severity = max(step_severity for _, step_severity in steps)
+            description = f"Chain attack: {format_chain(steps)}"
+        else:
+            if attack_type not in ATTACK_TYPES:
+                # Same check and message as parse_chain for chain steps
+                raise HTTPException(status_code=400, detail=f"Unknown attack type: {attack_type}")
+            steps = ((attack_type, severity),)
+            description = f"{attack_type.capitalize()} attack (severity: {severity:.2f})"
+        contents = await read_upload(file)
         
-        # Create temporary file with proper extension
-        suffix = ".png"
-        if file.content_type:
-            if "jpeg" in file.content_type or "jpg" in file.content_type:
-                suffix = ".jpg"
-            elif "webp" in file.content_type:
-                suffix = ".webp"
-            elif "gif" in file.content_type:
-                suffix = ".gif"
+        # Attack, detect and re-encode off the event loop
+        result, attacked = await run_blocking(_attack_sync, contents, steps, mode)
         
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-            tmp.write(contents)
-            tmp_path = tmp.name
+        fields = {
+            "detected": result['detected'],
+            "confidence": result['confidence'],
+            "attack_type": attack_type,
+            "severity": severity,
+            "description": description,
+            "status": "success"
+        }
+        if chain:
+            fields["chain"] = format_chain(steps)
+        return image_response(fields, attacked, mode, filename="attacked.png", image_key="attacked_image")
+    
+    except HTTPException:
+        raise
+    except BUSY_ERRORS as e:
+        raise HTTPException(status_code=503, detail=f"Server busy: {str(e)}", headers={"Retry-After": "1"})
+    except Exception as e:
+        logger.exception("Error in attack endpoint")
+        raise HTTPException(status_code=500, detail=f"Error in attack: {str(e)}")
+
+@app.post("/api/pipeline")
+async def attack_pipeline(
+    file: UploadFile = File(...),
+    attacks: Optional[str] = None,
+    stamp: bool = False,
+    strength: float = 0.7,
+    adaptive: bool = False,
+    include_stamped: bool = False,
+    include_attacked: bool = False,
+    stream: Optional[str] = None
+):
+    """
+    Run the robustness pipeline on one uploaded image in a single request.
+    
+    Args:
+        file: Image file to test
+        attacks: Comma-separated attack names, types or "type:severity" pairs (default: all predefined)
+        stamp: Embed the watermark before attacking (default False)
+        strength: Watermark strength used when stamping
+        adaptive: Adaptive masking used when stamping
+        include_stamped: Return the stamped image as base64 PNG
+        include_attacked: Return each attacked image as base64 PNG
+        stream: "ndjson" or "sse" to stream one record per attack as it finishes
+    
+    Returns:
+        When streaming: "start", one "result" (or "error") per attack, then "summary" records.
+        Otherwise JSON with:
+        - baseline: detection on the (stamped) image before any attack
+        - results: list of {name, type, severity, detected, confidence[, attacked_image]}
+        - summary: total, survived, robustness (0.0-1.0), avg_confidence
+        - stamped_image: base64 PNG (only with stamp and include_stamped)
+    """
+    try:
+        contents = await read_upload(file)
         
         try:
-            # Decode the image
-            nparr = np.frombuffer(contents, np.uint8)
-            image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            
-            if image is None:
-                raise ValueError("Failed to load image")
+            selected = select_attacks(attacks)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        if stream:
+            if stream not in STREAM_FORMATS:
+                raise HTTPException(status_code=400, detail=f"stream must be one of: {', '.join(STREAM_FORMATS)}")
             
-            # Apply the attack
-            attacked = ImageAttacks.apply_attack(image, attack_type, severity)
+            # One in-flight slot for the whole stream (503 when full), not just the decode
+            slot = get_executor().reserve()
+            try:
+                image = await slot.run(decode_upload, contents)
+            except BaseException:
+                slot.release()
+                raise
             
-            # Save attacked image temporarily for detection
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".png") as tmp_attacked:
-                cv2.imwrite(tmp_attacked.name, attacked)
-                attacked_path = tmp_attacked.name
+            async def events():
+                try:
+                    async for record in stream_pipeline(
+                        image, selected, stamp=stamp, strength=strength, adaptive=adaptive,
+                        include_stamped=include_stamped, include_attacked=include_attacked
+                    ):
+                        yield format_event(record, stream)
+                finally:
+                    slot.release()
             
-            try:
-                # Run detection on the attacked image
-                result = decode_image(attacked_path)
-                
-                # Encode attacked image as base64
-                _, buffer = cv2.imencode('.png', attacked)
-                attacked_base64 = base64.b64encode(buffer).decode('utf-8')
-                
-                return JSONResponse({
-                    "detected": result['detected'],
-                    "confidence": result['confidence'],
-                    "attacked_image": attacked_base64,
-                    "attack_type": attack_type,
-                    "severity": severity,
-                    "description": f"{attack_type.capitalize()} attack (severity: {severity:.2f})",
-                    "status": "success"
-                })
-            finally:
-                if os.path.exists(attacked_path):
-                    os.remove(attacked_path)
-        finally:
-            # Clean up temporary file
-            if os.path.exists(tmp_path):
-                os.remove(tmp_path)
+            return StreamingResponse(
+                events(),
+                media_type=STREAM_FORMATS[stream],
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+                # Also released if the stream never starts (client gone before the first byte)
+                background=BackgroundTask(slot.release)
+            )
+        
+        report = await run_blocking(
+            _pipeline_sync, contents, selected, stamp, strength, adaptive, include_stamped, include_attacked
+        )
+        
+        return JSONResponse({
+            **report,
+            "stamped": stamp,
+            "strength": strength,
+            "adaptive": adaptive,
+            "status": "success"
+        })
     
     except HTTPException:
         raise
+    except BUSY_ERRORS as e:
+        raise HTTPException(status_code=503, detail=f"Server busy: {str(e)}", headers={"Retry-After": "1"})
     except Exception as e:
-        print(f"Error in attack endpoint: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Error in attack: {str(e)}")
+        logger.exception("Error in pipeline endpoint")
+        raise HTTPException(status_code=500, detail=f"Error in pipeline: {str(e)}")
+
+@app.post("/api/sweep")
+async def severity_sweep(
+    file: UploadFile = File(...),
+    attacks: Optional[str] = None,
+    stamp: bool = False,
+    strength: float = 0.7,
+    adaptive: bool = False,
+    probes: int = Query(4, ge=2, le=16),
+    tolerance: float = Query(0.02, gt=0.0, le=1.0),
+    max_rounds: int = Query(8, ge=1, le=20)
+):
+    """
+    Find the severity at which each attack type stops the watermark being detected.
+    
+    Args:
+        file: Image file to test
+        attacks: Comma-separated attack types (default: all types)
+        stamp: Embed the watermark before attacking (default False)
+        strength: Watermark strength used when stamping
+        adaptive: Adaptive masking used when stamping
+        probes: Severities probed per attack type per round (2-16)
+        tolerance: Stop narrowing once the bracket is this wide
+        max_rounds: Maximum search rounds; each round is one batched decoder call
+    
+    Returns:
+        JSON with:
+        - baseline: detection on the (stamped) image before any attack
+        - results: per type {type, breaking_severity, bracket, survives, converged, curve}
+        - rounds, probes: decoder calls and attacked images used
+    """
+    try:
+        attack_types = [t.strip().lower() for t in attacks.split(',') if t.strip()] if attacks else None
+        contents = await read_upload(file)
+        
+        try:
+            report = await run_blocking(
+                _sweep_sync, contents, attack_types, stamp, strength, adaptive, probes, tolerance, max_rounds
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        return JSONResponse({
+            **report,
+            "stamped": stamp,
+            "strength": strength,
+            "adaptive": adaptive,
+            "status": "success"
+        })
+    
+    except HTTPException:
+        raise
+    except BUSY_ERRORS as e:
+        raise HTTPException(status_code=503, detail=f"Server busy: {str(e)}", headers={"Retry-After": "1"})
+    except Exception as e:
+        logger.exception("Error in sweep endpoint")
+        raise HTTPException(status_code=500, detail=f"Error in sweep: {str(e)}")
 
 @app.get("/api/attacks")
-def get_attacks():
-    """Get list of predefined attacks for the pipeline."""
+def get_attacks(include_chains: bool = False):
+    """Get list of predefined attacks for the pipeline (and the predefined attack chains)."""
+    return {
+        "attacks": get_predefined_attacks(include_chains),
+        "status": "success"
+    }
+
+@app.get("/api/stats")
+def get_stats():
+    """Get inference batching metrics (batch fill and queue wait), executor load and cache counters."""
+    cache = get_cache()
     return {
-        "attacks": get_predefined_attacks(),
+        "batching": get_batching_stats(),
+        "executor": get_executor().stats(),
+        "cache": cache.stats() if cache is not None else None,
+        "status": "success"
+    }
+
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus metrics: request counts/latency per endpoint, per-stage latency, batching, cache and detections."""
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.delete("/api/cache")
+def invalidate_cache():
+    """Drop every cached detect/stamp result (e.g. after swapping the model files)."""
+    cache = get_cache()
+    if cache is not None:
+        cache.invalidate()
+    return {
+        "cache": cache.stats() if cache is not None else None,
         "status": "success"
     }
 
 @app.get("/api/health")
 def health_check():
-    """Health check endpoint."""
+    """Health check endpoint; 503 until the model is loaded and warmed up, or while the model server is down."""
+    if not _readiness['ready']:
+        return JSONResponse(
+            status_code=503,
+            content={
+                "status": "unhealthy" if _readiness['error'] else "warming_up",
+                "service": "AI-PROOF API",
+                "error": _readiness['error']
+            }
+        )
+    model_server_error = check_model_server()
+    if model_server_error:
+        return JSONResponse(
+            status_code=503,
+            content={
+                "status": "unhealthy",
+                "service": "AI-PROOF API",
+                "error": model_server_error
+            }
+        )
     return {
         "status": "healthy",
-        "service": "AI-PROOF API"
+        "service": "AI-PROOF API",
+        "warmup": _readiness['warmup']
     }
 
 if __name__ == "__main__":
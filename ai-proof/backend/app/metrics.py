@@ -0,0 +1,210 @@
+"""
+Prometheus metrics for the API.
+A small in-process registry of counters, gauges and histograms rendered in
+the Prometheus text exposition format by GET /metrics. Besides per-endpoint
+request counts and latencies, every stage of a request (upload read, image
+decode, preprocess, session run, masking, resize back, output encode,
+base64, heatmap) is timed, so it shows which stage to scale.
+
+Metrics are per process: with several gunicorn workers each one reports
+its own numbers, and session runs are timed in the model server.
+"""
+
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets in seconds, from sub-millisecond stages to slow requests
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in pairs
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """Base for a labelled metric family."""
+
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._samples(key, value))
+        return lines
+
+    def _samples(self, key, value):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    """Monotonically increasing count."""
+
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """Value read at scrape time from a callback returning {label tuple: value}."""
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def render(self):
+        if self.callback is not None:
+            try:
+                values = self.callback()
+            except Exception:
+                values = {}
+            with self._lock:
+                self._values = {tuple(str(v) for v in key): value for key, value in values.items()}
+        return super().render()
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram with _bucket, _sum and _count series."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # Per-bucket (non-cumulative) counts, plus one for +Inf; sum
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def _samples(self, key, value):
+        counts, total = value
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, key, [('le', _format_value(float(bound)))])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Ordered collection of metrics rendered together."""
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """All metrics in the Prometheus text format (version 0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+# Starlette appends '; charset=utf-8'
+CONTENT_TYPE = 'text/plain; version=0.0.4'
+
+REQUESTS = REGISTRY.register(Counter(
+    'aiproof_http_requests_total', 'HTTP requests by endpoint, method and status code',
+    ('endpoint', 'method', 'status')
+))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'aiproof_http_request_duration_seconds', 'HTTP request latency by endpoint', ('endpoint', 'method')
+))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'aiproof_stage_duration_seconds', 'Latency of each processing stage', ('stage',)
+))
+BATCH_SIZE = REGISTRY.register(Histogram(
+    'aiproof_batch_size', 'Images per batched session call', ('batcher',), buckets=BATCH_SIZE_BUCKETS
+))
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    'aiproof_cache_requests_total', 'Result cache lookups by kind and result (hit or miss)', ('kind', 'result')
+))
+DETECTIONS = REGISTRY.register(Counter(
+    'aiproof_detections_total', 'Detection decisions by method and outcome', ('method', 'detected')
+))
+
+
+def register_gauge(name, documentation, labelnames, callback):
+    """Register a gauge whose values are read from callback() at scrape time."""
+    return REGISTRY.register(Gauge(name, documentation, labelnames, callback))
+
+
+@contextmanager
+def stage_timer(stage):
+    """Time the enclosed block into aiproof_stage_duration_seconds{stage=...}."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage)
+
+
+def timed(stage):
+    """Decorator timing every call of a function as a stage (see stage_timer)."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage_timer(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def render():
+    """Current metrics in the Prometheus text format."""
+    return REGISTRY.render()
@@ -0,0 +1,290 @@
+"""
+Shared model server for multi-process deployments.
+One process loads the StegaStamp model and serves preprocessed image batches
+over a Unix socket, so worker processes don't each hold a copy of the weights.
+Single images from all workers go through the server's micro-batchers and are
+batched together. Under gunicorn a supervisor restarts the server if it dies.
+
+Run standalone with:
+    MODEL_SERVER_ADDRESS=/tmp/ai-proof-model.sock MODEL_SERVER_AUTHKEY=... \\
+        python -m backend.app.model_server
+"""
+
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+
+from . import config
+from .batching import QueueFullError
+from .logs import configure_logging, get_logger
+
+logger = get_logger('model_server')
+
+
+class ModelServerError(RuntimeError):
+    """Raised when the model server cannot be reached or the connection drops."""
+
+
+class ModelClient:
+    """Client side of the model server, safe to share between threads."""
+
+    def __init__(self, address, authkey, connect_timeout=60.0):
+        """
+        Args:
+            address: Unix socket path of the model server
+            authkey: Shared secret for the connection handshake
+            connect_timeout: How long to wait for the server to come up
+        """
+        self.address = address
+        self.authkey = authkey.encode('utf-8')
+        self.connect_timeout = connect_timeout
+        # Idle connections; each call borrows one so threads never share a socket
+        self._idle = queue.LifoQueue()
+
+    def _connect(self):
+        deadline = time.monotonic() + self.connect_timeout
+        while True:
+            try:
+                return Client(self.address, family='AF_UNIX', authkey=self.authkey)
+            except (FileNotFoundError, ConnectionRefusedError) as e:
+                if time.monotonic() >= deadline:
+                    raise ModelServerError(f"Model server at {self.address} is not available: {e}")
+                time.sleep(0.2)
+
+    def call(self, op, payload=None):
+        """
+        Send one request and wait for the reply.
+
+        Raises:
+            QueueFullError: If the server's batching queue is full
+            ModelServerError: If the server is unreachable or reports an error
+        """
+        try:
+            conn = self._idle.get_nowait()
+            reused = True
+        except queue.Empty:
+            conn = self._connect()
+            reused = False
+
+        try:
+            conn.send((op, payload))
+            status, result = conn.recv()
+        except (EOFError, OSError) as e:
+            conn.close()
+            if not reused:
+                raise ModelServerError(f"Lost connection to model server: {e}")
+            # An idle connection to a server that has since been restarted:
+            # every other idle one is stale too, so drop them and retry once
+            self.close()
+            conn = self._connect()
+            try:
+                conn.send((op, payload))
+                status, result = conn.recv()
+            except (EOFError, OSError) as e:
+                conn.close()
+                raise ModelServerError(f"Lost connection to model server: {e}")
+
+        self._idle.put(conn)
+
+        if status == 'busy':
+            raise QueueFullError(result)
+        if status == 'error':
+            raise ModelServerError(result)
+        return result
+
+    def ping(self, timeout=2.0):
+        """
+        Check that the server answers, on a fresh connection and without
+        waiting for it to come up.
+
+        Returns:
+            The server's 'info' reply
+
+        Raises:
+            ModelServerError: If the server is down or doesn't answer within timeout
+        """
+        try:
+            with Client(self.address, family='AF_UNIX', authkey=self.authkey) as conn:
+                conn.send(('info', None))
+                if not conn.poll(timeout):
+                    raise ModelServerError(f"Model server at {self.address} did not answer within {timeout}s")
+                status, result = conn.recv()
+        except (EOFError, OSError, multiprocessing.AuthenticationError) as e:
+            raise ModelServerError(f"Model server at {self.address} is not available: {e}")
+        if status != 'ok':
+            raise ModelServerError(result)
+        return result
+
+    def close(self):
+        """Close all idle connections."""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+def _handle(wrapper, op, payload):
+    if op in ('encode', 'decode'):
+        return wrapper.run_head(op, payload)
+    if op == 'info':
+        return {'loaded': wrapper.session is not None, 'model_version': wrapper.model_version}
+    if op == 'stats':
+        return wrapper.batching_stats()
+    raise ValueError(f"Unknown model server operation: {op}")
+
+
+def _serve_connection(wrapper, conn):
+    """Answer requests from one client connection until it closes."""
+    with conn:
+        while True:
+            try:
+                op, payload = conn.recv()
+            except (EOFError, OSError):
+                return
+
+            try:
+                reply = ('ok', _handle(wrapper, op, payload))
+            except QueueFullError as e:
+                reply = ('busy', str(e))
+            except Exception as e:
+                reply = ('error', f"{type(e).__name__}: {e}")
+
+            try:
+                conn.send(reply)
+            except (EOFError, OSError):
+                return
+
+
+def serve(address, authkey):
+    """Load and warm up the model, then serve clients on a Unix socket forever."""
+    from .stegastamp import StegaStampWrapper
+
+    if not authkey:
+        raise ValueError("MODEL_SERVER_AUTHKEY must be set")
+
+    configure_logging()
+    wrapper = StegaStampWrapper(config.STEGASTAMP_MODEL_PATH)
+    if config.WARMUP_ENABLED:
+        wrapper.warmup(config.WARMUP_BATCH_SIZES)
+
+    if os.path.exists(address):
+        os.remove(address)
+    listener = Listener(address, family='AF_UNIX', authkey=authkey.encode('utf-8'))
+    os.chmod(address, 0o600)
+    logger.info("Model server listening", extra={'address': address, 'model_version': wrapper.model_version})
+
+    try:
+        while True:
+            try:
+                conn = listener.accept()
+            except (OSError, multiprocessing.AuthenticationError) as e:
+                logger.warning("Model server rejected a connection", extra={'error': str(e)})
+                continue
+            threading.Thread(target=_serve_connection, args=(wrapper, conn), daemon=True).start()
+    finally:
+        listener.close()
+        wrapper.close()
+
+
+def start_model_server(address, authkey):
+    """
+    Start the model server in a fresh interpreter.
+
+    Spawned rather than forked, so no TensorFlow state is inherited from (or
+    created in) the parent.
+
+    Returns:
+        The started multiprocessing.Process
+    """
+    process = multiprocessing.get_context('spawn').Process(
+        target=serve, args=(address, authkey), name="ai-proof-model-server"
+    )
+    process.start()
+    return process
+
+
+def _running(process):
+    """Whether a model server process is still running."""
+    if not process.is_alive():
+        return False
+    try:
+        # is_alive() can't tell once another waitpid() has reaped the child,
+        # and gunicorn's arbiter reaps every child it is signalled about
+        os.kill(process.pid, 0)
+    except ProcessLookupError:
+        return False
+    return True
+
+
+class ModelServerSupervisor:
+    """Keeps a model server running, restarting it whenever it exits."""
+
+    def __init__(self, address, authkey, interval=1.0, max_backoff=30.0):
+        """
+        Args:
+            address: Unix socket path of the model server
+            authkey: Shared secret for the connection handshake
+            interval: Seconds between liveness checks
+            max_backoff: Longest wait before a restart when the server keeps dying
+        """
+        self.address = address
+        self.authkey = authkey
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self.process = None
+        self.restarts = 0
+        self._started_at = None
+        self._stopping = threading.Event()
+        self._thread = None
+
+    @property
+    def pid(self):
+        return self.process.pid if self.process is not None else None
+
+    def start(self):
+        """Start the server and the monitor thread; returns self."""
+        self._spawn()
+        self._thread = threading.Thread(target=self._monitor, name="ai-proof-model-supervisor", daemon=True)
+        self._thread.start()
+        return self
+
+    def _spawn(self):
+        self.process = start_model_server(self.address, self.authkey)
+        self._started_at = time.monotonic()
+
+    def _monitor(self):
+        backoff = self.interval
+        while not self._stopping.wait(self.interval):
+            if _running(self.process):
+                continue
+
+            # Crash loop (e.g. a model that fails to load): back off between restarts
+            if time.monotonic() - self._started_at < 60.0:
+                backoff = min(backoff * 2, self.max_backoff)
+            else:
+                backoff = self.interval
+            logger.warning("Model server exited, restarting", extra={
+                'pid': self.process.pid, 'exitcode': self.process.exitcode, 'restart_in': backoff
+            })
+            if self._stopping.wait(backoff):
+                return
+            self._spawn()
+            self.restarts += 1
+            logger.info("Restarted model server", extra={'pid': self.process.pid, 'restarts': self.restarts})
+
+    def stop(self, timeout=10):
+        """Stop supervising and terminate the server."""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+        if self.process is not None:
+            self.process.terminate()
+            self.process.join(timeout=timeout)
+
+
+if __name__ == "__main__":
+    serve(config.MODEL_SERVER_ADDRESS, config.MODEL_SERVER_AUTHKEY)
@@ -0,0 +1,388 @@
+"""
+Server-side robustness pipeline.
+Takes one image, optionally stamps it, applies a set of attacks (or attack
+chains, sharing common prefixes) in parallel and decodes every attacked variant
+with a single batched decoder call. A streaming variant emits one record per
+attack as soon as it finishes. A severity sweep finds, per attack type, the
+severity at which detection breaks, decoding each round of probes in one call.
+"""
+
+import asyncio
+import base64
+import functools
+import itertools
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+from . import config
+from .attacks import (
+    ATTACK_TYPES, CHAIN_SEPARATOR, AttackEngine, ImageAttacks, attack_steps, format_chain, get_predefined_attacks,
+    parse_chain
+)
+from .stegastamp import stamp_array, decode_array, decode_arrays
+
+# Media types for the streaming formats accepted by stream_pipeline
+STREAM_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'sse': 'text/event-stream',
+}
+
+# Separate from the request executor so pipeline requests never wait on themselves
+_attack_pool = ThreadPoolExecutor(max_workers=config.ATTACK_WORKERS, thread_name_prefix="ai-proof-attack")
+
+_engine = AttackEngine()
+
+# Severity ranges searched by sweep_attacks where the attack doesn't simply
+# get stronger from 0.0 to 1.0: rotate goes from -15 degrees through 0 (0.5)
+# to +15 degrees
+SWEEP_RANGES = {'rotate': (0.5, 1.0)}
+
+
+def select_attacks(spec=None):
+    """
+    Resolve an attack selection into attack configs.
+
+    Args:
+        spec: Comma-separated tokens, each one of: a predefined attack or
+            chain name ("JPEG 90"), an attack type selecting all its
+            predefined variants ("crop", or "chain" for every predefined
+            chain), a custom "type:severity" pair ("blur:0.4") or a custom
+            chain of them ("resize:0.25>jpeg:0.5").
+            None or empty selects every predefined single attack.
+
+    Returns:
+        List of dicts with 'name', 'type', 'severity' keys (and 'chain' for chains)
+
+    Raises:
+        ValueError: If a token matches nothing
+    """
+    if not spec:
+        return get_predefined_attacks()
+    predefined = get_predefined_attacks(include_chains=True)
+
+    selected = []
+    for token in (t.strip() for t in spec.split(',')):
+        if not token:
+            continue
+
+        by_name = [a for a in predefined if a['name'].lower() == token.lower()]
+        by_type = [a for a in predefined if a['type'] == token.lower()]
+
+        if by_name:
+            selected.extend(by_name)
+        elif by_type:
+            selected.extend(by_type)
+        elif CHAIN_SEPARATOR in token or ':' in token:
+            steps = parse_chain(token)
+            names = [f"{attack_type.capitalize()} {severity:.2f}" for attack_type, severity in steps]
+            if len(steps) == 1:
+                (attack_type, severity), = steps
+                selected.append({'name': names[0], 'type': attack_type, 'severity': severity})
+            else:
+                selected.append({
+                    'name': ' > '.join(names),
+                    'type': 'chain',
+                    'severity': max(severity for _, severity in steps),
+                    'chain': format_chain(steps)
+                })
+        else:
+            raise ValueError(f"Unknown attack: {token}")
+
+    return selected
+
+
+def _encode_png_base64(image):
+    """Encode a BGR array as base64 PNG."""
+    _, buffer = cv2.imencode('.png', image)
+    return base64.b64encode(buffer).decode('utf-8')
+
+
+def run_pipeline(image, attacks, stamp=False, strength=0.7, adaptive=False,
+                 include_stamped=False, include_attacked=False):
+    """
+    Run a set of attacks against one image and detect the watermark in each result.
+
+    Args:
+        image: BGR uint8 numpy array
+        attacks: List of attack configs (see select_attacks)
+        stamp: Embed the watermark before attacking
+        strength: Watermark strength used when stamping
+        adaptive: Adaptive masking used when stamping
+        include_stamped: Return the stamped image as base64 PNG
+        include_attacked: Return every attacked image as base64 PNG
+
+    Returns:
+        Dict with 'baseline' (detection on the unattacked image), 'results'
+        (one row per attack), 'summary' and optionally 'stamped_image'
+    """
+    if stamp:
+        image = stamp_array(image, strength=strength, adaptive=adaptive)
+
+    # Chains starting with the same steps share those intermediate images
+    attacked = [
+        images[0] for images in
+        _engine.apply_chains([image], [attack_steps(attack) for attack in attacks], executor=_attack_pool)
+    ]
+
+    # Unattacked image first, then every variant: one decoder call for all of them
+    detections = decode_arrays([image] + attacked)
+    baseline, detections = detections[0], detections[1:]
+
+    results = [
+        _describe(attack, {'detected': detection['detected'], 'confidence': detection['confidence']})
+        for attack, detection in zip(attacks, detections)
+    ]
+
+    if include_attacked:
+        for row, encoded in zip(results, _attack_pool.map(_encode_png_base64, attacked)):
+            row['attacked_image'] = encoded
+
+    total = len(results)
+    survived = sum(1 for r in results if r['detected'])
+    report = {
+        'baseline': {
+            'detected': baseline['detected'],
+            'confidence': baseline['confidence']
+        },
+        'results': results,
+        'summary': {
+            'total': total,
+            'survived': survived,
+            'robustness': survived / total if total else 0.0,
+            'avg_confidence': sum(r['confidence'] for r in results) / total if total else 0.0
+        }
+    }
+
+    if stamp and include_stamped:
+        report['stamped_image'] = _encode_png_base64(image)
+
+    return report
+
+
+def _describe(attack, fields, event=None, index=None):
+    """Result row for an attack: its name, type, severity (and chain), then fields."""
+    row = {} if event is None else {'event': event, 'index': index}
+    row.update(name=attack['name'], type=attack['type'], severity=attack['severity'])
+    if attack.get('chain'):
+        row['chain'] = attack['chain']
+    row.update(fields)
+    return row
+
+
+def _attack_and_detect(image, index, attack, include_attacked):
+    """Apply one attack (or chain) and detect on the result; the attacked image is dropped unless requested."""
+    try:
+        # Attacks finish independently here, so chains don't share prefixes
+        attacked = image
+        for attack_type, severity in attack_steps(attack):
+            attacked = ImageAttacks.apply_attack(attacked, attack_type, severity)
+        # Goes through the decoder micro-batcher, so concurrent attacks share session calls
+        detection = decode_array(attacked, heatmap=False)
+    except Exception as e:
+        return _describe(attack, {'detail': str(e)}, 'error', index)
+
+    row = _describe(attack, {'detected': detection['detected'], 'confidence': detection['confidence']},
+                    'result', index)
+    if include_attacked:
+        row['attacked_image'] = _encode_png_base64(attacked)
+    return row
+
+
+async def stream_pipeline(image, attacks, stamp=False, strength=0.7, adaptive=False,
+                          include_stamped=False, include_attacked=False):
+    """
+    Run the pipeline and yield one record per attack as it completes.
+
+    At most ATTACK_WORKERS attacks are submitted at a time, so at most that
+    many attacked images exist; each one is released as soon as its record
+    has been built. The caller should hold an executor slot (see
+    BoundedExecutor.reserve) for the whole stream, so streams count against
+    MAX_INFLIGHT_REQUESTS like any other request.
+
+    Args:
+        Same as run_pipeline
+
+    Yields:
+        A 'start' record (total, baseline[, stamped_image]), then one 'result'
+        (or 'error') record per attack in completion order, then a 'summary'
+    """
+    loop = asyncio.get_running_loop()
+
+    if stamp:
+        image = await loop.run_in_executor(
+            _attack_pool, functools.partial(stamp_array, image, strength=strength, adaptive=adaptive)
+        )
+
+    baseline = await loop.run_in_executor(_attack_pool, functools.partial(decode_array, image, heatmap=False))
+
+    start = {
+        'event': 'start',
+        'total': len(attacks),
+        'stamped': stamp,
+        'baseline': {
+            'detected': baseline['detected'],
+            'confidence': baseline['confidence']
+        }
+    }
+    if stamp and include_stamped:
+        start['stamped_image'] = await loop.run_in_executor(_attack_pool, _encode_png_base64, image)
+    yield start
+
+    # Submit at most ATTACK_WORKERS attacks at a time, the next one as each
+    # finishes, so a long stream never floods the shared attack pool
+    queued = enumerate(attacks)
+    running = set()
+    completed = 0
+    survived = 0
+    confidence_total = 0.0
+    try:
+        while True:
+            for index, attack in itertools.islice(queued, config.ATTACK_WORKERS - len(running)):
+                running.add(loop.run_in_executor(
+                    _attack_pool, _attack_and_detect, image, index, attack, include_attacked
+                ))
+            if not running:
+                break
+            done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                row = future.result()
+                if row['event'] == 'result':
+                    completed += 1
+                    survived += row['detected']
+                    confidence_total += row['confidence']
+                yield row
+    finally:
+        # Client went away: don't keep attacking for nobody
+        for future in running:
+            future.cancel()
+
+    yield {
+        'event': 'summary',
+        'summary': {
+            'total': len(attacks),
+            'completed': completed,
+            'survived': survived,
+            'robustness': survived / completed if completed else 0.0,
+            'avg_confidence': confidence_total / completed if completed else 0.0
+        }
+    }
+
+
+def _sweep_probes(low, high, count, include_ends):
+    """count severities evenly spaced inside (low, high), or spanning [low, high] with include_ends."""
+    if include_ends:
+        return [low + (high - low) * i / (count - 1) for i in range(count)] if count > 1 else [high]
+    return [low + (high - low) * i / (count + 1) for i in range(1, count + 1)]
+
+
+def sweep_attacks(image, attack_types=None, stamp=False, strength=0.7, adaptive=False,
+                  probes=4, tolerance=0.02, max_rounds=8):
+    """
+    Find the severity at which each attack type breaks detection.
+    
+    Every round probes `probes` severities per unresolved attack type inside
+    its current bracket [last detected, first missed], then narrows the
+    bracket to the probes on either side of the first miss: a k-ary search
+    that assumes detection mostly weakens as severity grows. All probes of
+    a round, across attack types, go through one batched decoder call.
+    
+    Args:
+        image: BGR uint8 numpy array
+        attack_types: Attack types to sweep (default: all of ATTACK_TYPES)
+        stamp, strength, adaptive: Embed the watermark first (see run_pipeline)
+        probes: Severities probed per attack type per round (the first round
+            probes both ends of the range, so it needs at least 2)
+        tolerance: Stop once the bracket is this narrow
+        max_rounds: Upper bound on rounds (decoder calls)
+    
+    Returns:
+        Dict with 'baseline', 'results' (per attack type: breaking_severity,
+        the bracket, whether it survives its whole range and the confidence
+        curve of every probe) and 'rounds'/'probes' counts
+    """
+    attack_types = list(attack_types or ATTACK_TYPES)
+    unknown = [t for t in attack_types if t not in ATTACK_TYPES]
+    if unknown:
+        raise ValueError(f"Unknown attack type: {unknown[0]}")
+    if probes < 2:
+        raise ValueError("At least 2 probes per round are needed")
+    
+    if stamp:
+        image = stamp_array(image, strength=strength, adaptive=adaptive)
+    
+    searches = {}
+    for attack_type in attack_types:
+        low, high = SWEEP_RANGES.get(attack_type, (0.0, 1.0))
+        searches[attack_type] = {'low': low, 'high': high, 'curve': {}, 'resolved': False, 'broken': False}
+    
+    baseline = None
+    rounds = 0
+    while rounds < max_rounds:
+        pending = [
+            (attack_type, severity)
+            for attack_type, search in searches.items() if not search['resolved']
+            for severity in _sweep_probes(search['low'], search['high'], probes, include_ends=rounds == 0)
+        ]
+        if not pending:
+            break
+        
+        attacked = list(_attack_pool.map(lambda probe: _engine.attack([image], *probe)[0], pending))
+        # One decoder call per round; the first one also scores the unattacked image
+        detections = decode_arrays(attacked if baseline else [image] + attacked)
+        if baseline is None:
+            baseline, detections = detections[0], detections[1:]
+        rounds += 1
+        
+        for (attack_type, severity), detection in zip(pending, detections):
+            searches[attack_type]['curve'][severity] = detection
+        
+        for attack_type, search in searches.items():
+            if search['resolved']:
+                continue
+            curve = search['curve']
+            missed = [severity for severity in sorted(curve) if not curve[severity]['detected']]
+            if not missed:
+                # Detected across the whole range (first round)
+                search['resolved'] = True
+                continue
+            search['broken'] = True
+            search['high'] = missed[0]
+            search['low'] = max(
+                (severity for severity in curve if severity < missed[0]),
+                default=SWEEP_RANGES.get(attack_type, (0.0, 1.0))[0]
+            )
+            if search['high'] - search['low'] <= tolerance:
+                search['resolved'] = True
+    
+    results = []
+    for attack_type, search in searches.items():
+        curve = search['curve']
+        results.append({
+            'type': attack_type,
+            'breaking_severity': search['high'] if search['broken'] else None,
+            'bracket': [search['low'], search['high']] if search['broken'] else None,
+            'survives': not search['broken'],
+            'converged': search['resolved'],
+            'curve': [
+                {'severity': severity, 'detected': curve[severity]['detected'],
+                 'confidence': curve[severity]['confidence']}
+                for severity in sorted(curve)
+            ]
+        })
+    
+    return {
+        'baseline': {'detected': baseline['detected'], 'confidence': baseline['confidence']} if baseline else None,
+        'results': results,
+        'rounds': rounds,
+        'probes': sum(len(search['curve']) for search in searches.values())
+    }
+
+
+def format_event(record, stream_format):
+    """Serialize one pipeline record as an NDJSON line or a Server-Sent Event."""
+    data = json.dumps(record)
+    if stream_format == 'sse':
+        return f"event: {record['event']}\ndata: {data}\n\n"
+    return data + "\n"
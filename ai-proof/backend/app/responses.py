@@ -0,0 +1,113 @@
+"""
+Content negotiation for endpoints that return an image.
+Besides the default JSON body with a base64 image, clients can ask for the
+raw image bytes (metadata in X- headers) or a multipart/mixed body holding a
+JSON part and the image, which avoids the base64 inflation and extra copies.
+"""
+
+import json
+import uuid
+
+from fastapi import HTTPException, Request
+from fastapi.responses import JSONResponse, Response
+
+RESPONSE_MODES = ('json', 'binary', 'multipart')
+
+# Accept media types mapped to response modes
+_ACCEPT_MODES = {
+    'application/json': 'json',
+    'image/png': 'binary',
+    'multipart/mixed': 'multipart',
+}
+
+
+def negotiate(request: Request, response=None):
+    """
+    Pick the response mode for a request.
+
+    Args:
+        request: Incoming request (its Accept header is used)
+        response: Explicit ?response= override ('json', 'binary' or 'multipart')
+
+    Returns:
+        One of RESPONSE_MODES; 'json' unless the client asked otherwise
+
+    Raises:
+        HTTPException: 400 for an unknown ?response= value
+    """
+    if response:
+        if response not in RESPONSE_MODES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Invalid response mode '{response}', expected one of {', '.join(RESPONSE_MODES)}"
+            )
+        return response
+
+    ranked = []
+    for position, part in enumerate(request.headers.get('accept', '').split(',')):
+        media_type, *params = [p.strip() for p in part.split(';')]
+        quality = 1.0
+        for param in params:
+            if param.startswith('q='):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    pass
+        if media_type in _ACCEPT_MODES and quality > 0:
+            # Highest quality first, then the order the client listed them in
+            ranked.append((-quality, position, _ACCEPT_MODES[media_type]))
+
+    return min(ranked)[2] if ranked else 'json'
+
+
+def metadata_headers(metadata):
+    """Map a metadata dict to X- headers ('result_id' -> 'X-Result-Id'); None values are left out, lists/dicts are JSON."""
+    headers = {}
+    for key, value in metadata.items():
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            value = 'true' if value else 'false'
+        elif isinstance(value, (list, dict)):
+            value = json.dumps(value, separators=(',', ':'))
+        name = 'X-' + '-'.join(word.capitalize() for word in key.split('_'))
+        headers[name] = str(value)
+
+    # Let browser clients read them across origins
+    headers['Access-Control-Expose-Headers'] = ', '.join(headers)
+    return headers
+
+
+def image_response(metadata, image, mode, filename, image_key, media_type='image/png'):
+    """
+    Build the response for an endpoint that returns one image.
+
+    Args:
+        metadata: JSON-serializable fields describing the result
+        image: Encoded image; bytes for 'binary'/'multipart', base64 str for 'json'
+        mode: Response mode from negotiate()
+        filename: File name suggested for the image
+        image_key: Field holding the base64 image in JSON mode
+        media_type: Media type of the image
+    """
+    if mode == 'json':
+        return JSONResponse({image_key: image, **metadata})
+
+    disposition = f'inline; filename="{filename}"'
+
+    if mode == 'binary':
+        return Response(
+            content=image,
+            media_type=media_type,
+            headers={**metadata_headers(metadata), 'Content-Disposition': disposition}
+        )
+
+    boundary = uuid.uuid4().hex
+    body = b''.join([
+        f'--{boundary}\r\nContent-Type: application/json\r\n\r\n'.encode('utf-8'),
+        json.dumps(metadata).encode('utf-8'),
+        f'\r\n--{boundary}\r\nContent-Type: {media_type}\r\nContent-Disposition: {disposition}\r\n\r\n'.encode('utf-8'),
+        image,
+        f'\r\n--{boundary}--\r\n'.encode('utf-8'),
+    ])
+    return Response(content=body, media_type=f'multipart/mixed; boundary={boundary}')
@@ -0,0 +1,85 @@
+"""
+Candidate views for the multi-view detection search.
+A view is one 400x400 decoder input taken from an image: a crop, a zoom-out
+or a rotation, each rendered with a single affine warp straight from the
+full-resolution image. Together they cover the crop, resize and rotate
+attacks, and the whole set is decoded in one batch.
+"""
+
+import math
+
+import cv2
+import numpy as np
+
+# (name, center x, center y, scale, angle)
+# center: view center as a fraction of the width/height
+# scale: fraction of the frame the view covers; < 1 crops in, > 1 zooms
+#        out (the missing border is reflected), undoing a center crop
+# angle: rotation in degrees, undoing a `rotate` attack of the same angle
+DEFAULT_VIEWS = (
+    ('full', 0.5, 0.5, 1.0, 0.0),
+    ('center-90', 0.5, 0.5, 0.9, 0.0),
+    ('center-75', 0.5, 0.5, 0.75, 0.0),
+    ('top-left-75', 0.375, 0.375, 0.75, 0.0),
+    ('top-right-75', 0.625, 0.375, 0.75, 0.0),
+    ('bottom-left-75', 0.375, 0.625, 0.75, 0.0),
+    ('bottom-right-75', 0.625, 0.625, 0.75, 0.0),
+    ('uncrop-85', 0.5, 0.5, 1 / 0.85, 0.0),
+    ('uncrop-70', 0.5, 0.5, 1 / 0.7, 0.0),
+    ('rotate-15', 0.5, 0.5, 1.0, -15.0),
+    ('rotate-10', 0.5, 0.5, 1.0, -10.0),
+    ('rotate-5', 0.5, 0.5, 1.0, -5.0),
+    ('rotate+5', 0.5, 0.5, 1.0, 5.0),
+    ('rotate+10', 0.5, 0.5, 1.0, 10.0),
+    ('rotate+15', 0.5, 0.5, 1.0, 15.0),
+)
+
+
+def view_transform(width, height, center_x, center_y, scale, angle, size=400):
+    """
+    Affine map from view pixels to image pixels (for WARP_INVERSE_MAP).
+
+    The full view (centered, scale 1, angle 0) samples exactly like
+    cv2.resize to size x size.
+
+    Returns:
+        2x3 float32 matrix
+    """
+    radians = math.radians(angle)
+    cos, sin = math.cos(radians), math.sin(radians)
+    # Same orientation as cv2.getRotationMatrix2D, so a view with angle `a`
+    # lines up with an image rotated by `a` degrees
+    rotation = np.array([[cos, sin], [-sin, cos]])
+    linear = rotation @ np.diag([scale * width / size, scale * height / size])
+
+    # View pixel centres around (size - 1) / 2 map to image pixel centres
+    # around the view center
+    view_center = np.full(2, (size - 1) / 2.0)
+    image_center = np.array([center_x * width - 0.5, center_y * height - 0.5])
+    offset = image_center - linear @ view_center
+    return np.hstack([linear, offset[:, None]]).astype(np.float32)
+
+
+def render_views(image, views=None, size=400):
+    """
+    Render the candidate views of a BGR image as one decoder batch.
+
+    Args:
+        image: BGR uint8 numpy array
+        views: View specs (default: DEFAULT_VIEWS)
+        size: Output side length
+
+    Returns:
+        (names, (N, size, size, 3) float32 RGB batch normalized to [0,1])
+    """
+    views = views or DEFAULT_VIEWS
+    h, w = image.shape[:2]
+    batch = np.empty((len(views), size, size, 3), dtype=np.float32)
+    for i, (_, center_x, center_y, scale, angle) in enumerate(views):
+        view = cv2.warpAffine(
+            image, view_transform(w, h, center_x, center_y, scale, angle, size), (size, size),
+            flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP, borderMode=cv2.BORDER_REFLECT
+        )
+        batch[i] = cv2.cvtColor(view, cv2.COLOR_BGR2RGB)
+    batch /= 255.0
+    return [view[0] for view in views], batch
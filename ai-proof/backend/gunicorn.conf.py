@@ -0,0 +1,56 @@
+"""
+Gunicorn settings for running the API with several worker processes.
+
+    gunicorn -c backend/gunicorn.conf.py backend.app.main:app
+
+With more than one worker (WEB_CONCURRENCY), the StegaStamp model is loaded
+once, in a separate model server process, and workers send it preprocessed
+images over a Unix socket. The weights therefore exist once however many
+workers run, and concurrent requests from all workers are micro-batched
+together. Decoding, resizing, PNG encoding and base64 run in the workers.
+The master restarts the model server if it dies; until it is back,
+/api/health returns 503.
+
+The app is preloaded so TensorFlow, OpenCV and NumPy are imported once and
+shared copy-on-write; no TensorFlow session exists before the fork (sessions
+are not fork-safe, which is why the weights live in the model server rather
+than being loaded before forking).
+"""
+
+import os
+import secrets
+import tempfile
+
+workers = int(os.getenv("WEB_CONCURRENCY", 1))
+worker_class = "uvicorn.workers.UvicornWorker"
+bind = f"{os.getenv('API_HOST', '0.0.0.0')}:{os.getenv('API_PORT', '8000')}"
+preload_app = os.getenv("PRELOAD_APP", "true").lower() in ("1", "true", "yes")
+# Model load and warmup happen after the worker has booted
+timeout = int(os.getenv("WORKER_TIMEOUT", 120))
+graceful_timeout = 30
+
+if workers > 1:
+    # Read by backend.app.config, which the preload imports after this file runs
+    os.environ.setdefault(
+        "MODEL_SERVER_ADDRESS",
+        os.path.join(tempfile.gettempdir(), f"ai-proof-model-{os.getpid()}.sock")
+    )
+    os.environ.setdefault("MODEL_SERVER_AUTHKEY", secrets.token_hex(16))
+
+_model_server = None
+
+
+def on_starting(server):
+    global _model_server
+    if workers > 1:
+        from backend.app.model_server import ModelServerSupervisor
+        # Restarted by a monitor thread in the master if it ever exits
+        _model_server = ModelServerSupervisor(
+            os.environ["MODEL_SERVER_ADDRESS"], os.environ["MODEL_SERVER_AUTHKEY"]
+        ).start()
+        server.log.info("Started model server (pid %s) on %s", _model_server.pid, os.environ["MODEL_SERVER_ADDRESS"])
+
+
+def on_exit(server):
+    if _model_server is not None:
+        _model_server.stop()
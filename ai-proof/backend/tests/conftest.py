@@ -0,0 +1,19 @@
+"""
+Shared setup for the backend unit tests.
+
+The tests run in simulation mode: no model, no server, no network.
+Run from the repository root with:
+
+    python -m pytest backend/tests
+"""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, ROOT)
+
+# Read by backend.app.config at import time, so set before any test imports the app
+os.environ['STEGASTAMP_MODEL_PATH'] = os.path.join(ROOT, 'backend', 'tests', 'no-model')
+os.environ.setdefault('CACHE_DISK_DIR', '')
+os.environ.setdefault('WARMUP_ENABLED', 'false')
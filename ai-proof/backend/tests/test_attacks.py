@@ -0,0 +1,107 @@
+"""Attack chains: parsing, and apply_chains prefix sharing against independent application."""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from backend.app.attacks import AttackEngine, ImageAttacks, count_chain_nodes, format_chain, parse_chain
+
+CHAINS = [
+    parse_chain(spec) for spec in (
+        'resize:0.5',
+        'resize:0.5>jpeg:0.3',
+        'resize:0.5>jpeg:0.3>blur:0.2',
+        'resize:0.5>blur:0.4',
+        'crop:0.2>jpeg:0.3',
+        'jpeg:0.3',
+        'brightness:0.5>rotate:0.7',
+    )
+]
+
+
+@pytest.fixture
+def images():
+    rng = np.random.default_rng(0)
+    return rng.integers(0, 256, (3, 48, 64, 3), dtype=np.uint8)
+
+
+def apply_independently(images, steps):
+    attacked = []
+    for image in images:
+        for attack_type, severity in steps:
+            image = ImageAttacks.apply_attack(image, attack_type, severity)
+        attacked.append(image)
+    return np.stack(attacked)
+
+
+def test_parse_and_format_chain_round_trip():
+    steps = parse_chain(' Resize:0.25 > jpeg:.5 ')
+
+    assert steps == (('resize', 0.25), ('jpeg', 0.5))
+    assert parse_chain(format_chain(steps)) == steps
+
+
+@pytest.mark.parametrize('spec', ['', 'resize', 'resize:abc', 'resize:1.5', 'bogus:0.2', 'resize:0.2>>jpeg:0.5'])
+def test_parse_chain_rejects_bad_specs(spec):
+    with pytest.raises(ValueError):
+        parse_chain(spec)
+
+
+def test_chains_match_independent_application(images):
+    results = AttackEngine(seed=0).apply_chains(images, CHAINS)
+
+    assert len(results) == len(CHAINS)
+    for steps, attacked in zip(CHAINS, results):
+        np.testing.assert_array_equal(attacked, apply_independently(images, steps))
+
+
+def test_shared_prefixes_are_computed_once(images, monkeypatch):
+    calls = []
+    attack = AttackEngine._attack
+
+    def counting(images, attack_type, severity, rng):
+        calls.append((attack_type, severity))
+        return attack(images, attack_type, severity, rng)
+
+    monkeypatch.setattr(AttackEngine, '_attack', staticmethod(counting))
+    AttackEngine(seed=0).apply_chains(images, CHAINS)
+
+    # resize:0.5 is shared by four chains, resize:0.5>jpeg:0.3 by two
+    assert len(calls) == count_chain_nodes(CHAINS) == 9
+    assert calls.count(('resize', 0.5)) == 1
+    assert len(calls) < sum(len(steps) for steps in CHAINS)
+
+
+def test_executor_gives_the_same_results(images):
+    serial = AttackEngine(seed=0).apply_chains(images, CHAINS)
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        parallel = AttackEngine(seed=0).apply_chains(images, CHAINS, executor=pool)
+
+    for a, b in zip(serial, parallel):
+        np.testing.assert_array_equal(a, b)
+
+
+def test_seeded_noise_chains_are_reproducible_with_an_executor(images):
+    chains = [parse_chain(spec) for spec in ('noise:0.5', 'blur:0.3>noise:0.5', 'resize:0.5>noise:0.8', 'noise:0.9')]
+    reference = AttackEngine(seed=7).apply_chains(images, chains)
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        for _ in range(5):
+            results = AttackEngine(seed=7).apply_chains(images, chains, executor=pool)
+            for a, b in zip(reference, results):
+                np.testing.assert_array_equal(a, b)
+
+
+def test_empty_chain_returns_the_images(images):
+    results = AttackEngine().apply_chains(images, [(), (('jpeg', 0.3),)])
+
+    assert results[0] is images
+    assert results[1].shape == images.shape
+
+
+def test_lists_of_differently_sized_images(images):
+    mixed = [images[0], images[1][:32, :40]]
+    results = AttackEngine().apply_chains(mixed, [parse_chain('resize:0.5>jpeg:0.3')])
+
+    assert [image.shape for image in results[0]] == [image.shape for image in mixed]
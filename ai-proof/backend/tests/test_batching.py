@@ -0,0 +1,130 @@
+"""MicroBatcher: batching window, per-caller slices, backpressure and errors."""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from backend.app.batching import MicroBatcher, QueueFullError
+
+
+@pytest.fixture
+def make_batcher():
+    batchers = []
+
+    def make(run_batch, **kwargs):
+        batcher = MicroBatcher(run_batch, **kwargs)
+        batchers.append(batcher)
+        return batcher
+
+    yield make
+    for batcher in batchers:
+        batcher.close()
+
+
+def test_each_caller_gets_its_own_slice(make_batcher):
+    batcher = make_batcher(lambda batch: batch * 2, max_batch_size=4, window_ms=20)
+    items = [np.full((3, 3), i, dtype=np.float32) for i in range(10)]
+
+    with ThreadPoolExecutor(max_workers=10) as pool:
+        results = list(pool.map(batcher, items))
+
+    for item, result in zip(items, results):
+        np.testing.assert_array_equal(result, item * 2)
+    assert batcher.stats()['items'] == 10
+
+
+def test_items_within_the_window_share_a_batch(make_batcher):
+    sizes = []
+
+    def run_batch(batch):
+        sizes.append(len(batch))
+        return batch
+
+    batcher = make_batcher(run_batch, max_batch_size=8, window_ms=200)
+    futures = [batcher.submit(np.zeros(2)) for _ in range(5)]
+    for future in futures:
+        future.result(timeout=5)
+
+    assert sizes == [5]
+    assert batcher.stats()['batch_sizes'] == {5: 1}
+
+
+def test_batches_never_exceed_max_batch_size(make_batcher):
+    sizes = []
+
+    def run_batch(batch):
+        sizes.append(len(batch))
+        return batch
+
+    batcher = make_batcher(run_batch, max_batch_size=3, window_ms=100)
+    futures = [batcher.submit(np.zeros(2)) for _ in range(7)]
+    for future in futures:
+        future.result(timeout=5)
+
+    assert max(sizes) <= 3
+    assert sum(sizes) == 7
+
+
+def test_full_queue_rejects_with_queue_full_error(make_batcher):
+    release = threading.Event()
+    started = threading.Event()
+
+    def run_batch(batch):
+        started.set()
+        release.wait(timeout=5)
+        return batch
+
+    batcher = make_batcher(run_batch, max_batch_size=1, window_ms=0, max_queue_depth=2)
+    running = batcher.submit(np.zeros(1))
+    assert started.wait(timeout=5)  # the worker holds the first item
+
+    queued = [batcher.submit(np.zeros(1)) for _ in range(2)]
+    with pytest.raises(QueueFullError):
+        batcher.submit(np.zeros(1))
+    assert batcher.stats()['rejected'] == 1
+
+    release.set()
+    for future in [running] + queued:
+        future.result(timeout=5)
+
+
+def test_batch_error_reaches_every_caller(make_batcher):
+    def run_batch(batch):
+        raise ValueError("session failed")
+
+    batcher = make_batcher(run_batch, max_batch_size=4, window_ms=100)
+    futures = [batcher.submit(np.zeros(1)) for _ in range(3)]
+
+    for future in futures:
+        with pytest.raises(ValueError, match="session failed"):
+            future.result(timeout=5)
+    assert batcher.stats()['errors'] >= 1
+
+
+def test_one_worker_per_callable(make_batcher):
+    batcher = make_batcher([lambda batch: batch + 1, lambda batch: batch + 1], max_batch_size=1, window_ms=0)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(batcher, [np.array([i]) for i in range(20)]))
+
+    assert [int(r[0]) for r in results] == list(range(1, 21))
+    stats = batcher.stats()
+    assert stats['workers'] == 2
+    assert sum(stats['worker_batches']) == 20
+
+
+def test_mixed_shapes_fall_back_to_stacking_lists(make_batcher):
+    batcher = make_batcher(lambda batch: [item.sum() for item in batch], max_batch_size=4, window_ms=100)
+    futures = [batcher.submit(item) for item in ([1, 2], [3, 4])]
+
+    assert [future.result(timeout=5) for future in futures] == [3, 7]
+
+
+def test_closed_batcher_rejects_submissions(make_batcher):
+    batcher = make_batcher(lambda batch: batch)
+    batcher.close()
+
+    with pytest.raises(RuntimeError):
+        batcher.submit(np.zeros(1))
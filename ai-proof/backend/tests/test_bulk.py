@@ -0,0 +1,193 @@
+"""Bulk stamping and scanning: manifest resume, atomic .partial writes, sharding and CSV reports."""
+
+import csv
+import json
+import os
+import zlib
+
+import cv2
+import numpy as np
+import pytest
+
+from backend.app import bulk
+
+
+def quiet(message):
+    pass
+
+
+@pytest.fixture
+def source_dir(tmp_path):
+    source = tmp_path / 'in'
+    (source / 'nested').mkdir(parents=True)
+    rng = np.random.default_rng(0)
+    for name in ('a.png', 'b.jpg', 'nested/c.png'):
+        cv2.imwrite(str(source / name), rng.integers(0, 256, (40, 48, 3), dtype=np.uint8))
+    (source / 'broken.png').write_bytes(b'not an image')
+    (source / 'notes.txt').write_text('ignored')
+    return source
+
+
+def manifest_entries(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_stamps_every_image_and_records_failures(source_dir, tmp_path):
+    output = tmp_path / 'out'
+    summary = bulk.stamp_tree(str(source_dir), str(output), workers=1, batch_size=2,
+                              output_format='png', log=quiet)
+
+    assert summary['stamped'] == 3
+    assert summary['failed'] == 1
+    for name in ('a.png', 'b.png', 'nested/c.png'):
+        assert cv2.imread(str(output / name)) is not None
+    assert not [name for name in os.listdir(output) if name.endswith('.partial')]
+
+    entries = {entry['name']: entry for entry in manifest_entries(output / 'manifest.jsonl')}
+    assert entries['broken.png']['status'] == 'error'
+    assert {name for name, entry in entries.items() if entry['status'] == 'ok'} == {'a.png', 'b.jpg', 'nested/c.png'}
+
+
+def test_rerun_resumes_from_the_manifest(source_dir, tmp_path):
+    output = tmp_path / 'out'
+    bulk.stamp_tree(str(source_dir), str(output), workers=1, output_format='png', log=quiet)
+
+    # Drop one finished file from the manifest, as if the run had stopped before it
+    manifest = output / 'manifest.jsonl'
+    kept = [entry for entry in manifest_entries(manifest) if entry['name'] != 'b.jpg']
+    manifest.write_text(''.join(json.dumps(entry) + '\n' for entry in kept) + '{"name": "cut sh')
+    os.remove(output / 'b.png')
+
+    summary = bulk.stamp_tree(str(source_dir), str(output), workers=1, output_format='png', log=quiet)
+
+    # Only the missing file and the one that failed are tried again
+    assert summary['skipped'] == 2
+    assert summary['stamped'] == 1
+    assert summary['failed'] == 1
+    assert os.path.exists(output / 'b.png')
+    assert bulk.read_manifest(str(manifest)) == {'a.png', 'b.jpg', 'nested/c.png'}
+
+
+def test_write_job_writes_through_a_partial_file(tmp_path, monkeypatch):
+    path = str(tmp_path / 'sub' / 'out.png')
+    replaced = []
+    replace = os.replace
+
+    def recording_replace(src, dst):
+        assert os.path.exists(src)
+        assert not os.path.exists(dst)
+        replaced.append((src, dst))
+        replace(src, dst)
+
+    monkeypatch.setattr(bulk.os, 'replace', recording_replace)
+    result = bulk.write_job(path, np.zeros((8, 8, 3), dtype=np.uint8), 'png')
+
+    assert result['error'] is None
+    assert replaced == [(path + '.partial', path)]
+    assert os.path.getsize(path) == result['bytes']
+    assert os.listdir(tmp_path / 'sub') == ['out.png']
+
+
+def test_failed_write_leaves_no_output(tmp_path, monkeypatch):
+    path = str(tmp_path / 'out.png')
+
+    def failing_replace(src, dst):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(bulk.os, 'replace', failing_replace)
+    result = bulk.write_job(path, np.zeros((8, 8, 3), dtype=np.uint8), 'png')
+
+    assert result['error'] == "OSError: disk full"
+    assert not os.path.exists(path)
+
+
+def test_safe_output_path_rejects_escaping_names(tmp_path):
+    assert bulk.safe_output_path(str(tmp_path), 'a/./b.jpg', '.png') == os.path.join(str(tmp_path), 'a', 'b.png')
+    for name in ('../evil.png', 'a/../../evil.png', ''):
+        with pytest.raises(ValueError):
+            bulk.safe_output_path(str(tmp_path), name)
+
+
+@pytest.mark.parametrize('text, shard', [('0/1', (0, 1)), ('2/3', (2, 3)), (' 1 / 4 ', (1, 4))])
+def test_parse_shard(text, shard):
+    assert bulk.parse_shard(text) == shard
+
+
+@pytest.mark.parametrize('text', ['', '1', '1/2/3', 'a/b', '3/3', '-1/3', '0/0'])
+def test_parse_shard_rejects_bad_specs(text):
+    with pytest.raises(ValueError):
+        bulk.parse_shard(text)
+
+
+def test_shards_partition_the_names():
+    names = [f"dir{i % 7}/image_{i}.png" for i in range(500)]
+    shards = [{name for name in names if bulk.in_shard(name, (index, 3))} for index in range(3)]
+
+    assert set.union(*shards) == set(names)
+    assert sum(len(shard) for shard in shards) == len(names)
+    assert all(shards)
+    # Assignment depends on the name alone, not on listing order or the process
+    for index, shard in enumerate(shards):
+        assert all(zlib.crc32(name.encode('utf-8')) % 3 == index for name in shard)
+    assert all(bulk.in_shard(name, (0, 1)) for name in names)
+
+
+def read_report(path):
+    with open(path, newline='') as f:
+        return list(csv.DictReader(f))
+
+
+def test_csv_report_resumes_after_a_truncated_line(tmp_path):
+    path = str(tmp_path / 'report.csv')
+    report = bulk.CsvReport(path)
+    report.write([{'name': 'a.png', 'detected': True, 'error': None},
+                  {'name': 'b.png', 'error': 'Failed to decode image'}])
+    report.close()
+    with open(path, 'a') as f:
+        f.write('c.png,40,4')  # interrupted mid-row
+
+    report = bulk.CsvReport(path)
+    assert report.done == {'a.png'}
+    report.write([{'name': 'd.png', 'detected': False, 'error': None}])
+    report.close()
+
+    # b.png failed, so it is tried again and its old error row is gone
+    rows = read_report(path)
+    assert [row['name'] for row in rows] == ['a.png', 'd.png']
+    assert list(rows[0]) == [name for name, _ in bulk.REPORT_COLUMNS]
+
+
+def test_csv_report_with_only_a_partial_header_starts_over(tmp_path):
+    path = tmp_path / 'report.csv'
+    path.write_text('name,wid')
+
+    report = bulk.CsvReport(str(path))
+    report.write([{'name': 'a.png', 'error': None}])
+    report.close()
+
+    assert report.done == set()
+    assert [row['name'] for row in read_report(path)] == ['a.png']
+
+
+def test_scan_tree_covers_each_shard_once(source_dir, tmp_path):
+    reports = [str(tmp_path / f"shard{index}.csv") for index in range(2)]
+    summaries = [
+        bulk.scan_tree(str(source_dir), report, shard=(index, 2), workers=1, batch_size=2, log=quiet)
+        for index, report in enumerate(reports)
+    ]
+
+    names = [row['name'] for report in reports for row in read_report(report)]
+    assert sorted(names) == ['a.png', 'b.jpg', 'broken.png', 'nested/c.png']
+    assert sum(summary['scanned'] for summary in summaries) == 3
+    assert sum(summary['failed'] for summary in summaries) == 1
+
+    # Rescanning finished shards only retries their failures, without duplicating rows
+    for index, report in enumerate(reports):
+        again = bulk.scan_tree(str(source_dir), report, shard=(index, 2), workers=1, log=quiet)
+        assert again['scanned'] == 0
+        assert again['skipped'] == summaries[index]['scanned']
+        assert again['failed'] == summaries[index]['failed']
+    names = [row['name'] for report in reports for row in read_report(report)]
+    assert sorted(names) == ['a.png', 'b.jpg', 'broken.png', 'nested/c.png']
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.partial')]
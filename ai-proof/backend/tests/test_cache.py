@@ -0,0 +1,121 @@
+"""ResultCache: byte-bounded LRU eviction, disk spill and model-version invalidation."""
+
+import os
+
+from backend.app.cache import ResultCache, cached, content_key, upload_digest
+
+
+def test_lru_eviction_is_bounded_by_bytes():
+    cache = ResultCache(max_bytes=100)
+    cache.put('a', 'x' * 40)
+    cache.put('b', 'y' * 40)
+    assert cache.get('a') == 'x' * 40  # 'a' is now the most recently used
+
+    cache.put('c', 'z' * 40)
+
+    assert cache.get('b') is None
+    assert cache.get('a') == 'x' * 40
+    assert cache.get('c') == 'z' * 40
+    stats = cache.stats()
+    assert stats['bytes'] <= 100
+    assert stats['evictions'] == 1
+
+
+def test_values_larger_than_the_budget_are_not_stored():
+    cache = ResultCache(max_bytes=10)
+    cache.put('big', 'x' * 11)
+
+    assert cache.get('big') is None
+    assert cache.stats()['entries'] == 0
+
+
+def test_replacing_a_key_does_not_double_count_its_size():
+    cache = ResultCache(max_bytes=100)
+    cache.put('a', 'x' * 40)
+    cache.put('a', 'y' * 30)
+
+    assert cache.stats()['bytes'] == 30
+    assert cache.get('a') == 'y' * 30
+
+
+def test_evicted_entries_spill_to_disk_and_come_back(tmp_path):
+    # The dict is accounted as 192 bytes, the PNG as 94
+    cache = ResultCache(max_bytes=250, spill_dir=str(tmp_path), spill_max_bytes=1000)
+    cache.put('json', {'confidence': 0.9})
+    cache.put('png', b'\x89PNG' + b'0' * 90)  # evicts 'json' to disk
+
+    assert os.path.exists(tmp_path / 'json.json')
+    assert cache.get('json') == {'confidence': 0.9}
+    stats = cache.stats()
+    assert stats['disk_hits'] == 1
+    assert stats['spills'] >= 1
+    # Promoted back into memory, so the file is gone and 'png' went to disk as raw bytes
+    assert not os.path.exists(tmp_path / 'json.json')
+    assert os.path.exists(tmp_path / 'png.bin')
+    assert cache.get('png') == b'\x89PNG' + b'0' * 90
+
+
+def test_disk_tier_trims_the_oldest_spills(tmp_path):
+    cache = ResultCache(max_bytes=50, spill_dir=str(tmp_path), spill_max_bytes=80)
+    for key in 'abcd':
+        cache.put(key, key * 40)  # each put evicts the previous key
+
+    assert cache.stats()['disk_bytes'] <= 80
+    assert cache.get('a') is None
+    assert cache.get('c') == 'c' * 40
+
+
+def test_model_version_change_invalidates_memory_and_disk(tmp_path):
+    cache = ResultCache(max_bytes=50, spill_dir=str(tmp_path), spill_max_bytes=1000)
+    cache.set_model_version('v1')
+    cache.put('a', 'a' * 40)
+    cache.put('b', 'b' * 40)  # 'a' spilled
+
+    cache.set_model_version('v1')
+    assert cache.get('b') == 'b' * 40
+
+    cache.set_model_version('v2')
+    assert cache.get('a') is None
+    assert cache.get('b') is None
+    assert os.listdir(tmp_path) == []
+    stats = cache.stats()
+    assert stats['invalidations'] == 1
+    assert stats['model_version'] == 'v2'
+
+
+def test_cached_computes_once_per_key_and_version():
+    cache = ResultCache(max_bytes=1000)
+    upload_hash = upload_digest(b'image bytes')
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {'detected': True}
+
+    for _ in range(3):
+        assert cached(cache, upload_hash, 'detect', 'v1', compute, heatmap=False) == {'detected': True}
+    assert len(calls) == 1
+
+    cached(cache, upload_hash, 'detect', 'v1', compute, heatmap=True)
+    assert len(calls) == 2
+
+    cached(cache, upload_hash, 'detect', 'v2', compute, heatmap=False)
+    assert len(calls) == 3
+
+
+def test_cached_without_a_cache_always_computes():
+    calls = []
+    for _ in range(2):
+        cached(None, None, 'detect', 'v1', lambda: calls.append(1) or {})
+    assert len(calls) == 2
+
+
+def test_content_key_covers_every_parameter():
+    upload_hash = upload_digest(b'image bytes')
+    base = content_key(upload_hash, 'stamp', 'v1', strength=0.7, adaptive=False)
+
+    assert base == content_key(upload_hash, 'stamp', 'v1', adaptive=False, strength=0.7)
+    assert base != content_key(upload_hash, 'stamp', 'v1', strength=0.5, adaptive=False)
+    assert base != content_key(upload_hash, 'detect', 'v1', strength=0.7, adaptive=False)
+    assert base != content_key(upload_hash, 'stamp', 'v2', strength=0.7, adaptive=False)
+    assert base != content_key(upload_digest(b'other'), 'stamp', 'v1', strength=0.7, adaptive=False)
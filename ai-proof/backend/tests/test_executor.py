@@ -0,0 +1,144 @@
+"""BoundedExecutor and Slot: the in-flight cap, ServerBusyError on overflow and its counters."""
+
+import asyncio
+import threading
+
+import pytest
+
+from backend.app.executor import BoundedExecutor, ServerBusyError
+
+
+@pytest.fixture
+def executor():
+    executor = BoundedExecutor(max_workers=2, max_inflight=2, name="test-worker")
+    yield executor
+    executor.shutdown()
+
+
+def blocked(release):
+    release.wait(timeout=5)
+    return 'done'
+
+
+def test_run_returns_the_result(executor):
+    assert asyncio.run(executor.run(lambda a, b=0: a + b, 2, b=3)) == 5
+    stats = executor.stats()
+    assert stats['inflight'] == 0
+    assert stats['completed'] == 1
+
+
+def test_overflow_raises_server_busy_error(executor):
+    release = threading.Event()
+
+    async def scenario():
+        running = [asyncio.ensure_future(executor.run(blocked, release)) for _ in range(2)]
+        await asyncio.sleep(0)
+        assert executor.stats()['inflight'] == 2
+
+        with pytest.raises(ServerBusyError):
+            await executor.run(lambda: None)
+
+        release.set()
+        return await asyncio.gather(*running)
+
+    assert asyncio.run(scenario()) == ['done', 'done']
+    stats = executor.stats()
+    assert stats['rejected'] == 1
+    assert stats['completed'] == 2
+    assert stats['inflight'] == 0
+
+
+def test_queued_calls_count_towards_the_cap():
+    executor = BoundedExecutor(max_workers=1, max_inflight=2)
+    release = threading.Event()
+
+    async def scenario():
+        # One call runs, the second waits in the pool queue; both hold a slot
+        running = [asyncio.ensure_future(executor.run(blocked, release)) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(ServerBusyError):
+            await executor.run(lambda: None)
+        release.set()
+        await asyncio.gather(*running)
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        executor.shutdown()
+    assert executor.stats()['rejected'] == 1
+
+
+def test_errors_free_the_slot(executor):
+    def fail():
+        raise ValueError("decode failed")
+
+    async def scenario():
+        for _ in range(3):
+            with pytest.raises(ValueError, match="decode failed"):
+                await executor.run(fail)
+
+    asyncio.run(scenario())
+    stats = executor.stats()
+    assert stats['inflight'] == 0
+    assert stats['completed'] == 3
+    assert stats['rejected'] == 0
+
+
+def test_cancelled_call_keeps_its_slot_until_the_work_finishes(executor):
+    release = threading.Event()
+    finished = threading.Event()
+
+    def work():
+        release.wait(timeout=5)
+        finished.set()
+
+    async def scenario():
+        task = asyncio.ensure_future(executor.run(work))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        # The worker thread is still busy, so the slot is still taken
+        assert executor.stats()['inflight'] == 1
+        release.set()
+        assert await asyncio.get_running_loop().run_in_executor(None, finished.wait, 5)
+
+    asyncio.run(scenario())
+    executor.shutdown()
+    stats = executor.stats()
+    assert stats['inflight'] == 0
+    assert stats['completed'] == 1
+
+
+def test_a_reserved_slot_holds_the_cap_across_calls(executor):
+    async def scenario():
+        slot = executor.reserve()
+        # Calls made through the slot don't take further slots
+        assert [await slot.run(lambda i=i: i * 2) for i in range(3)] == [0, 2, 4]
+        assert executor.stats()['inflight'] == 1
+
+        other = executor.reserve()
+        with pytest.raises(ServerBusyError):
+            executor.reserve()
+        with pytest.raises(ServerBusyError):
+            await executor.run(lambda: None)
+
+        slot.release()
+        assert executor.stats()['inflight'] == 1
+        assert await executor.run(lambda: 'ok') == 'ok'
+        other.release()
+
+    asyncio.run(scenario())
+    stats = executor.stats()
+    assert stats['inflight'] == 0
+    assert stats['rejected'] == 2
+
+
+def test_slot_release_is_idempotent(executor):
+    with executor.reserve() as slot:
+        slot.release()
+        slot.release()
+    stats = executor.stats()
+    assert stats['inflight'] == 0
+    assert stats['completed'] == 1
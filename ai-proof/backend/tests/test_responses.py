@@ -0,0 +1,78 @@
+"""Content negotiation: Accept q-values, explicit overrides and the binary/multipart bodies."""
+
+import json
+
+import pytest
+from fastapi import HTTPException, Request
+
+from backend.app.responses import image_response, metadata_headers, negotiate
+
+
+def request_with(accept=None):
+    headers = [(b'accept', accept.encode('latin-1'))] if accept is not None else []
+    return Request({'type': 'http', 'method': 'POST', 'path': '/', 'headers': headers})
+
+
+@pytest.mark.parametrize('accept, mode', [
+    (None, 'json'),
+    ('', 'json'),
+    ('*/*', 'json'),
+    ('image/png', 'binary'),
+    ('multipart/mixed', 'multipart'),
+    ('application/json, image/png', 'json'),
+    ('image/png, application/json', 'binary'),
+    ('application/json;q=0.5, image/png', 'binary'),
+    ('image/png;q=0.2, multipart/mixed;q=0.9, application/json;q=0.5', 'multipart'),
+    ('image/png; q=0.8, text/html', 'binary'),
+])
+def test_accept_header_picks_the_highest_quality_type(accept, mode):
+    assert negotiate(request_with(accept)) == mode
+
+
+def test_equal_quality_keeps_the_client_order():
+    assert negotiate(request_with('multipart/mixed;q=0.7, image/png;q=0.7')) == 'multipart'
+    assert negotiate(request_with('image/png;q=0.7, multipart/mixed;q=0.7')) == 'binary'
+
+
+def test_zero_quality_excludes_a_type():
+    assert negotiate(request_with('image/png;q=0')) == 'json'
+    assert negotiate(request_with('image/png;q=0, multipart/mixed;q=0.1')) == 'multipart'
+
+
+def test_malformed_quality_counts_as_one():
+    assert negotiate(request_with('application/json;q=0.5, image/png;q=abc')) == 'binary'
+
+
+def test_explicit_override_wins_over_accept():
+    assert negotiate(request_with('image/png'), response='json') == 'json'
+    assert negotiate(request_with(), response='multipart') == 'multipart'
+
+
+def test_unknown_override_is_a_400():
+    with pytest.raises(HTTPException) as excinfo:
+        negotiate(request_with(), response='xml')
+    assert excinfo.value.status_code == 400
+
+
+def test_metadata_headers_skip_none_and_expose_the_rest():
+    headers = metadata_headers({'result_id': 'abc', 'detected': True, 'heatmap_id': None})
+
+    assert headers['X-Result-Id'] == 'abc'
+    assert headers['X-Detected'] == 'true'
+    assert 'X-Heatmap-Id' not in headers
+    assert headers['Access-Control-Expose-Headers'] == 'X-Result-Id, X-Detected'
+
+
+def test_binary_and_multipart_bodies_carry_the_raw_image():
+    png = b'\x89PNG' + b'0' * 16
+    metadata = {'confidence': 0.5}
+
+    binary = image_response(metadata, png, 'binary', 'out.png', 'image')
+    assert binary.body == png
+    assert binary.headers['x-confidence'] == '0.5'
+
+    multipart = image_response(metadata, png, 'multipart', 'out.png', 'image')
+    boundary = multipart.headers['content-type'].split('boundary=')[1]
+    parts = multipart.body.split(f'--{boundary}'.encode('utf-8'))
+    assert json.loads(parts[1].split(b'\r\n\r\n', 1)[1].strip()) == metadata
+    assert parts[2].split(b'\r\n\r\n', 1)[1] == png + b'\r\n'
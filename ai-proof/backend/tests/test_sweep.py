@@ -0,0 +1,147 @@
+"""sweep_attacks: bracketing the breaking severity, tolerance and round limits."""
+
+import cv2
+import numpy as np
+import pytest
+
+from backend.app import cli, pipeline
+
+# Severity at which each fake attack stops being detected
+THRESHOLDS = {'jpeg': 0.63, 'blur': 0.21, 'noise': 2.0, 'resize': -1.0, 'rotate': 0.8}
+
+
+class FakeEngine:
+    """Attacks that just record what was applied, for the fake decoder to score."""
+
+    def attack(self, images, attack_type, severity):
+        return [(attack_type, severity) for _ in images]
+
+
+@pytest.fixture
+def decoder_calls(monkeypatch):
+    calls = []
+
+    def decode_arrays(images):
+        calls.append(len(images))
+        results = []
+        for image in images:
+            if isinstance(image, tuple):
+                attack_type, severity = image
+                detected = severity < THRESHOLDS[attack_type]
+                confidence = max(0.0, 1.0 - severity)
+            else:
+                detected, confidence = True, 1.0
+            results.append({'detected': detected, 'confidence': confidence})
+        return results
+
+    monkeypatch.setattr(pipeline, '_engine', FakeEngine())
+    monkeypatch.setattr(pipeline, 'decode_arrays', decode_arrays)
+    return calls
+
+
+@pytest.fixture
+def image():
+    return np.zeros((8, 8, 3), dtype=np.uint8)
+
+
+def result_for(report, attack_type):
+    return next(result for result in report['results'] if result['type'] == attack_type)
+
+
+def test_breaking_severity_is_bracketed_within_tolerance(image, decoder_calls):
+    report = pipeline.sweep_attacks(image, ['jpeg', 'blur'], probes=4, tolerance=0.02, max_rounds=8)
+
+    for attack_type in ('jpeg', 'blur'):
+        result = result_for(report, attack_type)
+        low, high = result['bracket']
+        assert result['converged']
+        assert not result['survives']
+        assert low < THRESHOLDS[attack_type] <= high
+        assert high - low <= 0.02
+        assert result['breaking_severity'] == high
+
+
+def test_one_decoder_call_per_round(image, decoder_calls):
+    report = pipeline.sweep_attacks(image, ['jpeg', 'blur'], probes=4, tolerance=0.02)
+
+    assert len(decoder_calls) == report['rounds']
+    # The first call also scores the unattacked image
+    assert decoder_calls[0] == 1 + 2 * 4
+    assert sum(decoder_calls) == 1 + report['probes']
+    assert report['baseline'] == {'detected': True, 'confidence': 1.0}
+
+
+def test_attack_that_never_breaks_survives_after_one_round(image, decoder_calls):
+    report = pipeline.sweep_attacks(image, ['noise'], probes=3)
+    result = result_for(report, 'noise')
+
+    assert report['rounds'] == 1
+    assert result['survives']
+    assert result['converged']
+    assert result['breaking_severity'] is None
+    assert result['bracket'] is None
+    assert [point['severity'] for point in result['curve']] == [0.0, 0.5, 1.0]
+
+
+def test_attack_broken_at_the_lowest_severity(image, decoder_calls):
+    result = result_for(pipeline.sweep_attacks(image, ['resize']), 'resize')
+
+    assert result['breaking_severity'] == 0.0
+    assert result['bracket'] == [0.0, 0.0]
+    assert result['converged']
+
+
+def test_max_rounds_stops_an_unconverged_search(image, decoder_calls):
+    report = pipeline.sweep_attacks(image, ['jpeg'], probes=2, tolerance=1e-6, max_rounds=3)
+    result = result_for(report, 'jpeg')
+
+    assert report['rounds'] == 3
+    assert not result['converged']
+    low, high = result['bracket']
+    assert low < THRESHOLDS['jpeg'] <= high
+
+
+def test_sweep_ranges_limit_the_searched_severities(image, decoder_calls):
+    result = result_for(pipeline.sweep_attacks(image, ['rotate'], tolerance=0.01), 'rotate')
+    low, high = pipeline.SWEEP_RANGES['rotate']
+
+    assert all(low <= point['severity'] <= high for point in result['curve'])
+    assert result['bracket'][0] < THRESHOLDS['rotate'] <= result['bracket'][1]
+
+
+def test_more_probes_need_fewer_rounds(image, decoder_calls):
+    few = pipeline.sweep_attacks(image, ['jpeg'], probes=2, tolerance=0.01, max_rounds=20)
+    many = pipeline.sweep_attacks(image, ['jpeg'], probes=8, tolerance=0.01, max_rounds=20)
+
+    assert many['rounds'] < few['rounds']
+
+
+def test_invalid_arguments_are_rejected(image, decoder_calls):
+    with pytest.raises(ValueError):
+        pipeline.sweep_attacks(image, ['bogus'])
+    with pytest.raises(ValueError):
+        pipeline.sweep_attacks(image, ['jpeg'], probes=1)
+    assert decoder_calls == []
+
+
+@pytest.mark.parametrize('option, value', [
+    ('--probes', '1'), ('--probes', '17'), ('--probes', 'four'), ('--max-rounds', '0'), ('--max-rounds', '21'),
+])
+def test_cli_rejects_out_of_range_sweep_options(option, value, capsys):
+    with pytest.raises(SystemExit) as excinfo:
+        cli.build_parser().parse_args(['sweep', 'image.png', option, value])
+    assert excinfo.value.code == 2
+    assert option in capsys.readouterr().err
+
+
+def test_cli_sweep_without_a_baseline_fails_cleanly(tmp_path, monkeypatch, capsys):
+    path = tmp_path / 'image.png'
+    cv2.imwrite(str(path), np.zeros((8, 8, 3), dtype=np.uint8))
+    monkeypatch.setattr(pipeline, 'sweep_attacks', lambda *args, **kwargs: {
+        'baseline': None, 'results': [], 'rounds': 0, 'probes': 0,
+    })
+
+    with pytest.raises(SystemExit) as excinfo:
+        cli.main(['sweep', str(path)])
+    assert excinfo.value.code == 2
+    assert 'no baseline' in capsys.readouterr().err
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Measure per-request allocation churn of the preprocessing and blending stages.
+
+Every call runs under tracemalloc (numpy and OpenCV arrays are traced) and
+the peak of memory allocated during the call is reported: the sum of the
+temporaries alive at the same time. The model is not needed; in simulation
+mode the numbers cover everything except the session call itself.
+
+Usage:
+    python benchmarks/allocations.py --size 1024 --repeat 20
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def measure(fn, repeat):
+    """Run fn repeatedly; returns the median peak MB and median ms per call."""
+    fn()  # first call allocates any reusable buffers
+    peaks, times = [], []
+    for _ in range(repeat):
+        tracemalloc.start()
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000.0)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peaks.append(peak / (1024.0 * 1024.0))
+    return {
+        'peak_mb': float(np.median(peaks)),
+        'ms': float(np.median(times)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure allocation churn per request")
+    parser.add_argument('--size', type=int, default=1024, help="input image side length")
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--output', help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    from backend.app.stegastamp import get_wrapper
+
+    wrapper = get_wrapper()
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, (args.size, args.size, 3), dtype=np.uint8)
+
+    cases = {
+        'preprocess': lambda: wrapper._preprocess(image),
+        'detect': lambda: wrapper.decode_array(image),
+        'stamp': lambda: wrapper.stamp_array(image),
+        'stamp_adaptive': lambda: wrapper.stamp_array(image, adaptive=True),
+    }
+
+    results = {}
+    for name, fn in cases.items():
+        results[name] = measure(fn, args.repeat)
+        print(f"{name:<16} peak {results[name]['peak_mb']:8.2f} MB  {results[name]['ms']:8.2f} ms")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'size': args.size, 'simulation': not wrapper.model_loaded, 'results': results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
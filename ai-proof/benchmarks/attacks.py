@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Benchmark the attack engine against the original per-image attacks.
+
+For every attack type a stack of images is attacked twice: image by image
+with the original implementations (PIL JPEG round trips with colour swaps,
+float64 noise from np.random, float32 casts before convertScaleAbs), and
+in one AttackEngine.attack call. The max pixel difference between the two
+is reported too (noise is random, so there it compares the noise spread).
+
+Then a resize x blur x JPEG matrix of attack chains is run once chain by
+chain and once through AttackEngine.apply_chains, which computes every
+shared prefix only once.
+
+Usage:
+    python benchmarks/attacks.py --size 512 --count 16 --repeat 5
+"""
+
+import argparse
+import io
+import itertools
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from backend.app.attacks import ATTACK_TYPES, AttackEngine, ImageAttacks, count_chain_nodes  # noqa: E402
+
+# Severities combined into the chain matrix: 4 x 4 x 4 = 64 chains of depth 3
+CHAIN_MATRIX = (
+    ('resize', (0.1, 0.25, 0.5, 0.75)),
+    ('blur', (0.17, 0.33, 0.5, 0.67)),
+    ('jpeg', (0.1, 0.3, 0.5, 0.8)),
+)
+
+
+def legacy_jpeg_compression(image_array, quality):
+    pil_img = Image.fromarray(cv2.cvtColor(image_array, cv2.COLOR_BGR2RGB))
+    buffer = io.BytesIO()
+    pil_img.save(buffer, format='JPEG', quality=quality)
+    buffer.seek(0)
+    result = Image.open(buffer).convert('RGB')
+    return cv2.cvtColor(np.array(result), cv2.COLOR_RGB2BGR)
+
+
+def legacy_gaussian_noise(image_array, std_dev):
+    noise = np.random.normal(0, std_dev, image_array.shape)
+    return np.clip(image_array.astype(np.float32) + noise, 0, 255).astype(np.uint8)
+
+
+def legacy_brightness_contrast(image_array, brightness_delta, contrast_factor):
+    adjusted = cv2.convertScaleAbs(image_array.astype(np.float32), alpha=contrast_factor, beta=brightness_delta)
+    return np.clip(adjusted, 0, 255).astype(np.uint8)
+
+
+def legacy_attack(image, attack_type, severity):
+    """The original implementation of each attack (unchanged ones call ImageAttacks)."""
+    if attack_type == 'jpeg':
+        return legacy_jpeg_compression(image, max(10, min(100, int(100 - severity * 90))))
+    if attack_type == 'format':
+        return legacy_jpeg_compression(image, max(50, min(100, int(100 - severity * 50))))
+    if attack_type == 'noise':
+        return legacy_gaussian_noise(image, max(0.0, min(50.0, severity * 30.0)))
+    if attack_type == 'brightness':
+        return legacy_brightness_contrast(image, severity * 30.0, 1.0 + severity * 0.3)
+    return ImageAttacks.apply_attack(image, attack_type, severity)
+
+
+def median_ms(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append((time.perf_counter() - start) * 1000.0)
+    return float(np.median(times)), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the batched attack engine")
+    parser.add_argument('--size', type=int, default=512, help="image side length")
+    parser.add_argument('--count', type=int, default=16, help="images per stack")
+    parser.add_argument('--severity', type=float, default=0.5)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    # Smooth random images, so JPEG has realistic content to compress
+    images = np.stack([
+        cv2.GaussianBlur(rng.integers(0, 256, (args.size, args.size, 3), dtype=np.uint8), (7, 7), 2)
+        for _ in range(args.count)
+    ])
+    engine = AttackEngine(seed=0)
+
+    print(f"{args.count} images of {args.size}x{args.size}, severity {args.severity}")
+    print(f"{'attack':<12} {'legacy ms/img':>14} {'engine ms/img':>14} {'speedup':>8} {'max diff':>9}")
+    results = {}
+    for attack_type in ATTACK_TYPES:
+        legacy_ms, legacy = median_ms(
+            lambda: [legacy_attack(image, attack_type, args.severity) for image in images], args.repeat
+        )
+        engine_ms, attacked = median_ms(lambda: engine.attack(images, attack_type, args.severity), args.repeat)
+
+        if attack_type == 'noise':
+            # Different random draws: compare the spread of the added noise
+            spread = lambda out: float(np.std(np.asarray(out, dtype=np.float32) - images))
+            difference = abs(spread(legacy) - spread(attacked))
+        else:
+            difference = float(max(np.abs(a.astype(np.int16) - b).max() for a, b in zip(legacy, attacked)))
+
+        results[attack_type] = {
+            'legacy_ms_per_image': legacy_ms / args.count,
+            'engine_ms_per_image': engine_ms / args.count,
+            'speedup': legacy_ms / engine_ms if engine_ms else None,
+            'max_difference': difference,
+        }
+        row = results[attack_type]
+        print(f"{attack_type:<12} {row['legacy_ms_per_image']:>14.2f} {row['engine_ms_per_image']:>14.2f} "
+              f"{row['speedup']:>7.2f}x {difference:>9.2f}")
+
+    chains = list(itertools.product(*(
+        [(attack_type, severity) for severity in severities] for attack_type, severities in CHAIN_MATRIX
+    )))
+
+    def chain_by_chain():
+        outputs = []
+        for steps in chains:
+            attacked = images
+            for attack_type, severity in steps:
+                attacked = engine.attack(attacked, attack_type, severity)
+            outputs.append(attacked)
+        return outputs
+
+    naive_ms, _ = median_ms(chain_by_chain, 1)
+    shared_ms, _ = median_ms(lambda: engine.apply_chains(images, chains), 1)
+    chain_results = {
+        'chains': len(chains),
+        'naive_steps': sum(len(steps) for steps in chains),
+        'shared_steps': count_chain_nodes(chains),
+        'naive_ms': naive_ms,
+        'shared_ms': shared_ms,
+    }
+    print(f"\n{len(chains)} chains (resize > blur > jpeg): "
+          f"{chain_results['naive_steps']} steps chain by chain in {naive_ms:.0f} ms, "
+          f"{chain_results['shared_steps']} with shared prefixes in {shared_ms:.0f} ms "
+          f"({naive_ms / shared_ms:.2f}x)")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'size': args.size, 'count': args.count, 'severity': args.severity,
+                       'results': results, 'chains': chain_results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
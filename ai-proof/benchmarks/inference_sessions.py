@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Compare inference session layouts on this machine.
+
+Each layout ("SESSIONSxINTRA", e.g. 1x0 for one session using every core,
+4x2 for four sessions with two intra-op threads each) runs in its own
+process, because the session settings are read from the environment at
+import time. Every run loads the model, warms it up and then drives
+encode + decode requests from concurrent client threads.
+
+Usage:
+    python benchmarks/inference_sessions.py --layout 1x0 --layout 4x0 --clients 16
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_layout(requests, clients, seed):
+    """Drive the in-process wrapper with concurrent clients; runs inside the child process."""
+    import numpy as np
+
+    sys.path.insert(0, ROOT)
+    from backend.app import config
+    from backend.app.stegastamp import get_wrapper, warmup
+
+    load_start = time.perf_counter()
+    wrapper = get_wrapper()
+    warmup()
+    load_seconds = time.perf_counter() - load_start
+
+    rng = np.random.default_rng(seed)
+    images = [rng.integers(0, 256, (512, 512, 3), dtype=np.uint8) for _ in range(clients)]
+    latencies = []
+    latencies_lock = threading.Lock()
+    remaining = [requests]
+
+    def client(image):
+        while True:
+            with latencies_lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            start = time.perf_counter()
+            wrapper.stamp_array(image)
+            wrapper.decode_array(image)
+            elapsed = time.perf_counter() - start
+            with latencies_lock:
+                latencies.append(elapsed)
+
+    threads = [threading.Thread(target=client, args=(image,)) for image in images]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'sessions': config.INFERENCE_SESSIONS,
+        'intra_op_threads': config.INTRA_OP_THREADS,
+        'inter_op_threads': config.INTER_OP_THREADS,
+        'simulation': wrapper.session is None,
+        'load_and_warmup_s': load_seconds,
+        'requests': len(latencies),
+        'clients': clients,
+        'throughput_rps': len(latencies) / wall if wall else 0.0,
+        'p50_ms': latencies[len(latencies) // 2] * 1000.0 if latencies else 0.0,
+        'p95_ms': latencies[int(len(latencies) * 0.95) - 1] * 1000.0 if latencies else 0.0,
+        'batching': wrapper.batching_stats(),
+    }
+
+
+def parse_layout(layout):
+    """Parse "SESSIONSxINTRA[xINTER]" into environment overrides."""
+    parts = layout.lower().split('x')
+    if not 2 <= len(parts) <= 3 or not all(p.isdigit() for p in parts):
+        raise argparse.ArgumentTypeError(f"Invalid layout (expected SESSIONSxINTRA[xINTER]): {layout}")
+    env = {'INFERENCE_SESSIONS': parts[0], 'INTRA_OP_THREADS': parts[1]}
+    if len(parts) == 3:
+        env['INTER_OP_THREADS'] = parts[2]
+    return env
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark inference session layouts")
+    parser.add_argument('--layout', action='append', type=parse_layout,
+                        help="SESSIONSxINTRA[xINTER], repeatable (default: 1x0 and one session per 2 cores)")
+    parser.add_argument('--requests', type=int, default=64, help="encode+decode requests per layout")
+    parser.add_argument('--clients', type=int, default=16, help="concurrent client threads")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="write results as JSON to this file")
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_layout(args.requests, args.clients, args.seed)))
+        return
+
+    layouts = args.layout or [
+        parse_layout('1x0'),
+        parse_layout(f"{max(1, (os.cpu_count() or 1) // 2)}x0"),
+    ]
+
+    results = []
+    for env in layouts:
+        child = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--child',
+             '--requests', str(args.requests), '--clients', str(args.clients), '--seed', str(args.seed)],
+            env={**os.environ, **env, 'TF_CPP_MIN_LOG_LEVEL': '3'},
+            capture_output=True, text=True, cwd=ROOT
+        )
+        if child.returncode != 0:
+            print(child.stderr, file=sys.stderr)
+            raise SystemExit(f"Layout {env} failed")
+        result = json.loads(child.stdout.strip().splitlines()[-1])
+        results.append(result)
+        print(f"sessions={result['sessions']:<3} intra={result['intra_op_threads'] or 'auto':<5} "
+              f"inter={result['inter_op_threads'] or 'auto':<5} "
+              f"{result['throughput_rps']:8.2f} req/s  p50 {result['p50_ms']:8.1f} ms  "
+              f"p95 {result['p95_ms']:8.1f} ms"
+              f"{'  (simulation mode)' if result['simulation'] else ''}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'cpu_count': os.cpu_count(), 'results': results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
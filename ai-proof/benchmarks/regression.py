@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+Performance regression suite for the stamp/detect/attack hot paths.
+
+Two parts, both in-process and offline:
+
+- Microbenchmarks: StegaStampWrapper.encode_image and decode_image (from a
+  PNG on disk, like an upload), _masked_residual (the strength/adaptive
+  masking step, always at the 400x400 model size), _generate_frequency_heatmap
+  and every ImageAttacks method, at 256x256, 1080p, 4K and 24 MP.
+- Load test: the FastAPI app under concurrent /api/stamp, /api/detect and
+  /api/attack requests through a TestClient, reporting p50/p95/p99 latency
+  per endpoint, throughput and process RSS (sampled while the load runs).
+  The result cache is disabled, so every request does the full work.
+
+Runs with the model when STEGASTAMP_MODEL_PATH points at one, or in
+simulation mode (--simulation forces it). Results are compared against the
+stored baseline for the same mode (benchmarks/baseline.json); anything
+slower than the threshold is listed and the exit status is 1.
+--save-baseline replaces the stored numbers for the current mode, so do
+that on the reference machine, not a laptop.
+
+Usage:
+    python benchmarks/regression.py
+    python benchmarks/regression.py --sizes 256 1080p --requests 100 --concurrency 8
+    python benchmarks/regression.py --simulation --save-baseline
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DEFAULT_BASELINE = os.path.join(ROOT, 'benchmarks', 'baseline.json')
+
+# (height, width) of the benchmarked image sizes
+SIZES = {
+    '256': (256, 256),
+    '1080p': (1080, 1920),
+    '4k': (2160, 3840),
+    '24mp': (4000, 6000),
+}
+
+# Mid-range arguments for every ImageAttacks method
+ATTACK_METHODS = {
+    'jpeg_compression': (55,),
+    'resize': (0.5,),
+    'center_crop': (0.75,),
+    'gaussian_blur': (1.5,),
+    'gaussian_noise': (15.0,),
+    'rotate': (5.0,),
+    'brightness_contrast': (15.0, 1.15),
+    'png_to_jpeg_to_png': (90,),
+}
+
+# Requests cycled through by the load test
+LOAD_ENDPOINTS = (
+    ('stamp', '/api/stamp', {}),
+    ('detect', '/api/detect', {}),
+    ('attack', '/api/attack', {'attack_type': 'jpeg', 'severity': 0.5}),
+)
+
+# Timings below this many ms are not flagged: too noisy to call a regression
+NOISE_FLOOR_MS = 1.0
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _test_image(height, width, seed=0):
+    """Smooth random image, so PNG and JPEG have realistic content to compress."""
+    rng = np.random.default_rng(seed)
+    return cv2.GaussianBlur(rng.integers(0, 256, (height, width, 3), dtype=np.uint8), (7, 7), 2)
+
+
+def rss_mb():
+    """Current resident set size of this process in MB."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    import resource  # No /proc: peak RSS is the best available (KB on Linux, bytes on macOS)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024.0 * 1024.0) if sys.platform == 'darwin' else peak / 1024.0
+
+
+def time_calls(fn, repeat):
+    """Run fn once to warm up, then repeat times; returns median and min ms per call."""
+    fn()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000.0)
+    return {'median_ms': float(np.median(times)), 'min_ms': float(np.min(times))}
+
+
+def run_micro(wrapper, sizes, repeat, log=print):
+    """Microbenchmarks keyed 'case@size'."""
+    from backend.app.attacks import ImageAttacks
+
+    results = {}
+
+    def record(name, fn):
+        results[name] = time_calls(fn, repeat)
+        log(f"  {name:<34} {results[name]['median_ms']:>10.2f} ms  (min {results[name]['min_ms']:.2f})")
+
+    # The masking step always runs on the model's 400x400 input
+    original = _test_image(400, 400).astype(np.float32) / 255.0
+    watermarked = np.clip(original + np.float32(0.01), 0.0, 1.0)
+    record('masked_residual@400', lambda: wrapper._masked_residual(original, watermarked, 0.7, False))
+    record('masked_residual_adaptive@400', lambda: wrapper._masked_residual(original, watermarked, 0.7, True))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            height, width = SIZES[size]
+            image = _test_image(height, width)
+            path = os.path.join(tmp, f"{size}.png")
+            cv2.imwrite(path, image)
+
+            record(f'encode_image@{size}', lambda: wrapper.encode_image(path))
+            record(f'encode_image_adaptive@{size}', lambda: wrapper.encode_image(path, adaptive=True))
+            record(f'decode_image@{size}', lambda: wrapper.decode_image(path))
+            record(f'frequency_heatmap@{size}', lambda: wrapper._generate_frequency_heatmap(image))
+            for method, arguments in ATTACK_METHODS.items():
+                attack = getattr(ImageAttacks, method)
+                record(f'{method}@{size}', lambda: attack(image, *arguments))
+    return results
+
+
+def _percentiles(latencies):
+    if not latencies:
+        return {'count': 0, 'p50_ms': None, 'p95_ms': None, 'p99_ms': None}
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {'count': len(latencies), 'p50_ms': float(p50), 'p95_ms': float(p95), 'p99_ms': float(p99)}
+
+
+def run_load(requests, concurrency, size, log=print):
+    """Drive the app with concurrent requests; latency per endpoint plus RSS."""
+    from fastapi.testclient import TestClient
+
+    from backend.app.main import app
+
+    _, png = cv2.imencode('.png', _test_image(size, size))
+    payload = png.tobytes()
+
+    with TestClient(app) as client:
+        # Startup loads and warms the model in the background
+        deadline = time.monotonic() + 600
+        while client.get('/api/health').status_code != 200:
+            if time.monotonic() > deadline:
+                raise RuntimeError("model did not become ready within 10 minutes")
+            time.sleep(0.2)
+
+        samples = [rss_mb()]
+        stop = threading.Event()
+
+        def sample_rss():
+            while not stop.wait(0.05):
+                samples.append(rss_mb())
+
+        def send(index):
+            name, path, params = LOAD_ENDPOINTS[index % len(LOAD_ENDPOINTS)]
+            start = time.perf_counter()
+            response = client.post(path, params=params, files={'file': ('load.png', payload, 'image/png')})
+            return name, (time.perf_counter() - start) * 1000.0, response.status_code
+
+        sampler = threading.Thread(target=sample_rss, daemon=True)
+        sampler.start()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            outcomes = list(pool.map(send, range(requests)))
+        wall = time.perf_counter() - started
+        stop.set()
+        sampler.join()
+        samples.append(rss_mb())
+
+    latencies = {name: [] for name, _, _ in LOAD_ENDPOINTS}
+    errors = {}
+    for name, ms, status in outcomes:
+        if status == 200:
+            latencies[name].append(ms)
+        else:
+            errors[str(status)] = errors.get(str(status), 0) + 1
+    results = {
+        'requests': requests,
+        'concurrency': concurrency,
+        'image_size': size,
+        'seconds': wall,
+        'requests_per_second': requests / wall if wall else 0.0,
+        'errors': errors,
+        'latency': {name: _percentiles(values) for name, values in latencies.items()},
+        'latency_all': _percentiles([ms for values in latencies.values() for ms in values]),
+        'rss_mb': {'start': samples[0], 'peak': max(samples), 'end': samples[-1]},
+    }
+    for name, stats in list(results['latency'].items()) + [('all', results['latency_all'])]:
+        if stats['count']:
+            log(f"  {name:<8} n={stats['count']:<5} p50 {stats['p50_ms']:>9.1f} ms  "
+                f"p95 {stats['p95_ms']:>9.1f} ms  p99 {stats['p99_ms']:>9.1f} ms")
+    log(f"  {results['requests_per_second']:.2f} requests/s, {sum(errors.values())} errors; "
+        f"RSS {samples[0]:.0f} MB -> peak {max(samples):.0f} MB")
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Timings slower than the baseline by more than threshold, as printable lines."""
+    regressions = []
+    for name, now in results.get('micro', {}).items():
+        before = baseline.get('micro', {}).get(name)
+        if before and now['median_ms'] > before['median_ms'] * (1 + threshold) \
+                and now['median_ms'] - before['median_ms'] > NOISE_FLOOR_MS:
+            regressions.append(f"{name}: {before['median_ms']:.2f} -> {now['median_ms']:.2f} ms "
+                               f"({(now['median_ms'] / before['median_ms'] - 1) * 100:+.0f}%)")
+
+    load, before_load = results.get('load'), baseline.get('load')
+    if load and before_load:
+        if (load['requests'], load['concurrency'], load['image_size']) != (
+                before_load['requests'], before_load['concurrency'], before_load['image_size']):
+            print("  (load test settings differ from the baseline; latencies are not compared)")
+        else:
+            for name, stats in load['latency'].items():
+                old = before_load['latency'].get(name, {})
+                for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+                    if stats[key] and old.get(key) and stats[key] > old[key] * (1 + threshold):
+                        regressions.append(f"load {name} {key[:3]}: {old[key]:.1f} -> {stats[key]:.1f} ms "
+                                           f"({(stats[key] / old[key] - 1) * 100:+.0f}%)")
+            if load['requests_per_second'] < before_load['requests_per_second'] / (1 + threshold):
+                regressions.append(f"load throughput: {before_load['requests_per_second']:.2f} -> "
+                                   f"{load['requests_per_second']:.2f} requests/s")
+            if load['rss_mb']['peak'] > before_load['rss_mb']['peak'] * (1 + threshold):
+                regressions.append(f"load peak RSS: {before_load['rss_mb']['peak']:.0f} -> "
+                                   f"{load['rss_mb']['peak']:.0f} MB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Performance regression suite for stamp/detect/attack")
+    parser.add_argument('--simulation', action='store_true', help="run without the model even if it is present")
+    parser.add_argument('--sizes', nargs='+', choices=tuple(SIZES), default=list(SIZES),
+                        help="microbenchmark image sizes (default: all)")
+    parser.add_argument('--repeat', type=int, default=5, help="timed calls per microbenchmark (default: 5)")
+    parser.add_argument('--requests', type=int, default=120, help="load test requests (default: 120)")
+    parser.add_argument('--concurrency', type=int, default=8, help="concurrent load test clients (default: 8)")
+    parser.add_argument('--load-size', type=int, default=512, help="load test image side length (default: 512)")
+    parser.add_argument('--skip-micro', action='store_true')
+    parser.add_argument('--skip-load', action='store_true')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="stored baseline JSON")
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help="slowdown reported as a regression (default: 0.25 = 25%%)")
+    parser.add_argument('--save-baseline', action='store_true', help="store these results as the baseline")
+    parser.add_argument('--output', help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    # Before the app is imported: config is read at import time
+    if args.simulation:
+        os.environ['STEGASTAMP_MODEL_PATH'] = os.path.join(tempfile.gettempdir(), 'no-stegastamp-model')
+    os.environ['CACHE_ENABLED'] = 'false'
+
+    from backend.app.stegastamp import get_model_version, get_wrapper
+
+    wrapper = get_wrapper()
+    mode = 'model' if wrapper.model_loaded else 'simulation'
+    results = {
+        'meta': {
+            'commit': _git_commit(),
+            'mode': mode,
+            'model_version': get_model_version(),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+        },
+    }
+    print(f"Mode: {mode}")
+    if not args.skip_micro:
+        print(f"Microbenchmarks ({args.repeat} calls each):")
+        results['micro'] = run_micro(wrapper, args.sizes, args.repeat)
+    if not args.skip_load:
+        print(f"Load test: {args.requests} requests, {args.concurrency} concurrent, "
+              f"{args.load_size}x{args.load_size} images:")
+        results['load'] = run_load(args.requests, args.concurrency, args.load_size)
+
+    stored = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            stored = json.load(f)
+
+    status = 0
+    if args.save_baseline:
+        stored[mode] = results
+        with open(args.baseline, 'w') as f:
+            json.dump(stored, f, indent=2, sort_keys=True)
+        print(f"\nSaved as the {mode} baseline in {args.baseline}")
+    elif mode in stored:
+        baseline = stored[mode]
+        print(f"\nCompared with the {mode} baseline ({baseline['meta'].get('commit') or 'unknown commit'}, "
+              f"{baseline['meta'].get('cpus')} CPUs):")
+        regressions = compare(results, baseline, args.threshold)
+        for line in regressions:
+            print(f"  SLOWER {line}")
+        if regressions:
+            status = 1
+        else:
+            print(f"  nothing slower by more than {args.threshold * 100:.0f}%")
+    else:
+        print(f"\nNo {mode} baseline in {args.baseline}; run with --save-baseline to store one")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
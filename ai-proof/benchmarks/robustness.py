@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Robustness benchmark over an image corpus.
+
+Every image of a directory or tar/zip archive is stamped with each
+strength/adaptive setting and put through every predefined attack (and
+optionally the predefined chains); the unstamped originals go through
+the same attacks to measure false positives. Decoding and attacking run
+in a process pool, the encoder and decoder run batched in this process.
+
+Reported per setting and attack: detection rate, mean bit accuracy (share
+of decoded bits matching the embedded pattern; null in simulation mode)
+and mean confidence, plus the false-positive rate per attack and the
+throughput. Results are written as JSON with sorted keys, so two runs
+diff cleanly; --compare prints the changes against an earlier file.
+
+Usage:
+    python benchmarks/robustness.py CORPUS --output results.json
+    python benchmarks/robustness.py CORPUS --strengths 0.5 0.7 --adaptive off --chains --compare old.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from backend.app.attacks import attack_steps, get_predefined_attacks  # noqa: E402
+from backend.app.bulk import (  # noqa: E402
+    DECODER_SIZE, StageTimer, _batches, _bounded_map, attack_job, decode_job, iter_sources
+)
+
+# Name of the unattacked column in every matrix
+UNATTACKED = 'none'
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _setting_label(strength, adaptive):
+    return f"strength={strength:g},adaptive={str(adaptive).lower()}"
+
+
+class Tally:
+    """Running counts behind one matrix cell."""
+
+    def __init__(self):
+        self.count = 0
+        self.detected = 0
+        self.confidence = 0.0
+        self.bit_accuracy = 0.0
+        self.bit_count = 0
+
+    def add(self, detection):
+        self.count += 1
+        self.detected += detection['detected']
+        self.confidence += detection['confidence']
+        if detection.get('bit_stats'):
+            self.bit_accuracy += detection['bit_stats']['pattern_accuracy']
+            self.bit_count += 1
+
+    def rate(self):
+        return self.detected / self.count if self.count else None
+
+    def mean_confidence(self):
+        return self.confidence / self.count if self.count else None
+
+    def mean_bit_accuracy(self):
+        return self.bit_accuracy / self.bit_count if self.bit_count else None
+
+
+def run(args):
+    from backend.app.stegastamp import get_model_version, get_wrapper
+
+    attacks = [{'name': UNATTACKED, 'chain': None, 'type': None, 'severity': None}]
+    attacks += get_predefined_attacks(include_chains=args.chains)
+    names = [attack['name'] for attack in attacks]
+    chains = [()] + [attack_steps(attack) for attack in attacks[1:]]
+
+    adaptive_values = {'off': [False], 'on': [True], 'both': [False, True]}[args.adaptive]
+    settings = [(strength, adaptive) for strength in args.strengths for adaptive in adaptive_values]
+    labels = ['clean'] + [_setting_label(*setting) for setting in settings]
+    tallies = {label: {name: Tally() for name in names} for label in labels}
+
+    wrapper = get_wrapper()
+    timer = StageTimer()
+    counts = {'images': 0, 'failed': 0, 'attacked': 0}
+    batch = np.empty((len(chains), DECODER_SIZE, DECODER_SIZE, 3), dtype=np.float32)
+    started = time.perf_counter()
+
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=args.workers or os.cpu_count() or 1, mp_context=context) as pool:
+        window = (args.workers or os.cpu_count() or 1) * 2
+        sources = iter_sources(args.corpus)
+        if args.limit:
+            sources = (source for _, source in zip(range(args.limit), sources))
+        decoded = _bounded_map(pool, decode_job, sources, window=max(window, args.batch_size))
+
+        def jobs():
+            """Attack jobs: each image unstamped, then stamped with every setting."""
+            for group in _batches(decoded, args.batch_size):
+                images = []
+                for item in group:
+                    timer.add('read', item.get('read_seconds', 0.0))
+                    timer.add('decode', item['decode_seconds'])
+                    if item['error']:
+                        counts['failed'] += 1
+                        print(f"skipping {item['name']}: {item['error']}", file=sys.stderr)
+                    else:
+                        images.append(item)
+                if not images:
+                    continue
+                counts['images'] += len(images)
+
+                seeds = [zlib.crc32(item['name'].encode('utf-8')) for item in images]
+                for item, seed in zip(images, seeds):
+                    yield 'clean', item['image'], chains, seed
+                for (strength, adaptive), label in zip(settings, labels[1:]):
+                    start = time.perf_counter()
+                    stamped = wrapper.stamp_arrays(
+                        [item['image'] for item in images], strength=strength, adaptive=adaptive
+                    )
+                    timer.add('stamp', time.perf_counter() - start, len(images))
+                    for image, seed in zip(stamped, seeds):
+                        yield label, image, chains, seed
+
+        for result in _bounded_map(pool, attack_job, jobs(), window=window):
+            timer.add('attack', result['attack_seconds'], len(chains))
+            timer.add('preprocess', result['preprocess_seconds'], len(chains))
+
+            # Every attack of one image in one decoder call
+            start = time.perf_counter()
+            np.multiply(result['pixels'], np.float32(1.0 / 255.0), out=batch)
+            detections = wrapper.decode_normalized(batch, bit_stats=True)
+            timer.add('detect', time.perf_counter() - start, len(chains))
+
+            for name, detection in zip(names, detections):
+                tallies[result['key']][name].add(detection)
+            counts['attacked'] += len(chains) - 1
+
+    wall = time.perf_counter() - started
+    settings_labels = labels[1:]
+    return {
+        'meta': {
+            'commit': _git_commit(),
+            'model_version': get_model_version(),
+            'model_loaded': wrapper.model_loaded,
+            'corpus': os.path.abspath(args.corpus),
+            'images': counts['images'],
+            'failed': counts['failed'],
+            'settings': settings_labels,
+            'attacks': names,
+        },
+        'throughput': {
+            'seconds': wall,
+            'images_per_second': counts['images'] / wall if wall else 0.0,
+            'attacks_per_second': counts['attacked'] / wall if wall else 0.0,
+            'stages': timer.report(),
+        },
+        'detection_rate': {label: {n: tallies[label][n].rate() for n in names} for label in settings_labels},
+        'bit_accuracy': {
+            label: {n: tallies[label][n].mean_bit_accuracy() for n in names} for label in settings_labels
+        },
+        'confidence': {
+            label: {n: tallies[label][n].mean_confidence() for n in names} for label in settings_labels
+        },
+        'false_positive_rate': {n: tallies['clean'][n].rate() for n in names},
+        'clean_bit_accuracy': {n: tallies['clean'][n].mean_bit_accuracy() for n in names},
+    }
+
+
+def _cell(value):
+    return '     -' if value is None else f"{value * 100:5.1f}%"
+
+
+def print_results(results):
+    meta, throughput = results['meta'], results['throughput']
+    print(f"{meta['images']} images x {len(meta['settings'])} settings x {len(meta['attacks']) - 1} attacks "
+          f"in {throughput['seconds']:.1f}s: {throughput['images_per_second']:.2f} images/s, "
+          f"{throughput['attacks_per_second']:.1f} attacks/s"
+          f"{'' if meta['model_loaded'] else ' [simulation mode]'}")
+
+    width = max(len(name) for name in meta['attacks'])
+    for title, matrix in (('Detection rate', results['detection_rate']), ('Bit accuracy', results['bit_accuracy'])):
+        print(f"\n{title} (columns: settings {', '.join(f'{i}={s}' for i, s in enumerate(meta['settings']))})")
+        print(f"{'attack':<{width}} " + ' '.join(f"{i:>6}" for i in range(len(meta['settings'])))
+              + (f" {'FP':>6}" if title == 'Detection rate' else ''))
+        for name in meta['attacks']:
+            row = ' '.join(f"{_cell(matrix[label][name]):>6}" for label in meta['settings'])
+            if title == 'Detection rate':
+                row += f" {_cell(results['false_positive_rate'][name]):>6}"
+            print(f"{name:<{width}} {row}")
+
+
+def print_comparison(results, previous, threshold=0.01):
+    """Changes in detection rate, false positives and throughput against an earlier run."""
+    print(f"\nCompared with {previous['meta'].get('commit') or 'previous run'}:")
+    changes = 0
+    for label, row in results['detection_rate'].items():
+        for name, rate in row.items():
+            before = previous.get('detection_rate', {}).get(label, {}).get(name)
+            if rate is not None and before is not None and abs(rate - before) >= threshold:
+                print(f"  detection {label} {name}: {before * 100:.1f}% -> {rate * 100:.1f}%")
+                changes += 1
+    for name, rate in results['false_positive_rate'].items():
+        before = previous.get('false_positive_rate', {}).get(name)
+        if rate is not None and before is not None and abs(rate - before) >= threshold:
+            print(f"  false positives {name}: {before * 100:.1f}% -> {rate * 100:.1f}%")
+            changes += 1
+    if not changes:
+        print("  no detection or false-positive rate changed by 1 point or more")
+    for key in ('images_per_second', 'attacks_per_second'):
+        before = previous.get('throughput', {}).get(key)
+        if before:
+            now = results['throughput'][key]
+            print(f"  {key}: {before:.2f} -> {now:.2f} ({(now / before - 1) * 100:+.0f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Robustness benchmark over an image corpus")
+    parser.add_argument('corpus', help="directory, .tar(.gz/.bz2/.xz) or .zip of images")
+    parser.add_argument('--strengths', type=float, nargs='+', default=[0.4, 0.7, 1.0])
+    parser.add_argument('--adaptive', choices=('off', 'on', 'both'), default='both')
+    parser.add_argument('--chains', action='store_true', help="also run the predefined attack chains")
+    parser.add_argument('--limit', type=int, help="use only the first N images")
+    parser.add_argument('--workers', type=int, help="decode/attack processes (default: CPU count)")
+    parser.add_argument('--batch-size', type=int, default=16, help="images per encoder call (default: 16)")
+    parser.add_argument('--output', help="write results as JSON to this file")
+    parser.add_argument('--compare', help="earlier results JSON to compare against")
+    args = parser.parse_args()
+
+    results = run(args)
+    print_results(results)
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(results, json.load(f))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
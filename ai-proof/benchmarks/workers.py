@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Measure how throughput and memory scale with the number of worker processes.
+
+For each worker count the API is started under gunicorn
+(backend/gunicorn.conf.py), warmed up, and driven with concurrent
+stamp + detect requests. Memory is summed over the whole process tree
+(master, workers and the model server): RSS counts shared pages once per
+process, PSS splits them between the processes sharing them, so PSS is
+the figure to compare.
+
+Usage:
+    python benchmarks/workers.py --workers 1 2 4 8 --requests 200 --clients 16
+"""
+
+import argparse
+import io
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+import requests
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _children(pid):
+    """All descendant PIDs of a process (Linux /proc)."""
+    parents = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # Field 4 is the parent PID; the command name may contain spaces
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        parents.setdefault(ppid, []).append(int(entry))
+
+    found, stack = [], [pid]
+    while stack:
+        for child in parents.get(stack.pop(), []):
+            found.append(child)
+            stack.append(child)
+    return found
+
+
+def _memory_kb(pid, field):
+    """Read a field (e.g. 'Rss', 'Pss') from /proc/<pid>/smaps_rollup."""
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def tree_memory_mb(pid):
+    """Total RSS and PSS of a process and its descendants, in MB."""
+    pids = [pid] + _children(pid)
+    return {
+        'processes': len(pids),
+        'rss_mb': sum(_memory_kb(p, 'Rss') for p in pids) / 1024.0,
+        'pss_mb': sum(_memory_kb(p, 'Pss') for p in pids) / 1024.0,
+    }
+
+
+def make_png(size, seed):
+    rng = np.random.default_rng(seed)
+    buffer = io.BytesIO()
+    Image.fromarray(rng.integers(0, 256, (size, size, 3), dtype=np.uint8)).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def wait_ready(base_url, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f"{base_url}/api/health", timeout=2).status_code == 200:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    return False
+
+
+def drive(base_url, images, total, clients):
+    """Send stamp + detect pairs from concurrent clients; returns requests/s and error count."""
+    remaining = [total]
+    errors = [0]
+    lock = threading.Lock()
+
+    def client(index):
+        session = requests.Session()
+        png = images[index % len(images)]
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+                n = remaining[0]
+            endpoint = '/api/stamp' if n % 2 else '/api/detect'
+            response = session.post(f"{base_url}{endpoint}", files={'file': ('bench.png', png, 'image/png')})
+            if response.status_code != 200:
+                with lock:
+                    errors[0] += 1
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+    return total / wall if wall else 0.0, errors[0]
+
+
+def run(workers, args):
+    port = args.port
+    env = {
+        **os.environ,
+        'WEB_CONCURRENCY': str(workers),
+        'API_HOST': '127.0.0.1',
+        'API_PORT': str(port),
+        # Every request must do real work
+        'CACHE_ENABLED': 'false',
+        'TF_CPP_MIN_LOG_LEVEL': '3',
+    }
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'backend/gunicorn.conf.py', 'backend.app.main:app'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        if not wait_ready(base_url, args.startup_timeout):
+            raise SystemExit(f"Server with {workers} workers did not become ready")
+        idle = tree_memory_mb(server.pid)
+
+        images = [make_png(args.image_size, seed) for seed in range(args.clients)]
+        # Every worker should be warm and have its connections open
+        drive(base_url, images, workers * 4, args.clients)
+        throughput, errors = drive(base_url, images, args.requests, args.clients)
+        loaded = tree_memory_mb(server.pid)
+    finally:
+        server.send_signal(signal.SIGTERM)
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+    return {
+        'workers': workers,
+        'throughput_rps': throughput,
+        'errors': errors,
+        'idle': idle,
+        'loaded': loaded,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark multi-process worker scaling")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--requests', type=int, default=100, help="requests per worker count")
+    parser.add_argument('--clients', type=int, default=16, help="concurrent client threads")
+    parser.add_argument('--image-size', type=int, default=1024)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--startup-timeout', type=float, default=300.0)
+    parser.add_argument('--output', help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    results = []
+    for workers in args.workers:
+        result = run(workers, args)
+        results.append(result)
+        print(f"workers={workers:<3} {result['throughput_rps']:8.2f} req/s  "
+              f"errors {result['errors']:<4} "
+              f"RSS {result['loaded']['rss_mb']:8.1f} MB  PSS {result['loaded']['pss_mb']:8.1f} MB  "
+              f"({result['loaded']['processes']} processes)")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'cpu_count': os.cpu_count(), 'results': results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -59,7 +59,7 @@ export default function DetectPage() {
         const apiUrl = typeof window !== 'undefined'
           ? `http://${window.location.hostname}:8000`
           : process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000';
-      const response = await fetch(`${apiUrl}/api/detect`, {
+      const response = await fetch(`${apiUrl}/api/detect?heatmap=true`, {
         method: 'POST',
         body: formData,
       });
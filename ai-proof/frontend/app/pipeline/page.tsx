@@ -93,70 +93,32 @@ export default function PipelinePage() {
       const formData = new FormData();
       formData.append('file', file);
 
-      // Call /api/stamp to add watermark with strength and adaptive settings
-      const stampResponse = await fetch(
-        `${apiUrl}/api/stamp?strength=${strength}&adaptive=${adaptive}`,
+      // Call /api/pipeline once: it stamps with the chosen settings, runs every
+      // predefined attack server-side and decodes all variants in one batch
+      setCurrentAttack(`Running ${predefinedAttacks.length || 'all'} attacks...`);
+
+      const pipelineResponse = await fetch(
+        `${apiUrl}/api/pipeline?stamp=true&include_stamped=true&strength=${strength}&adaptive=${adaptive}`,
         {
           method: 'POST',
           body: formData,
         }
       );
 
-      if (!stampResponse.ok) {
-        throw new Error('Failed to stamp image');
+      if (!pipelineResponse.ok) {
+        throw new Error('Failed to run attack pipeline');
       }
 
-      const stampData = await stampResponse.json();
-      setStampedImage(`data:image/png;base64,${stampData.stamped_image}`);
-
-      // Now run attacks on the stamped image
-      setCurrentAttack('Running attacks...');
-
-      const results: AttackResult[] = [];
-
-      for (const attack of predefinedAttacks) {
-        setCurrentAttack(`Running: ${attack.name}...`);
-
-        try {
-          // Convert base64 stamped image back to file for attack
-          const response = await fetch(`data:image/png;base64,${stampData.stamped_image}`);
-          const blob = await response.blob();
-          const attackFormData = new FormData();
-          attackFormData.append('file', blob, 'stamped.png');
-
-          // Call /api/attack
-          const attackResponse = await fetch(
-            `${apiUrl}/api/attack?attack_type=${attack.type}&severity=${attack.severity}`,
-            {
-              method: 'POST',
-              body: attackFormData,
-            }
-          );
-
-          if (!attackResponse.ok) {
-            throw new Error(`Attack failed: ${attack.name}`);
-          }
-
-          const attackData = await attackResponse.json();
-
-          results.push({
-            name: attack.name,
-            type: attack.type,
-            severity: attack.severity,
-            detected: attackData.detected,
-            confidence: attackData.confidence,
-          });
-        } catch (err) {
-          console.error(`Error running attack ${attack.name}:`, err);
-          results.push({
-            name: attack.name,
-            type: attack.type,
-            severity: attack.severity,
-            detected: false,
-            confidence: 0,
-          });
-        }
-      }
+      const pipelineData = await pipelineResponse.json();
+      setStampedImage(`data:image/png;base64,${pipelineData.stamped_image}`);
+
+      const results: AttackResult[] = pipelineData.results.map((r: AttackResult) => ({
+        name: r.name,
+        type: r.type,
+        severity: r.severity,
+        detected: r.detected,
+        confidence: r.confidence,
+      }));
 
       setAttackResults(results);
       setCurrentAttack('');
@@ -6,7 +6,6 @@ Test the full attack pipeline with all 20 attacks
 import requests
 import io
 from PIL import Image
-import base64
 import time
 
 # Create a simple test image
@@ -40,59 +39,31 @@ def test_full_pipeline():
         print(f"   ✗ Error: {e}")
         return
     
-    # Step 3: Stamp the image
-    print("\n3. Stamping image with watermark...")
+    # Step 3: Stamp and attack in a single request
+    print("\n3. Stamping image and running all attacks (/api/pipeline)...")
+    print("-" * 70)
     test_image.seek(0)
     files = {'file': ('test.png', test_image, 'image/png')}
     try:
-        response = requests.post(f"{BASE_URL}/api/stamp", files=files)
-        stamp_data = response.json()
-        print(f"   ✓ Image stamped successfully")
+        start = time.time()
+        response = requests.post(
+            f"{BASE_URL}/api/pipeline",
+            files=files,
+            params={'stamp': 'true'}
+        )
+        elapsed = time.time() - start
+        data = response.json()
+        print(f"   ✓ Pipeline finished in {elapsed:.2f}s")
+        print(f"   Baseline (no attack): conf {data['baseline']['confidence']:.2f}")
     except Exception as e:
         print(f"   ✗ Error: {e}")
         return
     
-    # Step 4: Run all attacks
-    print("\n4. Running all attacks on stamped image...")
-    print("-" * 70)
-    
-    stamped_b64 = stamp_data['stamped_image']
-    stamped_bytes = base64.b64decode(stamped_b64)
-    
-    results = []
-    
-    for i, attack in enumerate(attacks, 1):
-        try:
-            stamped_image = io.BytesIO(stamped_bytes)
-            files = {'file': ('stamped.png', stamped_image, 'image/png')}
-            params = {
-                'attack_type': attack['type'],
-                'severity': attack['severity']
-            }
-            
-            response = requests.post(
-                f"{BASE_URL}/api/attack",
-                files=files,
-                params=params
-            )
-            
-            data = response.json()
-            detected = data.get('detected', False)
-            confidence = data.get('confidence', 0)
-            
-            results.append({
-                'name': attack['name'],
-                'type': attack['type'],
-                'severity': attack['severity'],
-                'detected': detected,
-                'confidence': confidence
-            })
-            
-            status = "✓" if detected else "✗"
-            print(f"  {i:2d}. {attack['name']:20} {status} conf: {confidence:.2f}")
-            
-        except Exception as e:
-            print(f"  {i:2d}. {attack['name']:20} ✗ Error: {str(e)[:40]}")
+    # Step 4: Per-attack results
+    results = data['results']
+    for i, r in enumerate(results, 1):
+        status = "✓" if r['detected'] else "✗"
+        print(f"  {i:2d}. {r['name']:20} {status} conf: {r['confidence']:.2f}")
     
     # Step 5: Summary
     print("-" * 70)